@@ -1,8 +1,19 @@
-from flask import Flask, request, jsonify, abort
+import hashlib
+import os
+
+from flask import Flask, request, jsonify, abort, json
+
+from greetings_store import create_store
+from locales import LocaleResolver
 
 app = Flask(__name__)
+# 'memory' for a single process, 'sqlite' to share greetings between workers
+app.config['GREETINGS_STORE'] = os.environ.get('GREETINGS_STORE', 'memory')
+app.config['GREETINGS_DB'] = os.environ.get('GREETINGS_DB', 'greetings.db')
+# Served when nothing in Accept-Language matches a stored greeting
+app.config['GREETINGS_DEFAULT_LANG'] = os.environ.get('GREETINGS_DEFAULT_LANG', 'en')
 
-greetings = {
+initial_greetings = {
             'en': 'hello', 
             'es': 'Hola', 
             'ar': 'مرحبا',
@@ -12,22 +23,110 @@ greetings = {
             'ja': 'こんにちは'
             }
 
+store = create_store(app.config, initial_greetings)
+
+locales = LocaleResolver(store, app.config['GREETINGS_DEFAULT_LANG'])
+
+MAX_BATCH = 1000
+
+# (store version, JSON body, ETag) of the last encoded GET /greeting
+encoded_greetings = (None, None, None)
+
+'''
+encode_greetings()
+    the GET /greeting body and its ETag, encoded again only when the store
+    version has moved since the last call
+'''
+def encode_greetings():
+    global encoded_greetings
+    version, greetings = store.snapshot()
+    if(encoded_greetings[0] != version):
+        body = (json.dumps({'greetings': greetings}) + '\n').encode('utf-8')
+        encoded_greetings = (version, body, hashlib.sha1(body).hexdigest())
+    return encoded_greetings
+
+'''
+GET /greeting
+    every greeting, or with ?lang=en,es,ja only those languages, plus the
+    list of requested languages that have no greeting. Each requested tag
+    falls back like GET /greeting/<lang> and keys its greeting as requested
+'''
 @app.route('/greeting', methods=['GET'])
 def greeting_all():
-    return jsonify({'greetings': greetings})
+    if('lang' in request.args):
+        return greeting_some(request.args['lang'].split(','))
+    _, body, etag = encode_greetings()
+    if(etag in request.if_none_match):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
 
+def greeting_some(langs):
+    langs = [lang.strip() for lang in langs if lang.strip()]
+    if(not langs):
+        abort(422)
+    resolved = {lang: locales.resolve(lang) for lang in langs}
+    # Read after resolving, so every resolved language is in the snapshot
+    greetings = store.snapshot()[1]
+    return jsonify({
+        'greetings': {lang: greetings[resolved[lang]] for lang in langs if resolved[lang] in greetings},
+        'missing': [lang for lang in langs if resolved[lang] not in greetings]
+    })
+
+'''
+GET /greeting/negotiate
+    the greeting in the language that best matches the Accept-Language
+    header, falling back to GREETINGS_DEFAULT_LANG
+'''
+@app.route('/greeting/negotiate', methods=['GET'])
+def greeting_negotiate():
+    lang = locales.negotiate(request.headers.get('Accept-Language'))
+    response = greeting_response(lang)
+    response.vary.add('Accept-Language')
+    return response
+
+'''
+GET /greeting/<lang>
+    the greeting for lang, or for the nearest stored language (en-US falls
+    back to en, pt to pt-BR)
+'''
 @app.route('/greeting/<lang>', methods=['GET'])
 def greeting_one(lang):
-    print(lang)
-    if(lang not in greetings):
+    return greeting_response(locales.resolve(lang))
+
+def greeting_response(lang):
+    greeting = store.get(lang) if lang is not None else None
+    if(greeting is None):
         abort(404)
-    return jsonify({'greeting': greetings[lang
-    ]})
+    response = jsonify({'greeting': greeting, 'lang': lang})
+    response.headers['Content-Language'] = lang
+    return response
 
+'''
+POST /greeting
+    adds or replaces one greeting, {"lang": "de", "greeting": "Hallo"}, or
+    many at once, {"greetings": {"de": "Hallo", "it": "Ciao"}}. A batch is
+    checked as a whole before anything is stored, then stored atomically.
+    Responds with every greeting, or with only the posted ones when called
+    with ?response=changed
+'''
 @app.route('/greeting', methods=['POST'])
 def greeting_add():
     info = request.get_json()
-    if('lang' not in info or 'greeting' not in info):
+    if(isinstance(info, dict) and 'greetings' in info):
+        posted = info['greetings']
+    elif(isinstance(info, dict) and 'lang' in info and 'greeting' in info):
+        posted = {info['lang']: info['greeting']}
+    else:
+        abort(422)
+    if(not isinstance(posted, dict) or not posted or len(posted) > MAX_BATCH):
+        abort(422)
+    if(not all(isinstance(lang, str) and lang and isinstance(greeting, str)
+               for lang, greeting in posted.items())):
         abort(422)
-    greetings[info['lang']] = info['greeting']
-    return jsonify({'greetings':greetings})
+    store.update(posted)
+    if(request.args.get('response') == 'changed'):
+        return jsonify({'greeting': posted})
+    return jsonify({'greetings': store.snapshot()[1]})
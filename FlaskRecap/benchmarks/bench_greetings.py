@@ -0,0 +1,62 @@
+'''
+Throughput of GET /greeting on the pre-encoded path (body and ETag encoded
+once per store version) against the previous path, which jsonified the
+whole dict on every request and is re-registered here under /legacy. A
+third case revalidates with If-None-Match and is answered 304.
+
+    python benchmarks/bench_greetings.py --requests 5000
+    python benchmarks/bench_greetings.py --languages 500 --store sqlite
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run(client, path, headers, total):
+    started = time.perf_counter()
+    for _ in range(total):
+        response = client.get(path, headers=headers)
+        assert response.status_code in (200, 304), response.status_code
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--store', choices=['memory', 'sqlite'], default='memory')
+    parser.add_argument('--languages', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['GREETINGS_STORE'] = args.store
+    os.environ['GREETINGS_DB'] = os.path.join(tmp.name, 'greetings.db')
+    from FlaskRecap import app, store
+    from flask import jsonify
+
+    @app.route('/legacy/greeting', methods=['GET'])
+    def legacy_greeting_all():
+        return jsonify({'greetings': store.snapshot()[1]})
+
+    for i in range(args.languages):
+        store.set(f'x{i}', f'greeting number {i}')
+    client = app.test_client()
+    etag = client.get('/greeting').headers['ETag']
+    print(f'{args.requests} requests per case, {len(store.snapshot()[1])} greetings, {args.store} store')
+
+    cases = [
+        ('legacy jsonify', '/legacy/greeting', {}),
+        ('pre-encoded', '/greeting', {}),
+        ('304 revalidate', '/greeting', {'If-None-Match': etag}),
+    ]
+    for label, path, headers in cases:
+        elapsed = run(client, path, headers, args.requests)
+        print(f'{label:16} {args.requests / elapsed:10.0f} req/s  {elapsed / args.requests * 1e6:8.1f} us/req')
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
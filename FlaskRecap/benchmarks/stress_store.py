@@ -0,0 +1,132 @@
+'''
+Concurrency stress test for the greetings stores.
+
+Writer threads (and, for SQLite, writer processes) each set their own keys
+many times over while reader threads take snapshots and a batch writer
+updates ten keys at a time. At the end every writer's last value must be
+stored, and every snapshot a reader saw must be internally consistent: one
+version, one set of data, never half a batch. With writer processes alone,
+the version must also have grown by exactly the number of writes that
+changed something.
+
+    python benchmarks/stress_store.py --threads 8 --writes 500
+    python benchmarks/stress_store.py --store sqlite --processes 4
+'''
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from greetings_store import MemoryStore, SQLiteStore
+
+
+def writer(store, name, writes):
+    changed = 0
+    for i in range(writes):
+        changed += store.set(f'{name}-{i % 10}', f'{name} {i}')
+        # Repeating the same value must not bump the version
+        store.set(f'{name}-{i % 10}', f'{name} {i}')
+    return changed
+
+
+def batch_writer(store, stop):
+    i = 0
+    while not stop.is_set():
+        store.update({f'batch-{k}': f'batch {i}' for k in range(10)})
+        i += 1
+
+
+def reader(store, stop, errors):
+    seen = {}
+    while not stop.is_set():
+        version, greetings = store.snapshot()
+        if version in seen and seen[version] != greetings:
+            errors.append(f'version {version} served two different snapshots')
+        if len({greetings.get(f'batch-{k}') for k in range(10)}) > 1:
+            errors.append(f'version {version} holds half a batch')
+        seen[version] = dict(greetings)
+
+
+def process_writer(path, name, writes, results):
+    results.put(writer(SQLiteStore(path), name, writes))
+
+
+def check(store, names, writes, changed=None, start_version=None):
+    version, greetings = store.snapshot()
+    for name in names:
+        for i in range(writes - 10, writes):
+            expected = f'{name} {i}'
+            actual = greetings.get(f'{name}-{i % 10}')
+            assert actual == expected, f'lost write: {name}-{i % 10} is {actual!r}, expected {expected!r}'
+    if changed is not None:
+        assert version - start_version == changed, f'version grew by {version - start_version}, expected {changed}'
+
+
+def run_threads(store, threads, readers, writes):
+    stop, errors, changed = threading.Event(), [], []
+    store.update({f'batch-{k}': 'batch' for k in range(10)})
+    batches = threading.Thread(target=batch_writer, args=(store, stop))
+    batches.start()
+    names = [f't{i}' for i in range(threads)]
+    workers = [threading.Thread(target=lambda name=name: changed.append(writer(store, name, writes))) for name in names]
+    watchers = [threading.Thread(target=reader, args=(store, stop, errors)) for _ in range(readers)]
+    started = time.perf_counter()
+    for thread in watchers + workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in watchers + [batches]:
+        thread.join()
+    assert not errors, errors[0]
+    check(store, names, writes)
+    return elapsed, threads * writes * 2
+
+
+def run_processes(path, processes, writes):
+    store = SQLiteStore(path)
+    start_version = store.snapshot()[0]
+    results = multiprocessing.Queue()
+    names = [f'p{i}' for i in range(processes)]
+    workers = [multiprocessing.Process(target=process_writer, args=(path, name, writes, results)) for name in names]
+    started = time.perf_counter()
+    for process in workers:
+        process.start()
+    changed = sum(results.get() for _ in workers)
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - started
+    check(store, names, writes, changed, start_version)
+    return elapsed, processes * writes * 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--store', choices=['memory', 'sqlite', 'both'], default='both')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=500)
+    args = parser.parse_args()
+
+    initial = {'en': 'hello', 'es': 'Hola'}
+    if args.store in ('memory', 'both'):
+        elapsed, calls = run_threads(MemoryStore(initial), args.threads, args.readers, args.writes)
+        print(f'memory  {args.threads} threads        {calls:7d} sets  {calls / elapsed:10.0f} sets/s  ok')
+    if args.store in ('sqlite', 'both'):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'greetings.db')
+            elapsed, calls = run_threads(SQLiteStore(path, initial), args.threads, args.readers, args.writes)
+            print(f'sqlite  {args.threads} threads        {calls:7d} sets  {calls / elapsed:10.0f} sets/s  ok')
+            elapsed, calls = run_processes(path, args.processes, args.writes)
+            print(f'sqlite  {args.processes} processes      {calls:7d} sets  {calls / elapsed:10.0f} sets/s  ok')
+
+
+if __name__ == '__main__':
+    main()
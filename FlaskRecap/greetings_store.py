@@ -0,0 +1,126 @@
+'''
+Greetings storage for FlaskRecap.
+
+Both stores keep a version number that changes with every write, and hand
+out consistent (version, greetings) snapshots. Snapshots are shared, so
+callers must treat them as read-only.
+
+MemoryStore  a dict behind a lock, for a single server process.
+SQLiteStore  a SQLite file shared by every worker process. Reads are served
+             from an in-process copy, reloaded only when the version row
+             shows another writer changed the data.
+'''
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class MemoryStore:
+    def __init__(self, initial=None):
+        self._lock = threading.Lock()
+        self._greetings = dict(initial or {})
+        self._version = 1
+
+    def snapshot(self):
+        with self._lock:
+            return self._version, self._greetings
+
+    def get(self, lang):
+        return self.snapshot()[1].get(lang)
+
+    '''
+    set(lang, greeting)
+        stores the greeting, returning whether anything changed
+    update(greetings)
+        stores every greeting of a {lang: greeting} dict at once, as a single
+        new version, returning how many of them changed
+    '''
+    def set(self, lang, greeting):
+        return self.update({lang: greeting}) > 0
+
+    def update(self, greetings):
+        with self._lock:
+            changed = {lang: greeting for lang, greeting in greetings.items()
+                       if self._greetings.get(lang) != greeting}
+            if not changed:
+                return 0
+            # Copy on write, so snapshots handed out earlier never change
+            merged = dict(self._greetings)
+            merged.update(changed)
+            self._greetings = merged
+            self._version += 1
+            return len(changed)
+
+
+class SQLiteStore:
+    def __init__(self, path, initial=None):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cache = (None, {})
+
+        with self._transaction('BEGIN IMMEDIATE') as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS greetings (lang TEXT PRIMARY KEY, greeting TEXT NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS greetings_version (id INTEGER PRIMARY KEY, version INTEGER NOT NULL)')
+            # Only the first worker to start seeds the table
+            if conn.execute('INSERT OR IGNORE INTO greetings_version VALUES (1, 1)').rowcount:
+                conn.executemany('INSERT OR IGNORE INTO greetings VALUES (?, ?)', (initial or {}).items())
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        return conn
+
+    @contextmanager
+    def _transaction(self, begin='BEGIN'):
+        conn = self._connect()
+        conn.execute(begin)
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _version(self, conn):
+        return conn.execute('SELECT version FROM greetings_version WHERE id = 1').fetchone()[0]
+
+    def snapshot(self):
+        cached = self._cache
+        if cached[0] == self._version(self._connect()):
+            return cached
+        # One read transaction, so the rows match the version
+        with self._transaction() as conn:
+            version = self._version(conn)
+            greetings = dict(conn.execute('SELECT lang, greeting FROM greetings'))
+        with self._lock:
+            if self._cache[0] is None or self._cache[0] < version:
+                self._cache = (version, greetings)
+        return version, greetings
+
+    def get(self, lang):
+        return self.snapshot()[1].get(lang)
+
+    def set(self, lang, greeting):
+        return self.update({lang: greeting}) > 0
+
+    def update(self, greetings):
+        # IMMEDIATE takes the write lock up front, so concurrent workers
+        # serialize on the read-compare-write
+        with self._transaction('BEGIN IMMEDIATE') as conn:
+            before = conn.total_changes
+            # Rows whose greeting is already stored are left alone
+            conn.executemany('INSERT INTO greetings VALUES (?, ?) ON CONFLICT (lang) '
+                             'DO UPDATE SET greeting = excluded.greeting WHERE greeting != excluded.greeting',
+                             greetings.items())
+            changed = conn.total_changes - before
+            if changed:
+                conn.execute('UPDATE greetings_version SET version = version + 1 WHERE id = 1')
+        return changed
+
+
+def create_store(config, initial=None):
+    if config.get('GREETINGS_STORE') == 'sqlite':
+        return SQLiteStore(config['GREETINGS_DB'], initial)
+    return MemoryStore(initial)
@@ -0,0 +1,115 @@
+'''
+Locale negotiation for FlaskRecap.
+
+A language tag resolves to a stored greeting by dropping subtags from the
+right until one matches: en-US falls back to en, zh-Hant-TW to zh-Hant and
+then zh. A bare language also matches a stored regional variant, so pt
+finds pt-BR when there is no pt. The table behind this is computed once
+per store version, from the stored languages.
+
+Accept-Language headers are parsed and resolved once per distinct header
+value; the results are kept in a bounded LRU that is dropped with the
+table when the greetings change.
+'''
+import functools
+
+# Entries past this in a single header are ignored
+MAX_LANGUAGE_RANGES = 32
+# Headers longer than this are negotiated without being memoized
+MAX_MEMO_HEADER = 512
+
+
+def normalize(tag):
+    return tag.strip().replace('_', '-').lower()
+
+
+'''
+parse_accept_language(header)
+    the language ranges of an Accept-Language header, most preferred first.
+    Ranges with q=0 or a malformed q are dropped; ties keep header order
+'''
+def parse_accept_language(header):
+    ranges = []
+    for item in header.split(',')[:MAX_LANGUAGE_RANGES]:
+        tag, _, params = item.partition(';')
+        tag = normalize(tag)
+        quality = 1.0
+        params = params.strip()
+        if params:
+            name, _, value = params.partition('=')
+            try:
+                quality = float(value) if name.strip() == 'q' else quality
+            except ValueError:
+                continue
+        if tag and 0 < quality <= 1:
+            ranges.append((quality, tag))
+    ranges.sort(key=lambda range_: -range_[0])
+    return [tag for _, tag in ranges]
+
+
+'''
+resolution_table(langs)
+    {normalized tag: stored language} for every stored language and every
+    prefix of one. Exact tags win, then the shortest stored tag sharing the
+    prefix (pt before pt-BR), then alphabetical order
+'''
+def resolution_table(langs):
+    table = {}
+    for lang in sorted(langs, key=lambda lang: (normalize(lang).count('-'), lang)):
+        subtags = normalize(lang).split('-')
+        table[normalize(lang)] = lang
+        for end in range(len(subtags) - 1, 0, -1):
+            table.setdefault('-'.join(subtags[:end]), lang)
+    return table
+
+
+def resolve(table, tag):
+    subtags = normalize(tag).split('-')
+    for end in range(len(subtags), 0, -1):
+        lang = table.get('-'.join(subtags[:end]))
+        if lang is not None:
+            return lang
+    return None
+
+
+class LocaleResolver:
+    def __init__(self, store, default, cache_size=1024):
+        self.store = store
+        self.default = default
+        self.cache_size = cache_size
+        # (store version, resolution table, memoized negotiate)
+        self._state = (None, {}, None)
+
+    def _current(self):
+        version, greetings = self.store.snapshot()
+        state = self._state
+        if state[0] != version:
+            table = resolution_table(greetings)
+            negotiate = functools.partial(self._negotiate, table, greetings)
+            state = self._state = (version, table, functools.lru_cache(self.cache_size)(negotiate))
+        return state
+
+    def resolve(self, tag):
+        return resolve(self._current()[1], tag)
+
+    '''
+    negotiate(header)
+        the stored language that best matches an Accept-Language header,
+        the default language when nothing matches, or None when the default
+        has no greeting either
+    '''
+    def negotiate(self, header):
+        _, table, memoized = self._current()
+        header = header or ''
+        if len(header) > MAX_MEMO_HEADER:
+            return memoized.__wrapped__(header)
+        return memoized(header)
+
+    def _negotiate(self, table, greetings, header):
+        for tag in parse_accept_language(header):
+            if tag == '*':
+                break
+            lang = resolve(table, tag)
+            if lang is not None:
+                return lang
+        return self.default if self.default in greetings else None
@@ -3,30 +3,92 @@
 #----------------------------------------------------------------------------#
 
 import json
+from itertools import groupby
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from datetime import datetime, timedelta
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, session, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from forms import DEFAULT_SHOW_MINUTES, MAX_SHOW_MINUTES
+import config
+from fragment_cache import create_fragment_cache
+from query_stats import init_query_stats
+from job_queue import init_job_queue, QueueFull
+from geo import grid_cell, cell_ranges, distance_km
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
 app = Flask(__name__)
 moment = Moment(app)
-app.config.from_object('config')
+app.config.from_object(config.Config())
 db = SQLAlchemy(app)
-
-# TODO: connect to a local postgresql database
+fragment_cache = create_fragment_cache(app.config)
+init_query_stats(app)
+jobs = init_job_queue(app)
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+venue_genres = db.Table('venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True, index=True)
+)
+
+artist_genres = db.Table('artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id'), primary_key=True, index=True)
+)
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+    # Cached facet counts, kept in step with the association tables by
+    # update_genre_index() so listing them never scans Venue or Artist.
+    venue_count = db.Column(db.Integer, nullable=False, default=0)
+    artist_count = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def seed(cls):
+        # Populates the genre table from the choices offered by VenueForm/ArtistForm
+        existing = {name for (name,) in db.session.query(cls.name)}
+        for name, _ in GENRE_CHOICES:
+            if name not in existing:
+                db.session.add(cls(name=name, venue_count=0, artist_count=0))
+        db.session.commit()
+
+    @classmethod
+    def get_or_create_all(cls, names):
+        genres = cls.query.filter(cls.name.in_(names)).all() if names else []
+        missing = set(names) - {genre.name for genre in genres}
+        for name in missing:
+            genre = cls(name=name, venue_count=0, artist_count=0)
+            db.session.add(genre)
+            genres.append(genre)
+        return genres
+
+    @classmethod
+    def rebuild_counts(cls):
+        # Recomputes the cached counts from the association tables in two
+        # grouped queries; only needed after out-of-band changes to the data.
+        venue_counts = dict(db.session.query(venue_genres.c.genre_id, db.func.count())
+                            .group_by(venue_genres.c.genre_id))
+        artist_counts = dict(db.session.query(artist_genres.c.genre_id, db.func.count())
+                             .group_by(artist_genres.c.genre_id))
+        for genre in cls.query.all():
+            genre.venue_count = venue_counts.get(genre.id, 0)
+            genre.artist_count = artist_counts.get(genre.id, 0)
+        db.session.commit()
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
 
@@ -38,9 +100,20 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name')
+    # Filled in from a gazetteer by geocode.py. geo_cell is the grid cell of
+    # the coordinates (see geo.py), which /venues/nearby searches by.
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geo_cell = db.Column(db.Integer, index=True)
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
+    def locate(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.geo_cell = grid_cell(latitude, longitude)
+
 class Artist(db.Model):
     __tablename__ = 'Artist'
 
@@ -49,13 +122,132 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name')
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+def update_genre_index(entity, names):
+    '''
+    Sets the genres of a Venue or Artist and adjusts the cached per-genre counts
+    by the difference between the old and the new set, within the caller's
+    transaction. Raises ValueError for genres outside GENRE_CHOICES.
+    '''
+    names = set(names)
+    unknown = names - {name for name, _ in GENRE_CHOICES}
+    if unknown:
+        raise ValueError('unknown genres: ' + ', '.join(sorted(unknown)))
+
+    counter = 'venue_count' if isinstance(entity, Venue) else 'artist_count'
+    column = getattr(Genre, counter)
+    old_genres = set(entity.genres)
+    new_genres = set(Genre.get_or_create_all(names))
+    # Persistent rows get an in-place "count = count + 1" UPDATE so concurrent
+    # submissions cannot lose increments; freshly created rows start at 1.
+    for genre in new_genres - old_genres:
+        setattr(genre, counter, 1 if genre.id is None else column + 1)
+    for genre in old_genres - new_genres:
+        setattr(genre, counter, column - 1)
+    entity.genres = sorted(new_genres, key=lambda genre: genre.name)
+
+MAX_SHOW_DURATION = timedelta(minutes=MAX_SHOW_MINUTES)
+
+def default_end_time(context):
+    # Rows inserted without an end time, e.g. by older scripts, get the default length
+    return context.get_current_parameters()['start_time'] + timedelta(minutes=DEFAULT_SHOW_MINUTES)
+
+class Show(db.Model):
+    __tablename__ = 'Show'
+    # (venue_id, start_time) and (artist_id, start_time) let the overlap
+    # queries below read one venue's or artist's shows in time order, from
+    # MAX_SHOW_DURATION before the interval they check.
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    # Exclusive: a show may start at the minute the previous one ends
+    end_time = db.Column(db.DateTime, nullable=False, default=default_end_time)
+
+    venue = db.relationship('Venue', backref=db.backref('shows', cascade='all, delete-orphan'))
+    artist = db.relationship('Artist', backref=db.backref('shows', cascade='all, delete-orphan'))
+
+# On Postgres the database itself refuses overlapping shows for a venue or an
+# artist, which also covers two submissions racing past find_show_conflicts()
+for column in ('venue_id', 'artist_id'):
+    db.event.listen(Show.__table__, 'after_create', db.DDL(
+        'CREATE EXTENSION IF NOT EXISTS btree_gist; '
+        f'ALTER TABLE "Show" ADD CONSTRAINT "Show_{column}_no_overlap" '
+        f'EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)'
+    ).execute_if(dialect='postgresql'))
+
+# SQLSTATE of an exclusion constraint violation
+EXCLUSION_VIOLATION = '23P01'
+
+def overlapping_shows(start_time, end_time):
+    '''
+    Filter for shows overlapping [start_time, end_time). No show runs longer
+    than MAX_SHOW_DURATION, so the lower bound on start_time keeps the index
+    scan to the shows that can overlap instead of everything before end_time.
+    '''
+    return db.and_(Show.start_time > start_time - MAX_SHOW_DURATION,
+                   Show.start_time < end_time,
+                   Show.end_time > start_time)
+
+def find_show_conflicts(venue_id, artist_id, start_time, end_time):
+    '''
+    Shows at the venue or by the artist that overlap [start_time, end_time),
+    in time order. Runs inside the caller's transaction.
+    '''
+    overlaps = overlapping_shows(start_time, end_time)
+    at_venue = Show.query.filter(Show.venue_id == venue_id, overlaps)
+    by_artist = Show.query.filter(Show.artist_id == artist_id, overlaps)
+    return at_venue.union(by_artist).order_by(Show.start_time).all()
+
+def parse_show_time(value):
+    '''
+    Parses an ISO 8601 time into the naive server-local time that Show
+    stores and datetime.now() returns. A time with a UTC offset is converted
+    to local time first; a time without one is taken as local already.
+    '''
+    time = dateutil.parser.parse(value)
+    if time.tzinfo is not None:
+        time = time.astimezone().replace(tzinfo=None)
+    return time
+
+# Keeps each IN (...) list well below the bound-parameter limits of the drivers
+DELETE_BATCH_SIZE = 500
+
+def delete_venues(venue_ids):
+    '''
+    Deletes the given venues together with their shows and genre links using
+    set-based DELETE statements, without loading any child rows, and keeps
+    the cached genre counts in step. Runs inside the caller's transaction;
+    returns the number of venues deleted and the ids of the artists that
+    lost shows.
+    '''
+    venue_ids = list(set(venue_ids))
+    deleted = 0
+    artist_ids = set()
+    for i in range(0, len(venue_ids), DELETE_BATCH_SIZE):
+        batch = venue_ids[i:i + DELETE_BATCH_SIZE]
+        artist_ids.update(artist_id for (artist_id,) in
+                          db.session.query(Show.artist_id).filter(Show.venue_id.in_(batch)).distinct())
+        genre_counts = (db.session.query(venue_genres.c.genre_id, db.func.count())
+                        .filter(venue_genres.c.venue_id.in_(batch))
+                        .group_by(venue_genres.c.genre_id).all())
+        for genre_id, count in genre_counts:
+            Genre.query.filter(Genre.id == genre_id).update(
+                {Genre.venue_count: Genre.venue_count - count}, synchronize_session=False)
+        db.session.execute(venue_genres.delete().where(venue_genres.c.venue_id.in_(batch)))
+        Show.query.filter(Show.venue_id.in_(batch)).delete(synchronize_session=False)
+        deleted += Venue.query.filter(Venue.id.in_(batch)).delete(synchronize_session=False)
+    return deleted, artist_ids
 
 #----------------------------------------------------------------------------#
 # Filters.
@@ -71,6 +263,43 @@ def format_datetime(value, format='medium'):
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Fragment cache.
+#----------------------------------------------------------------------------#
+
+def cached_page(namespace, variant, render):
+  # Pages carrying flashed messages are one-off renders and are never stored
+  if '_flashes' in session:
+    return render()
+  return fragment_cache.get_or_render(namespace, variant, render)
+
+def invalidate_venue(venue_id):
+  # The edited page goes now, so the redirect after an edit shows the change.
+  # A venue's name and image also appear on the pages of artists playing
+  # there; finding and dropping those is left to a background job.
+  fragment_cache.invalidate(f'venue:{venue_id}', 'venues')
+  if jobs.try_enqueue('invalidate_venue_artists', venue_id) is None:
+    invalidate_venue_artists(venue_id)
+
+def invalidate_artist(artist_id):
+  fragment_cache.invalidate(f'artist:{artist_id}', 'artists')
+  if jobs.try_enqueue('invalidate_artist_venues', artist_id) is None:
+    invalidate_artist_venues(artist_id)
+
+@jobs.task('invalidate_venue_artists')
+def invalidate_venue_artists(venue_id):
+  artist_ids = [artist_id for (artist_id,) in
+                db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+  fragment_cache.invalidate(*[f'artist:{artist_id}' for artist_id in artist_ids])
+  return len(artist_ids)
+
+@jobs.task('invalidate_artist_venues')
+def invalidate_artist_venues(artist_id):
+  venue_ids = [venue_id for (venue_id,) in
+               db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+  fragment_cache.invalidate(*[f'venue:{venue_id}' for venue_id in venue_ids])
+  return len(venue_ids)
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -85,29 +314,27 @@ def index():
 
 @app.route('/venues')
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "city": "San Francisco",
-    "state": "CA",
-    "venues": [{
-      "id": 1,
-      "name": "The Musical Hop",
-      "num_upcoming_shows": 0,
-    }, {
-      "id": 3,
-      "name": "Park Square Live Music & Coffee",
-      "num_upcoming_shows": 1,
-    }]
-  }, {
-    "city": "New York",
-    "state": "NY",
-    "venues": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
-  }]
+  genre = request.args.get('genre', '')
+  return cached_page('venues', genre, lambda: render_venues(genre))
+
+def render_venues(genre):
+  # Optional ?genre= filter goes through the venue_genres index instead of
+  # parsing genre strings row by row.
+  query = Venue.query
+  if genre:
+    query = query.join(Venue.genres).filter(Genre.name == genre)
+  venues = query.order_by(Venue.state, Venue.city, Venue.name).all()
+
+  data = []
+  for (city, state), area_venues in groupby(venues, key=lambda venue: (venue.city, venue.state)):
+    data.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": venue.id,
+        "name": venue.name,
+      } for venue in area_venues]
+    })
   return render_template('pages/venues.html', areas=data);
 
 @app.route('/venues/search', methods=['POST'])
@@ -125,90 +352,134 @@ def search_venues():
   }
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
+# Default and largest ?radius= of /venues/nearby, in km, and the most venues returned
+NEARBY_RADIUS_KM = 10
+MAX_NEARBY_RADIUS_KM = 100
+MAX_NEARBY_LIMIT = 500
+
+@app.route('/venues/nearby')
+def nearby_venues():
+  # Geocoded venues within ?radius= km of (?lat=, ?lon=), nearest first, at
+  # most ?limit= of them. count is the number within the radius.
+  try:
+    latitude = float(request.args['lat'])
+    longitude = float(request.args['lon'])
+    radius = float(request.args.get('radius', NEARBY_RADIUS_KM))
+    limit = int(request.args.get('limit', 100))
+  except (KeyError, ValueError):
+    return jsonify({'success': False, 'message': 'lat and lon are required, radius and limit must be numbers'}), 400
+  if not (-90 <= latitude <= 90 and -180 <= longitude <= 180
+          and 0 < radius <= MAX_NEARBY_RADIUS_KM and 0 < limit <= MAX_NEARBY_LIMIT):
+    return jsonify({'success': False, 'message': f'radius must be at most {MAX_NEARBY_RADIUS_KM} km '
+                                                  f'and limit at most {MAX_NEARBY_LIMIT}'}), 400
+
+  # The grid cells narrow it down to a few index range scans; the exact
+  # distance check drops the venues in the corners of those cells
+  cells = db.or_(*[Venue.geo_cell.between(first, last) for first, last in cell_ranges(latitude, longitude, radius)])
+  candidates = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.latitude, Venue.longitude).filter(cells)
+  venues = []
+  for venue_id, name, city, state, venue_latitude, venue_longitude in candidates:
+    distance = distance_km(latitude, longitude, venue_latitude, venue_longitude)
+    if distance <= radius:
+      venues.append((distance, venue_id, name, city, state, venue_latitude, venue_longitude))
+  venues.sort()
+
+  return jsonify({
+    'success': True,
+    'count': len(venues),
+    'venues': [{
+      'id': venue_id,
+      'name': name,
+      'city': city,
+      'state': state,
+      'latitude': venue_latitude,
+      'longitude': venue_longitude,
+      'distance_km': round(distance, 3),
+    } for distance, venue_id, name, city, state, venue_latitude, venue_longitude in venues[:limit]],
+  })
+
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-    "past_shows": [{
-      "artist_id": 4,
-      "artist_name": "Guns N Petals",
-      "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data2={
-    "id": 2,
-    "name": "The Dueling Pianos Bar",
-    "genres": ["Classical", "R&B", "Hip-Hop"],
-    "address": "335 Delancey Street",
-    "city": "New York",
-    "state": "NY",
-    "phone": "914-003-1132",
-    "website": "https://www.theduelingpianos.com",
-    "facebook_link": "https://www.facebook.com/theduelingpianos",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1497032205916-ac775f0649ae?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=750&q=80",
-    "past_shows": [],
-    "upcoming_shows": [],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 0,
+  return cached_page(f'venue:{venue_id}', '', lambda: render_venue(venue_id))
+
+def render_venue(venue_id):
+  venue = Venue.query.get_or_404(venue_id)
+  now = datetime.now()
+  past_shows, upcoming_shows = [], []
+  shows = (db.session.query(Show.start_time, Artist.id, Artist.name, Artist.image_link)
+           .join(Artist).filter(Show.venue_id == venue_id).order_by(Show.start_time))
+  for start_time, artist_id, artist_name, artist_image_link in shows:
+    show = {
+      "artist_id": artist_id,
+      "artist_name": artist_name,
+      "artist_image_link": artist_image_link,
+      "start_time": str(start_time)
+    }
+    (upcoming_shows if start_time > now else past_shows).append(show)
+
+  data = {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": [genre.name for genre in venue.genres],
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "facebook_link": venue.facebook_link,
+    "image_link": venue.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
   }
-  data3={
-    "id": 3,
-    "name": "Park Square Live Music & Coffee",
-    "genres": ["Rock n Roll", "Jazz", "Classical", "Folk"],
-    "address": "34 Whiskey Moore Ave",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "415-000-1234",
-    "website": "https://www.parksquarelivemusicandcoffee.com",
-    "facebook_link": "https://www.facebook.com/ParkSquareLiveMusicAndCoffee",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-    "past_shows": [{
-      "artist_id": 5,
-      "artist_name": "Matt Quevedo",
-      "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [{
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 1,
-  }
-  data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
   return render_template('pages/show_venue.html', venue=data)
 
+# Default and longest ranges served by /venues/<id>/availability
+AVAILABILITY_WINDOW = timedelta(days=7)
+MAX_AVAILABILITY_WINDOW = timedelta(days=366)
+
+@app.route('/venues/<int:venue_id>/availability')
+def venue_availability(venue_id):
+  # Booked shows and the free gaps between them from ?from= to ?to= (ISO 8601,
+  # default: the next 7 days). Times with a UTC offset are converted to local
+  # time by parse_show_time(), the same way start_time is on submission.
+  try:
+    start = parse_show_time(request.args['from']) if request.args.get('from') else datetime.now()
+    end = parse_show_time(request.args['to']) if request.args.get('to') else start + AVAILABILITY_WINDOW
+  except (ValueError, OverflowError):
+    return jsonify({'success': False, 'message': 'from and to must be ISO 8601 times'}), 400
+  if not start < end <= start + MAX_AVAILABILITY_WINDOW:
+    return jsonify({'success': False, 'message': 'to must be after from, by at most 366 days'}), 400
+  if db.session.query(Venue.id).filter(Venue.id == venue_id).scalar() is None:
+    return jsonify({'success': False, 'message': 'Venue not found'}), 404
+
+  shows = (db.session.query(Show.id, Show.artist_id, Show.start_time, Show.end_time)
+           .filter(Show.venue_id == venue_id, overlapping_shows(start, end))
+           .order_by(Show.start_time).all())
+  free = []
+  free_from = start
+  for _, _, start_time, end_time in shows:
+    if start_time > free_from:
+      free.append({'start_time': free_from.isoformat(), 'end_time': start_time.isoformat()})
+    free_from = max(free_from, end_time)
+  if free_from < end:
+    free.append({'start_time': free_from.isoformat(), 'end_time': end.isoformat()})
+
+  return jsonify({
+    'success': True,
+    'venue_id': venue_id,
+    'from': start.isoformat(),
+    'to': end.isoformat(),
+    'shows': [{
+      'id': show_id,
+      'artist_id': artist_id,
+      'start_time': start_time.isoformat(),
+      'end_time': end_time.isoformat(),
+    } for show_id, artist_id, start_time, end_time in shows],
+    'free': free,
+  })
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -219,40 +490,104 @@ def create_venue_form():
 
 @app.route('/venues/create', methods=['POST'])
 def create_venue_submission():
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  error = False
+  try:
+    venue = Venue(
+      name=request.form['name'],
+      city=request.form['city'],
+      state=request.form['state'],
+      address=request.form['address'],
+      phone=request.form.get('phone'),
+      image_link=request.form.get('image_link'),
+      facebook_link=request.form.get('facebook_link'),
+    )
+    update_genre_index(venue, request.form.getlist('genres'))
+    db.session.add(venue)
+    db.session.commit()
+    fragment_cache.invalidate('venues')
+  except Exception as e:
+    error = True
+    db.session.rollback()
+    app.logger.error(f'Failed to create venue: {e}')
+  finally:
+    db.session.close()
+
+  if error:
+    flash('An error occurred. Venue ' + request.form.get('name', '') + ' could not be listed.')
+  else:
+    flash('Venue ' + request.form['name'] + ' was successfully listed!')
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-
-  # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-  # clicking that button delete it from the db then redirect the user to the homepage
-  return None
+  return delete_venues_submission([venue_id])
+
+@app.route('/venues', methods=['DELETE'])
+def delete_venues_bulk():
+  # Bulk variant taking a JSON body of the form {"venue_ids": [1, 2, ...]}.
+  # With "async": true the delete runs as a background job and the response
+  # is a 202 pointing at the job's status.
+  body = request.get_json(silent=True) or {}
+  try:
+    venue_ids = [int(venue_id) for venue_id in body['venue_ids']]
+  except (KeyError, TypeError, ValueError):
+    return jsonify({'success': False, 'message': 'venue_ids must be a list of ids'}), 400
+  if body.get('async'):
+    try:
+      job_id = jobs.enqueue('delete_venues', venue_ids)
+    except QueueFull:
+      return jsonify({'success': False, 'message': 'Too many pending jobs, try again later'}), 503
+    status_url = url_for('job_status', job_id=job_id)
+    return jsonify({'success': True, 'job_id': job_id, 'status_url': status_url}), 202, {'Location': status_url}
+  return delete_venues_submission(venue_ids)
+
+@jobs.task('delete_venues')
+def delete_venues_job(venue_ids):
+  try:
+    deleted, artist_ids = delete_venues(venue_ids)
+    db.session.commit()
+  except Exception:
+    db.session.rollback()
+    raise
+  fragment_cache.invalidate('venues', *[f'venue:{venue_id}' for venue_id in venue_ids],
+                            *[f'artist:{artist_id}' for artist_id in artist_ids])
+  return {'deleted': deleted}
+
+def delete_venues_submission(venue_ids):
+  error = False
+  try:
+    deleted, artist_ids = delete_venues(venue_ids)
+    db.session.commit()
+    fragment_cache.invalidate('venues', *[f'venue:{venue_id}' for venue_id in venue_ids],
+                              *[f'artist:{artist_id}' for artist_id in artist_ids])
+  except Exception as e:
+    error = True
+    db.session.rollback()
+    app.logger.error(f'Failed to delete venues {venue_ids}: {e}')
+  finally:
+    db.session.close()
+
+  if error:
+    return jsonify({'success': False, 'message': 'Venue could not be deleted'}), 500
+  if not deleted:
+    return jsonify({'success': False, 'message': 'Venue not found'}), 404
+  return jsonify({'success': True, 'deleted': deleted})
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-  # TODO: replace with real data returned from querying the database
-  data=[{
-    "id": 4,
-    "name": "Guns N Petals",
-  }, {
-    "id": 5,
-    "name": "Matt Quevedo",
-  }, {
-    "id": 6,
-    "name": "The Wild Sax Band",
-  }]
+  genre = request.args.get('genre', '')
+  return cached_page('artists', genre, lambda: render_artists(genre))
+
+def render_artists(genre):
+  query = db.session.query(Artist.id, Artist.name)
+  if genre:
+    query = query.join(Artist.genres).filter(Genre.name == genre)
+  data = [{
+    "id": artist_id,
+    "name": name,
+  } for artist_id, name in query.order_by(Artist.name)]
   return render_template('pages/artists.html', artists=data)
 
 @app.route('/artists/search', methods=['POST'])
@@ -272,80 +607,38 @@ def search_artists():
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "past_shows": [{
-      "venue_id": 1,
-      "venue_name": "The Musical Hop",
-      "venue_image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data2={
-    "id": 5,
-    "name": "Matt Quevedo",
-    "genres": ["Jazz"],
-    "city": "New York",
-    "state": "NY",
-    "phone": "300-400-5000",
-    "facebook_link": "https://www.facebook.com/mattquevedo923251523",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "past_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data3={
-    "id": 6,
-    "name": "The Wild Sax Band",
-    "genres": ["Jazz", "Classical"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "432-325-5432",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "past_shows": [],
-    "upcoming_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 3,
+  # shows the artist page with the given artist_id
+  return cached_page(f'artist:{artist_id}', '', lambda: render_artist(artist_id))
+
+def render_artist(artist_id):
+  artist = Artist.query.get_or_404(artist_id)
+  now = datetime.now()
+  past_shows, upcoming_shows = [], []
+  shows = (db.session.query(Show.start_time, Venue.id, Venue.name, Venue.image_link)
+           .join(Venue).filter(Show.artist_id == artist_id).order_by(Show.start_time))
+  for start_time, venue_id, venue_name, venue_image_link in shows:
+    show = {
+      "venue_id": venue_id,
+      "venue_name": venue_name,
+      "venue_image_link": venue_image_link,
+      "start_time": str(start_time)
+    }
+    (upcoming_shows if start_time > now else past_shows).append(show)
+
+  data = {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": [genre.name for genre in artist.genres],
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "facebook_link": artist.facebook_link,
+    "image_link": artist.image_link,
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
   }
-  data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
   return render_template('pages/show_artist.html', artist=data)
 
 #  Update
@@ -371,8 +664,23 @@ def edit_artist(artist_id):
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
+  artist = Artist.query.get_or_404(artist_id)
+  try:
+    artist.name = request.form['name']
+    artist.city = request.form['city']
+    artist.state = request.form['state']
+    artist.phone = request.form.get('phone')
+    artist.image_link = request.form.get('image_link')
+    artist.facebook_link = request.form.get('facebook_link')
+    update_genre_index(artist, request.form.getlist('genres'))
+    db.session.commit()
+    invalidate_artist(artist_id)
+  except Exception as e:
+    db.session.rollback()
+    app.logger.error(f'Failed to update artist {artist_id}: {e}')
+    flash('An error occurred. Artist could not be updated.')
+  finally:
+    db.session.close()
 
   return redirect(url_for('show_artist', artist_id=artist_id))
 
@@ -398,8 +706,28 @@ def edit_venue(venue_id):
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-  # TODO: take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
+  venue = Venue.query.get_or_404(venue_id)
+  try:
+    if (venue.city, venue.state) != (request.form['city'], request.form['state']):
+      # The old coordinates are wrong now; geocode.py fills in new ones
+      venue.locate(None, None)
+    venue.name = request.form['name']
+    venue.city = request.form['city']
+    venue.state = request.form['state']
+    venue.address = request.form['address']
+    venue.phone = request.form.get('phone')
+    venue.image_link = request.form.get('image_link')
+    venue.facebook_link = request.form.get('facebook_link')
+    update_genre_index(venue, request.form.getlist('genres'))
+    db.session.commit()
+    invalidate_venue(venue_id)
+  except Exception as e:
+    db.session.rollback()
+    app.logger.error(f'Failed to update venue {venue_id}: {e}')
+    flash('An error occurred. Venue could not be updated.')
+  finally:
+    db.session.close()
+
   return redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
@@ -413,60 +741,74 @@ def create_artist_form():
 @app.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Artist ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
+  error = False
+  try:
+    artist = Artist(
+      name=request.form['name'],
+      city=request.form['city'],
+      state=request.form['state'],
+      phone=request.form.get('phone'),
+      image_link=request.form.get('image_link'),
+      facebook_link=request.form.get('facebook_link'),
+    )
+    update_genre_index(artist, request.form.getlist('genres'))
+    db.session.add(artist)
+    db.session.commit()
+    fragment_cache.invalidate('artists')
+  except Exception as e:
+    error = True
+    db.session.rollback()
+    app.logger.error(f'Failed to create artist: {e}')
+  finally:
+    db.session.close()
+
+  if error:
+    flash('An error occurred. Artist ' + request.form.get('name', '') + ' could not be listed.')
+  else:
+    flash('Artist ' + request.form['name'] + ' was successfully listed!')
   return render_template('pages/home.html')
 
 
+#  Genres
+#  ----------------------------------------------------------------
+
+@app.route('/genres')
+def genres():
+  # Facet counts come straight from the cached columns on Genre
+  data = [{
+    "name": genre.name,
+    "num_venues": genre.venue_count,
+    "num_artists": genre.artist_count,
+  } for genre in Genre.query.order_by(Genre.name)]
+  return render_template('pages/genres.html', genres=data)
+
+@app.cli.command('seed-genres')
+def seed_genres():
+  """Populates the Genre table from the form genre choices."""
+  Genre.seed()
+
+@app.cli.command('rebuild-genre-counts')
+def rebuild_genre_counts():
+  """Recomputes the cached per-genre counts from the genre index."""
+  Genre.rebuild_counts()
+
+
 #  Shows
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
 def shows():
   # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "venue_id": 1,
-    "venue_name": "The Musical Hop",
-    "artist_id": 4,
-    "artist_name": "Guns N Petals",
-    "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "start_time": "2019-05-21T21:30:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 5,
-    "artist_name": "Matt Quevedo",
-    "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "start_time": "2019-06-15T23:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-01T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-08T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-15T20:00:00.000Z"
-  }]
+  shows = (db.session.query(Show.start_time, Venue.id, Venue.name, Artist.id, Artist.name, Artist.image_link)
+           .join(Venue).join(Artist).order_by(Show.start_time))
+  data = [{
+    "venue_id": venue_id,
+    "venue_name": venue_name,
+    "artist_id": artist_id,
+    "artist_name": artist_name,
+    "artist_image_link": artist_image_link,
+    "start_time": str(start_time)
+  } for start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link in shows]
   return render_template('pages/shows.html', shows=data)
 
 @app.route('/shows/create')
@@ -478,15 +820,54 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
-
-  # on successful db insert, flash success
-  flash('Show was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Show could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  error = False
+  conflict = None
+  try:
+    start_time = parse_show_time(request.form['start_time'])
+    duration = int(request.form.get('duration') or DEFAULT_SHOW_MINUTES)
+    if not 0 < duration <= MAX_SHOW_MINUTES:
+      raise ValueError(f'duration must be between 1 and {MAX_SHOW_MINUTES} minutes')
+    show = Show(
+      artist_id=int(request.form['artist_id']),
+      venue_id=int(request.form['venue_id']),
+      start_time=start_time,
+      end_time=start_time + timedelta(minutes=duration)
+    )
+    conflicts = find_show_conflicts(show.venue_id, show.artist_id, show.start_time, show.end_time)
+    if conflicts:
+      booked = 'venue' if conflicts[0].venue_id == show.venue_id else 'artist'
+      conflict = f'The {booked} is already booked from {conflicts[0].start_time} to {conflicts[0].end_time}.'
+    else:
+      db.session.add(show)
+      db.session.commit()
+      fragment_cache.invalidate(f'venue:{show.venue_id}', f'artist:{show.artist_id}')
+  except IntegrityError as e:
+    db.session.rollback()
+    if getattr(e.orig, 'pgcode', None) == EXCLUSION_VIOLATION:
+      # Another submission booked the slot between the check and the insert
+      conflict = 'The venue or the artist was booked for that time in the meantime.'
+    else:
+      error = True
+      app.logger.error(f'Failed to create show: {e}')
+  except Exception as e:
+    error = True
+    db.session.rollback()
+    app.logger.error(f'Failed to create show: {e}')
+  finally:
+    db.session.close()
+
+  if error:
+    flash('An error occurred. Show could not be listed.')
+  elif conflict:
+    flash(f'Show could not be listed. {conflict}')
+  else:
+    flash('Show was successfully listed!')
   return render_template('pages/home.html')
 
+@app.route('/cache/stats')
+def cache_stats():
+  return jsonify(fragment_cache.stats())
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
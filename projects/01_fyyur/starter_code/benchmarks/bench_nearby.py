@@ -0,0 +1,96 @@
+'''
+Times /venues/nearby against a scan of every geocoded venue.
+
+    python benchmarks/bench_nearby.py --venues 100000 --radius 25
+
+Venues are scattered at random over the contiguous US. "scan" computes the
+distance to every venue, as a query without the grid index would have to;
+"grid" is the endpoint itself, timed through the test client. Both must find
+the same venues. Uses a throwaway SQLite file unless --database-uri points at
+a scratch Postgres database. The tables are dropped and recreated.
+'''
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Latitude and longitude bounds of the contiguous US
+SOUTH, NORTH, WEST, EAST = 24.5, 49.5, -125.0, -67.0
+
+
+def seed(app_module, venues):
+    from geo import grid_cell
+    db, Venue = app_module.db, app_module.Venue
+    db.drop_all()
+    db.create_all()
+    random.seed(0)
+    rows = []
+    for i in range(1, venues + 1):
+        latitude, longitude = random.uniform(SOUTH, NORTH), random.uniform(WEST, EAST)
+        rows.append({'name': f'Venue {i}', 'city': 'Somewhere', 'state': 'CA', 'address': f'{i} Main St',
+                     'latitude': latitude, 'longitude': longitude, 'geo_cell': grid_cell(latitude, longitude)})
+    db.session.execute(Venue.__table__.insert(), rows)
+    db.session.commit()
+
+
+def scan(app_module, latitude, longitude, radius):
+    from geo import distance_km
+    Venue = app_module.Venue
+    venues = app_module.db.session.query(Venue.id, Venue.latitude, Venue.longitude).filter(Venue.latitude.isnot(None))
+    return sorted(venue_id for venue_id, venue_latitude, venue_longitude in venues
+                  if distance_km(latitude, longitude, venue_latitude, venue_longitude) <= radius)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=100000)
+    parser.add_argument('--radius', type=float, default=25)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--database-uri')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    database_uri = args.database_uri or 'sqlite:///' + os.path.join(tmp_dir, 'bench.db')
+
+    import app as app_module
+    import config
+    config.use_database(app_module.app.config, database_uri)
+    print(f'{args.venues} venues on {database_uri}, {args.radius} km radius')
+
+    points = [(random.uniform(SOUTH, NORTH), random.uniform(WEST, EAST)) for _ in range(args.queries)]
+    with app_module.app.app_context():
+        seed(app_module, args.venues)
+        # The scan takes long enough that a few points make the comparison
+        expected, times = [], []
+        for latitude, longitude in points[:10]:
+            started = time.perf_counter()
+            expected.append(scan(app_module, latitude, longitude, args.radius))
+            times.append(time.perf_counter() - started)
+        print(f'{"scan":>6}: p50 {percentile(times, 0.5):8.2f} ms  p95 {percentile(times, 0.95):8.2f} ms')
+
+    client = app_module.app.test_client()
+    times, found = [], 0
+    for i, (latitude, longitude) in enumerate(points):
+        started = time.perf_counter()
+        response = client.get(f'/venues/nearby?lat={latitude}&lon={longitude}&radius={args.radius}&limit=500')
+        times.append(time.perf_counter() - started)
+        body = response.get_json()
+        found += body['count']
+        if i < len(expected):
+            assert body['count'] == len(expected[i]), 'the grid search missed venues'
+            assert body['count'] > 500 or sorted(venue['id'] for venue in body['venues']) == expected[i]
+    print(f'{"grid":>6}: p50 {percentile(times, 0.5):8.2f} ms  p95 {percentile(times, 0.95):8.2f} ms  '
+          f'({found / len(points):.0f} venues per query)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+'''
+Measures query throughput for a range of connection pool settings, using the
+engine options that config.py derives for each profile.
+
+    python benchmarks/bench_pool.py --threads 32 --queries 200
+    python benchmarks/bench_pool.py --database-uri postgresql://localhost:5432/fyyur_bench
+
+Every thread checks a connection out of the pool, runs one venue lookup and
+returns it, as a request handler would. Defaults to a throwaway SQLite file.
+'''
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+# (pool_size, max_overflow, pool_pre_ping)
+POOL_SETTINGS = [
+    (1, 0, False),
+    (5, 5, True),
+    (5, 5, False),
+    (10, 20, True),
+    (20, 10, False),
+]
+VENUES = 1000
+
+
+def seed(database_uri):
+    engine = create_engine(database_uri)
+    with engine.begin() as conn:
+        conn.execute(text('DROP TABLE IF EXISTS "Venue"'))
+        conn.execute(text('CREATE TABLE "Venue" (id INTEGER PRIMARY KEY, name VARCHAR, city VARCHAR(120))'))
+        conn.execute(text('INSERT INTO "Venue" (id, name, city) VALUES (:id, :name, :city)'),
+                     [{'id': i, 'name': f'Venue {i}', 'city': 'San Francisco'} for i in range(1, VENUES + 1)])
+    engine.dispose()
+
+
+def run(engine, threads, queries):
+    query = text('SELECT id, name, city FROM "Venue" WHERE id = :id')
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(queries):
+                with engine.connect() as conn:
+                    conn.execute(query, id=random.randint(1, VENUES)).fetchall()
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--queries', type=int, default=200, help='queries per thread')
+    args = parser.parse_args()
+
+    database_uri = args.database_uri or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    seed(database_uri)
+    print(f'{args.threads} threads x {args.queries} queries on {database_uri}')
+    print(f'{"pool_size":>9} {"overflow":>8} {"pre_ping":>8} {"queries/s":>10} {"errors":>6}')
+
+    for pool_size, max_overflow, pre_ping in POOL_SETTINGS:
+        settings = {
+            'SQLALCHEMY_DATABASE_URI': database_uri,
+            'POOL_SIZE': pool_size,
+            'POOL_MAX_OVERFLOW': max_overflow,
+            'POOL_PRE_PING': pre_ping,
+            'POOL_RECYCLE': 3600,
+            'STATEMENT_TIMEOUT_MS': 5000,
+        }
+        engine = create_engine(database_uri, pool_timeout=60, **config.engine_options(settings))
+        elapsed, errors = run(engine, args.threads, args.queries)
+        engine.dispose()
+        total = args.threads * args.queries
+        print(f'{pool_size:>9} {max_overflow:>8} {str(pre_ping):>8} {total / elapsed:>10.0f} {len(errors):>6}')
+
+
+if __name__ == '__main__':
+    main()
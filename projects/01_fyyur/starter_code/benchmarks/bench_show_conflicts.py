@@ -0,0 +1,104 @@
+'''
+Times the double-booking check and /venues/<id>/availability against a venue
+calendar with a long history.
+
+    python benchmarks/bench_show_conflicts.py --venues 200 --shows-per-venue 2000
+
+"unbounded" is the overlap check without a lower bound on start_time, which
+has to read every earlier show of the venue and the artist; "bounded" is
+find_show_conflicts(), which starts MAX_SHOW_DURATION before the checked
+interval. Uses a throwaway SQLite file unless --database-uri points at a
+scratch Postgres database. The tables are dropped and recreated.
+'''
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+START = datetime(2020, 1, 1, 20, 0)
+ARTISTS = 100
+
+
+def seed(app_module, venues, shows_per_venue):
+    db, Venue, Artist, Show = app_module.db, app_module.Venue, app_module.Artist, app_module.Show
+    db.drop_all()
+    db.create_all()
+    db.session.execute(Artist.__table__.insert(), [
+        {'name': f'Artist {i}', 'city': 'San Francisco', 'state': 'CA'} for i in range(1, ARTISTS + 1)
+    ])
+    db.session.execute(Venue.__table__.insert(), [
+        {'name': f'Venue {i}', 'city': 'San Francisco', 'state': 'CA', 'address': f'{i} Main St'}
+        for i in range(1, venues + 1)
+    ])
+    # One two-hour show per venue per day; each artist plays one venue a day
+    for venue_id in range(1, venues + 1):
+        db.session.execute(Show.__table__.insert(), [
+            {'venue_id': venue_id, 'artist_id': (venue_id + day) % ARTISTS + 1,
+             'start_time': START + timedelta(days=day, minutes=venue_id // ARTISTS * 150),
+             'end_time': START + timedelta(days=day, minutes=venue_id // ARTISTS * 150 + 120)}
+            for day in range(shows_per_venue)
+        ])
+    db.session.commit()
+
+
+def unbounded_conflicts(app_module, venue_id, artist_id, start_time, end_time):
+    db, Show = app_module.db, app_module.Show
+    overlaps = db.and_(Show.start_time < end_time, Show.end_time > start_time)
+    return (Show.query.filter(Show.venue_id == venue_id, overlaps)
+            .union(Show.query.filter(Show.artist_id == artist_id, overlaps)).all())
+
+
+def bounded_conflicts(app_module, venue_id, artist_id, start_time, end_time):
+    return app_module.find_show_conflicts(venue_id, artist_id, start_time, end_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=200)
+    parser.add_argument('--shows-per-venue', type=int, default=2000)
+    parser.add_argument('--checks', type=int, default=500)
+    parser.add_argument('--database-uri')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    database_uri = args.database_uri or 'sqlite:///' + os.path.join(tmp_dir, 'bench.db')
+
+    import app as app_module
+    import config
+    config.use_database(app_module.app.config, database_uri)
+    print(f'{args.venues} venues, {args.venues * args.shows_per_venue} shows on {database_uri}')
+
+    random.seed(0)
+    # Late in the calendar, where an unbounded scan has the most history to read
+    slots = [(random.randint(1, args.venues), random.randint(1, ARTISTS),
+              START + timedelta(days=args.shows_per_venue - random.randint(1, 30), hours=random.randint(-3, 3)))
+             for _ in range(args.checks)]
+
+    with app_module.app.app_context():
+        seed(app_module, args.venues, args.shows_per_venue)
+        found = {}
+        for label, check in (('unbounded', unbounded_conflicts), ('bounded', bounded_conflicts)):
+            started = time.perf_counter()
+            found[label] = [sorted(show.id for show in check(app_module, venue_id, artist_id, start, start + timedelta(hours=2)))
+                            for venue_id, artist_id, start in slots]
+            elapsed = time.perf_counter() - started
+            app_module.db.session.remove()
+            print(f'{label:>12}: {elapsed / args.checks * 1000:8.3f} ms per check')
+        assert found['unbounded'] == found['bounded'], 'the bounded check missed conflicts'
+
+    client = app_module.app.test_client()
+    started = time.perf_counter()
+    for venue_id, _, start in slots:
+        response = client.get(f'/venues/{venue_id}/availability?from={start.date().isoformat()}')
+        assert response.status_code == 200
+    elapsed = time.perf_counter() - started
+    print(f'{"availability":>12}: {elapsed / args.checks * 1000:8.3f} ms per request (7 days)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+'''
+Compares deleting venues through the ORM cascade (Venue.shows is loaded and
+every Show is deleted row by row) against the set-based delete_venues() path.
+
+    python benchmarks/bench_venue_delete.py --venues 2000 --shows-per-venue 20
+
+Uses a throwaway SQLite file unless --database-uri points at a scratch
+Postgres database. The tables are dropped and recreated for every run.
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def seed(app_module, venues, shows_per_venue):
+    db, Venue, Artist, Show = app_module.db, app_module.Venue, app_module.Artist, app_module.Show
+    db.drop_all()
+    db.create_all()
+    db.session.execute(Artist.__table__.insert(), [
+        {'name': f'Artist {i}', 'city': 'San Francisco', 'state': 'CA'} for i in range(1, 101)
+    ])
+    db.session.execute(Venue.__table__.insert(), [
+        {'name': f'Venue {i}', 'city': 'San Francisco', 'state': 'CA', 'address': f'{i} Main St'}
+        for i in range(1, venues + 1)
+    ])
+    start = datetime(2030, 1, 1)
+    db.session.execute(Show.__table__.insert(), [
+        {'venue_id': venue_id, 'artist_id': (venue_id + n) % 100 + 1,
+         'start_time': start + timedelta(days=n)}
+        for venue_id in range(1, venues + 1) for n in range(shows_per_venue)
+    ])
+    db.session.commit()
+    return list(range(1, venues + 1))
+
+
+def orm_cascade_delete(app_module, venue_ids):
+    Venue, db = app_module.Venue, app_module.db
+    for venue in Venue.query.filter(Venue.id.in_(venue_ids)):
+        db.session.delete(venue)
+    db.session.commit()
+
+
+def set_based_delete(app_module, venue_ids):
+    app_module.delete_venues(venue_ids)
+    app_module.db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--venues', type=int, default=2000)
+    parser.add_argument('--shows-per-venue', type=int, default=20)
+    parser.add_argument('--database-uri')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    database_uri = args.database_uri or 'sqlite:///' + os.path.join(tmp_dir, 'bench.db')
+
+    import app as app_module
+    import config
+    config.use_database(app_module.app.config, database_uri)
+    rows = args.venues * (args.shows_per_venue + 1)
+    print(f'{args.venues} venues, {args.venues * args.shows_per_venue} shows on {database_uri}')
+
+    with app_module.app.app_context():
+        for label, delete in (('ORM cascade', orm_cascade_delete), ('set-based', set_based_delete)):
+            venue_ids = seed(app_module, args.venues, args.shows_per_venue)
+            app_module.db.session.expunge_all()
+            started = time.perf_counter()
+            delete(app_module, venue_ids)
+            elapsed = time.perf_counter() - started
+            remaining = app_module.Show.query.count() + app_module.Venue.query.count()
+            assert remaining == 0, f'{label} left {remaining} rows behind'
+            print(f'{label:>12}: {elapsed:8.3f}s  {rows / elapsed:12.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
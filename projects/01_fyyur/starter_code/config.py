@@ -1,13 +1,172 @@
 import os
-SECRET_KEY = os.urandom(32)
+
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
+# Configuration profiles, selected with FYYUR_PROFILE (default: dev). Any value
+# can be overridden from the environment, see Config below.
+PROFILES = {
+    'dev': {
+        'debug': True,
+        'database_uri': 'postgresql://localhost:5432/fyyur',
+        'pool_size': 5,
+        'max_overflow': 5,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+        'statement_timeout_ms': 0,
+        'fragment_cache_backend': 'memory',
+        'job_queue_backend': 'memory',
+    },
+    # Local load testing: a larger pool and no pre-ping round trip per checkout
+    'bench': {
+        'debug': False,
+        'database_uri': 'postgresql://localhost:5432/fyyur_bench',
+        'pool_size': 20,
+        'max_overflow': 10,
+        'pool_pre_ping': False,
+        'pool_recycle': 3600,
+        'statement_timeout_ms': 5000,
+        'fragment_cache_backend': 'memory',
+        'job_queue_backend': 'memory',
+    },
+    # gunicorn workers share the file cache so invalidations reach all of them,
+    # and one job queue, so a job may run in any of them
+    'prod': {
+        'debug': False,
+        'database_uri': None,
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+        'statement_timeout_ms': 5000,
+        'fragment_cache_backend': 'file',
+        'job_queue_backend': 'sqlite',
+    },
+}
+
+SECRET_KEY_FILE = os.path.join(basedir, '.secret_key')
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    if cast is bool:
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return cast(value)
+
+
+'''
+load_secret_key(profile)
+    returns FYYUR_SECRET_KEY if set. Outside prod it otherwise falls back to a
+    key generated once into SECRET_KEY_FILE, so every worker process (and every
+    restart) signs sessions with the same key.
+'''
+def load_secret_key(profile):
+    secret_key = os.environ.get('FYYUR_SECRET_KEY')
+    if secret_key:
+        return secret_key
+    if profile == 'prod':
+        raise RuntimeError('FYYUR_SECRET_KEY must be set for the prod profile')
+
+    try:
+        fd = os.open(SECRET_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, 'w') as f:
+            f.write(os.urandom(32).hex())
+    with open(SECRET_KEY_FILE) as f:
+        return f.read().strip()
+
+
+'''
+engine_options(config)
+    builds SQLALCHEMY_ENGINE_OPTIONS for the configured database URI from the
+    POOL_* and STATEMENT_TIMEOUT_MS settings. Must be recomputed whenever the
+    URI changes, since SQLite and Postgres accept different options.
+'''
+def engine_options(config):
+    uri = config['SQLALCHEMY_DATABASE_URI'] or ''
+    pool_options = {
+        'pool_size': config['POOL_SIZE'],
+        'max_overflow': config['POOL_MAX_OVERFLOW'],
+        'pool_pre_ping': config['POOL_PRE_PING'],
+        'pool_recycle': config['POOL_RECYCLE'],
+    }
+    if uri.startswith('postgres'):
+        options = dict(pool_options)
+        if config['STATEMENT_TIMEOUT_MS']:
+            options['connect_args'] = {'options': f"-c statement_timeout={config['STATEMENT_TIMEOUT_MS']}"}
+        return options
+    if uri.startswith('sqlite'):
+        if uri in ('sqlite://', 'sqlite:///:memory:'):
+            # Flask-SQLAlchemy pins in-memory databases to a single connection
+            return {}
+        # SQLAlchemy defaults file databases to NullPool; opt into a real pool
+        from sqlalchemy.pool import QueuePool
+        options = dict(pool_options, poolclass=QueuePool)
+        options['connect_args'] = {'check_same_thread': False}
+        return options
+    return pool_options
+
+
+'''
+use_database(config, uri)
+    points an app config at another database, e.g. from a CLI flag
+'''
+def use_database(config, uri):
+    config['SQLALCHEMY_DATABASE_URI'] = uri
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(config)
+
+
+class Config(object):
+    '''
+    Settings of one profile, with environment overrides:
+    DATABASE_URL, FYYUR_POOL_SIZE, FYYUR_MAX_OVERFLOW, FYYUR_POOL_PRE_PING,
+    FYYUR_POOL_RECYCLE, FYYUR_STATEMENT_TIMEOUT_MS, FYYUR_SECRET_KEY,
+    FYYUR_FRAGMENT_CACHE_BACKEND, FYYUR_SLOW_QUERY_MS and FYYUR_JOB_QUEUE_BACKEND.
+    '''
+    def __init__(self, profile=None):
+        profile = profile or os.environ.get('FYYUR_PROFILE', 'dev')
+        if profile not in PROFILES:
+            raise ValueError(f'unknown profile {profile}, expected one of {", ".join(PROFILES)}')
+        defaults = PROFILES[profile]
+
+        self.PROFILE = profile
+        self.DEBUG = defaults['debug']
+        self.SECRET_KEY = load_secret_key(profile)
+
+        # Connect to the database
+        self.SQLALCHEMY_DATABASE_URI = _env('DATABASE_URL', defaults['database_uri'])
+        if not self.SQLALCHEMY_DATABASE_URI:
+            raise RuntimeError(f'DATABASE_URL must be set for the {profile} profile')
+        self.SQLALCHEMY_TRACK_MODIFICATIONS = False
+        self.POOL_SIZE = _env('FYYUR_POOL_SIZE', defaults['pool_size'], int)
+        self.POOL_MAX_OVERFLOW = _env('FYYUR_MAX_OVERFLOW', defaults['max_overflow'], int)
+        self.POOL_PRE_PING = _env('FYYUR_POOL_PRE_PING', defaults['pool_pre_ping'], bool)
+        self.POOL_RECYCLE = _env('FYYUR_POOL_RECYCLE', defaults['pool_recycle'], int)
+        self.STATEMENT_TIMEOUT_MS = _env('FYYUR_STATEMENT_TIMEOUT_MS', defaults['statement_timeout_ms'], int)
+        self.SQLALCHEMY_ENGINE_OPTIONS = engine_options(vars(self))
 
-# Connect to the database
+        # Rendered page fragment cache: 'memory' (per-process LRU) or 'file'
+        # (shared by all workers on the host through FRAGMENT_CACHE_DIR).
+        self.FRAGMENT_CACHE_BACKEND = _env('FYYUR_FRAGMENT_CACHE_BACKEND', defaults['fragment_cache_backend'])
+        self.FRAGMENT_CACHE_SIZE = 1024
+        self.FRAGMENT_CACHE_DIR = os.path.join(basedir, '.fragment_cache')
+        # Upper bound on entry age, so pages roll shows from upcoming to past on time
+        self.FRAGMENT_CACHE_TIMEOUT = 300
 
+        # Per-request SQL statistics (query_stats): the counts go out as
+        # response headers outside prod, slow statements are logged.
+        self.QUERY_STATS_HEADERS = profile != 'prod'
+        self.QUERY_STATS_SLOW_MS = _env('FYYUR_SLOW_QUERY_MS', 100, int)
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
+        # Background jobs (job_queue): 'memory' (this process) or 'sqlite'
+        # (one queue in JOB_QUEUE_SQLITE_PATH for all workers on the host).
+        # Jobs invalidate fragments, so a shared queue needs the file cache.
+        self.JOB_QUEUE_BACKEND = _env('FYYUR_JOB_QUEUE_BACKEND', defaults['job_queue_backend'])
+        self.JOB_QUEUE_SQLITE_PATH = os.path.join(basedir, '.jobs.db')
+        # Async DELETE /venues answers with a /jobs/<id> status URL. Fyyur has
+        # no logins, so the status endpoints are as public as the rest
+        self.JOB_QUEUE_ROUTES = True
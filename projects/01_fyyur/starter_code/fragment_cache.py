@@ -0,0 +1,189 @@
+'''
+Rendered-HTML fragment cache.
+
+Entries are addressed by a namespace (e.g. 'venue:3' or 'venues') and an
+optional variant within it (e.g. the ?genre= filter of a listing), so a
+handler can drop one entity page or every variant of a listing at once.
+'''
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUBackend:
+    '''
+    In-process backend holding at most `maxsize` fragments, evicting the
+    least recently used one first.
+    '''
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace, variant):
+        key = (namespace, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, namespace, variant, value, timeout=None):
+        expires_at = time.time() + timeout if timeout else None
+        with self._lock:
+            self._entries[(namespace, variant)] = (expires_at, value)
+            self._entries.move_to_end((namespace, variant))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, namespace, variant=None):
+        with self._lock:
+            if variant is not None:
+                self._entries.pop((namespace, variant), None)
+                return
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileBackend:
+    '''
+    Backend storing one file per fragment under `directory/<namespace>/`, so it
+    survives restarts and is shared by every worker process on the host.
+
+    Fragments are text. Each file is a header line holding the expiry time
+    (empty for none) followed by the UTF-8 fragment, so nothing read back
+    from the shared directory is ever unpickled or executed.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _namespace_dir(self, namespace):
+        return os.path.join(self.directory, hashlib.sha1(namespace.encode('utf-8')).hexdigest())
+
+    def _path(self, namespace, variant):
+        name = hashlib.sha1(repr(variant).encode('utf-8')).hexdigest()
+        return os.path.join(self._namespace_dir(namespace), name)
+
+    def get(self, namespace, variant):
+        path = self._path(namespace, variant)
+        try:
+            with open(path, 'rb') as f:
+                header = f.readline()
+                expires_at = float(header) if header.strip() else None
+                if expires_at is not None and expires_at < time.time():
+                    value = None
+                else:
+                    value = f.read().decode('utf-8')
+        except (OSError, ValueError):
+            # Unreadable or not written by this backend: a miss
+            return None
+        if value is None:
+            self._remove(path)
+        return value
+
+    def set(self, namespace, variant, value, timeout=None):
+        if not isinstance(value, str):
+            raise TypeError(f'FileBackend stores text fragments, not {type(value).__name__}')
+        header = repr(time.time() + timeout) if timeout else ''
+        path = self._path(namespace, variant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename so readers never see partial data
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(f'{header}\n'.encode('ascii'))
+            f.write(value.encode('utf-8'))
+        os.replace(tmp_path, path)
+
+    def delete(self, namespace, variant=None):
+        if variant is not None:
+            self._remove(self._path(namespace, variant))
+        else:
+            shutil.rmtree(self._namespace_dir(namespace), ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class FragmentCache:
+    '''
+    Wraps a backend with hit/miss accounting.
+
+    get_or_render(namespace, variant, render) returns the cached fragment or
+    calls render() and stores its result; invalidate() is called by the
+    handlers that change the underlying data.
+    '''
+    def __init__(self, backend, timeout=None):
+        self.backend = backend
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_render(self, namespace, variant, render):
+        value = self.backend.get(namespace, variant)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        with self._lock:
+            self.misses += 1
+        value = render()
+        self.backend.set(namespace, variant, value, self.timeout)
+        return value
+
+    def invalidate(self, *namespaces):
+        for namespace in namespaces:
+            self.backend.delete(namespace)
+        with self._lock:
+            self.invalidations += len(namespaces)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def create_fragment_cache(config):
+    '''
+    Builds the cache described by the FRAGMENT_CACHE_* settings of an app config.
+    '''
+    backend_name = config.get('FRAGMENT_CACHE_BACKEND', 'memory')
+    if backend_name == 'memory':
+        backend = LRUBackend(config.get('FRAGMENT_CACHE_SIZE', 1024))
+    elif backend_name == 'file':
+        backend = FileBackend(config['FRAGMENT_CACHE_DIR'])
+    else:
+        raise ValueError(f'unknown fragment cache backend: {backend_name}')
+    return FragmentCache(backend, timeout=config.get('FRAGMENT_CACHE_TIMEOUT'))
@@ -0,0 +1,75 @@
+'''
+Grid index for venue coordinates.
+
+The globe is cut into GRID_DEGREES x GRID_DEGREES cells numbered row by row
+from (-90, -180), and every geocoded venue stores the number of its cell in
+the indexed Venue.geo_cell column. The cells around a point then form at most
+two contiguous runs per grid row, so a radius search is a handful of range
+scans on that index followed by an exact distance check on the few venues
+they return.
+
+Changing GRID_DEGREES invalidates the stored cells: run geocode.py --all.
+'''
+import math
+
+GRID_DEGREES = 0.1
+ROWS = round(180 / GRID_DEGREES)
+COLUMNS = round(360 / GRID_DEGREES)
+EARTH_RADIUS_KM = 6371.0
+
+
+def _row(latitude):
+    return min(max(int((latitude + 90) / GRID_DEGREES), 0), ROWS - 1)
+
+
+def _column(longitude):
+    return min(max(int((longitude + 180) / GRID_DEGREES), 0), COLUMNS - 1)
+
+
+def grid_cell(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    return _row(latitude) * COLUMNS + _column(longitude)
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    # Haversine great-circle distance
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(longitude2 - longitude1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+'''
+cell_ranges(latitude, longitude, radius_km)
+    sorted, non-overlapping (first, last) runs of cell numbers covering every
+    point within radius_km of (latitude, longitude). Runs that cross the
+    antimeridian are split in two; near a pole every longitude is covered
+'''
+def cell_ranges(latitude, longitude, radius_km):
+    angle = radius_km / EARTH_RADIUS_KM
+    south, north = latitude - math.degrees(angle), latitude + math.degrees(angle)
+    cos_latitude = math.cos(math.radians(latitude))
+    if south <= -90 or north >= 90 or math.sin(angle) >= cos_latitude:
+        columns = [(0, COLUMNS - 1)]
+    else:
+        # Widest longitude offset of the circle, reached north or south of
+        # the centre rather than on its parallel
+        spread = math.degrees(math.asin(math.sin(angle) / cos_latitude))
+        west, east = longitude - spread, longitude + spread
+        if west < -180:
+            columns = [(0, _column(east)), (_column(west + 360), COLUMNS - 1)]
+        elif east >= 180:
+            columns = [(0, _column(east - 360)), (_column(west), COLUMNS - 1)]
+        else:
+            columns = [(_column(west), _column(east))]
+
+    ranges = []
+    for row in range(_row(south), _row(north) + 1):
+        for first, last in columns:
+            first, last = row * COLUMNS + first, row * COLUMNS + last
+            if ranges and first <= ranges[-1][1] + 1:
+                ranges[-1] = (ranges[-1][0], max(last, ranges[-1][1]))
+            else:
+                ranges.append((first, last))
+    return ranges
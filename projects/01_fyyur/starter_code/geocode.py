@@ -0,0 +1,136 @@
+'''
+Offline geocoder for Fyyur venues.
+
+    python geocode.py US.txt
+    python geocode.py places.csv --all --database-uri sqlite:///bench.db
+
+Looks up each venue's city and state in a local gazetteer file and stores the
+coordinates, with their grid cell (see geo.py), on the venue. Two formats are
+read:
+
+    *.txt  a GeoNames dump, e.g. US.txt or cities1000.txt from
+           https://download.geonames.org/export/dump/. Populated places only;
+           the admin1 code is the state (CA, NY, ... for the US).
+    *.csv  columns city, state, latitude, longitude
+
+When a name occurs twice in a state the more populous place wins. Only venues
+without coordinates are geocoded unless --all is given, so re-running it after
+new venues were added or a venue moved city is cheap.
+'''
+import argparse
+import csv
+import os
+import time
+
+from sqlalchemy import bindparam
+
+import config
+from app import app, db, Venue
+from geo import grid_cell
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Columns of the GeoNames dump format
+GEONAMES_NAME = 1
+GEONAMES_ASCII_NAME = 2
+GEONAMES_LATITUDE = 4
+GEONAMES_LONGITUDE = 5
+GEONAMES_FEATURE_CLASS = 6
+GEONAMES_ADMIN1 = 10
+GEONAMES_POPULATION = 14
+
+
+def place_key(city, state):
+    return ' '.join(city.split()).lower(), state.strip().upper()
+
+
+def read_geonames(f):
+    for line in f:
+        columns = line.rstrip('\n').split('\t')
+        if len(columns) <= GEONAMES_POPULATION or columns[GEONAMES_FEATURE_CLASS] != 'P':
+            continue
+        coordinates = float(columns[GEONAMES_LATITUDE]), float(columns[GEONAMES_LONGITUDE])
+        population = int(columns[GEONAMES_POPULATION] or 0)
+        for name in {columns[GEONAMES_NAME], columns[GEONAMES_ASCII_NAME]}:
+            yield place_key(name, columns[GEONAMES_ADMIN1]), coordinates, population
+
+
+def read_places_csv(f):
+    for record in csv.DictReader(f):
+        yield (place_key(record['city'], record['state']),
+               (float(record['latitude']), float(record['longitude'])), 0)
+
+
+def load_gazetteer(path):
+    '''
+    {(city, state): (latitude, longitude)} from a gazetteer file, with city
+    names lower-cased and whitespace-collapsed and states upper-cased.
+    '''
+    read = read_places_csv if path.lower().endswith('.csv') else read_geonames
+    places = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for key, coordinates, population in read(f):
+            if key not in places or population > places[key][1]:
+                places[key] = (coordinates, population)
+    return {key: coordinates for key, (coordinates, _) in places.items()}
+
+
+def geocode_venues(gazetteer, batch_size=DEFAULT_BATCH_SIZE, everything=False):
+    '''
+    Stores the gazetteer coordinates of every venue (or only of those
+    without coordinates), one executemany UPDATE and commit per batch.
+    Returns (geocoded, unmatched).
+    '''
+    query = db.session.query(Venue.id, Venue.city, Venue.state).order_by(Venue.id)
+    if not everything:
+        query = query.filter(Venue.latitude.is_(None))
+    update = (Venue.__table__.update().where(Venue.__table__.c.id == bindparam('venue_id'))
+              .values(latitude=bindparam('latitude'), longitude=bindparam('longitude'),
+                       geo_cell=bindparam('geo_cell')))
+
+    geocoded = unmatched = 0
+    last_id = 0
+    while True:
+        # Keyset batches, so the UPDATEs never shift the rows still to read
+        venues = query.filter(Venue.id > last_id).limit(batch_size).all()
+        if not venues:
+            break
+        rows = []
+        for venue_id, city, state in venues:
+            coordinates = gazetteer.get(place_key(city or '', state or ''))
+            if coordinates is None:
+                unmatched += 1
+                continue
+            rows.append({'venue_id': venue_id, 'latitude': coordinates[0], 'longitude': coordinates[1],
+                         'geo_cell': grid_cell(*coordinates)})
+        if rows:
+            db.session.execute(update, rows)
+        db.session.commit()
+        geocoded += len(rows)
+        last_id = venues[-1][0]
+    return geocoded, unmatched
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Geocode Fyyur venues from a local gazetteer file.')
+    parser.add_argument('gazetteer', help='GeoNames dump (.txt) or city,state,latitude,longitude CSV')
+    parser.add_argument('--all', action='store_true', help='also re-geocode venues that have coordinates')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--database-uri', help='overrides SQLALCHEMY_DATABASE_URI from config.py')
+    args = parser.parse_args(argv)
+
+    if args.database_uri:
+        config.use_database(app.config, args.database_uri)
+    started = time.perf_counter()
+    gazetteer = load_gazetteer(args.gazetteer)
+    print(f'{len(gazetteer)} places read from {os.path.basename(args.gazetteer)} '
+          f'in {time.perf_counter() - started:.2f}s')
+    with app.app_context():
+        started = time.perf_counter()
+        geocoded, unmatched = geocode_venues(gazetteer, args.batch_size, args.all)
+    print(f'{geocoded} venues geocoded, {unmatched} not found in the gazetteer '
+          f'in {time.perf_counter() - started:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
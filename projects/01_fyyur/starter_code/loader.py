@@ -0,0 +1,263 @@
+'''
+Bulk loader for Fyyur venues, artists and shows.
+
+    python loader.py venues venues.csv
+    python loader.py artists artists.jsonl --batch-size 2000
+    python loader.py shows shows.json --database-uri sqlite:///bench.db
+
+Rows are streamed from CSV (genres comma-separated in one cell), JSON Lines
+or a top-level JSON array, validated with VenueForm/ArtistForm/ShowForm and
+inserted with one executemany per table per batch, so memory use is bounded
+by --batch-size rather than by the file size. Invalid rows are reported and
+skipped. Shows are not checked for double bookings, except by the exclusion
+constraints of a Postgres database, which reject the whole batch.
+
+Ids are allocated by the loader from the current maximum id, so it must not
+run while the app is accepting submissions for the same table.
+'''
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import timedelta
+
+from werkzeug.datastructures import MultiDict
+
+import config
+from app import app, db, fragment_cache, Venue, Artist, Show, Genre, venue_genres, artist_genres
+from forms import VenueForm, ArtistForm, ShowForm, DEFAULT_SHOW_MINUTES
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 20
+
+KINDS = {
+    'venues': {
+        'form': VenueForm,
+        'model': Venue,
+        'fields': ['name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link'],
+        'genre_table': venue_genres,
+        'genre_key': 'venue_id',
+        'genre_counter': 'venue_count',
+    },
+    'artists': {
+        'form': ArtistForm,
+        'model': Artist,
+        'fields': ['name', 'city', 'state', 'phone', 'image_link', 'facebook_link'],
+        'genre_table': artist_genres,
+        'genre_key': 'artist_id',
+        'genre_counter': 'artist_count',
+    },
+    'shows': {
+        'form': ShowForm,
+        'model': Show,
+        'fields': ['artist_id', 'venue_id', 'start_time', 'duration'],
+        'genre_table': None,
+    },
+}
+
+
+'''
+Readers: each yields one record dict at a time without loading the whole file
+'''
+def read_csv(f):
+    for record in csv.DictReader(f):
+        if record.get('genres'):
+            record['genres'] = [genre.strip() for genre in record['genres'].split(',') if genre.strip()]
+        yield record
+
+
+def read_json_lines(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_json_array(f, chunk_size=1 << 16):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        stripped = buffer.lstrip()
+        if not started and stripped:
+            if stripped[0] != '[':
+                raise ValueError('expected a JSON array of objects')
+            stripped = stripped[1:]
+            started = True
+        stripped = stripped.lstrip().lstrip(',').lstrip()
+        if stripped.startswith(']'):
+            return
+        try:
+            record, end = decoder.raw_decode(stripped)
+        except json.JSONDecodeError:
+            if eof:
+                if stripped:
+                    raise
+                return
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = stripped + chunk
+            continue
+        buffer = stripped[end:]
+        yield record
+
+
+def open_records(path, file_format=None):
+    file_format = file_format or os.path.splitext(path)[1].lstrip('.').lower()
+    f = open(path, newline='', encoding='utf-8')
+    if file_format == 'csv':
+        return f, read_csv(f)
+    if file_format in ('jsonl', 'ndjson'):
+        return f, read_json_lines(f)
+    if file_format == 'json':
+        return f, read_json_array(f)
+    f.close()
+    raise ValueError(f'unsupported file format: {file_format}')
+
+
+def make_form(kind):
+    # One bound form per load; process() rebinds it to each record, which
+    # avoids constructing and binding every field again per row.
+    return KINDS[kind]['form'](formdata=MultiDict(), meta={'csrf': False})
+
+
+def validate(kind, form, record):
+    '''
+    Runs the record through the same form used by the create handlers and
+    returns (row, genres) or raises ValueError with the form errors.
+    '''
+    spec = KINDS[kind]
+    formdata = MultiDict()
+    for key, value in record.items():
+        if isinstance(value, list):
+            formdata.setlist(key, [str(item) for item in value])
+        elif value is not None:
+            formdata.add(key, str(value))
+    form.process(formdata)
+    if not form.validate():
+        raise ValueError('; '.join(f'{name}: {", ".join(errors)}' for name, errors in form.errors.items()))
+
+    row = {field: form[field].data for field in spec['fields']}
+    if kind == 'shows':
+        row['artist_id'] = int(row['artist_id'])
+        row['venue_id'] = int(row['venue_id'])
+        # An empty duration column gets the default length, like the create form
+        row['end_time'] = row['start_time'] + timedelta(minutes=row.pop('duration') or DEFAULT_SHOW_MINUTES)
+    genres = form.genres.data if spec['genre_table'] is not None else []
+    return row, genres
+
+
+class BatchInserter:
+    '''
+    Collects validated rows and flushes them with executemany, one commit
+    per batch. Genre links and the cached genre counts go in the same
+    transaction as the rows they belong to.
+    '''
+    def __init__(self, kind, batch_size):
+        self.spec = KINDS[kind]
+        self.batch_size = batch_size
+        self.rows = []
+        self.links = []
+        self.genre_counts = Counter()
+        self.inserted = 0
+        model = self.spec['model']
+        self.next_id = (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+        if self.spec['genre_table'] is not None:
+            Genre.seed()
+            self.genre_ids = dict(db.session.query(Genre.name, Genre.id))
+
+    def add(self, row, genres):
+        row['id'] = self.next_id
+        self.next_id += 1
+        self.rows.append(row)
+        for genre in genres:
+            self.links.append({self.spec['genre_key']: row['id'], 'genre_id': self.genre_ids[genre]})
+            self.genre_counts[genre] += 1
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        try:
+            db.session.execute(self.spec['model'].__table__.insert(), self.rows)
+            if self.links:
+                db.session.execute(self.spec['genre_table'].insert(), self.links)
+            for genre, count in self.genre_counts.items():
+                counter = getattr(Genre, self.spec['genre_counter'])
+                Genre.query.filter(Genre.id == self.genre_ids[genre]).update(
+                    {counter: counter + count}, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.inserted += len(self.rows)
+        self.rows = []
+        self.links = []
+        self.genre_counts.clear()
+
+    def finish(self):
+        self.flush()
+        if db.engine.dialect.name == 'postgresql':
+            # Explicit ids bypass the serial sequence; move it past them
+            table = self.spec['model'].__tablename__
+            db.session.execute(
+                f'SELECT setval(pg_get_serial_sequence(\'"{table}"\', \'id\'), '
+                f'(SELECT COALESCE(MAX(id), 1) FROM "{table}"))')
+            db.session.commit()
+
+
+def load(kind, path, batch_size=DEFAULT_BATCH_SIZE, file_format=None, out=sys.stdout):
+    f, records = open_records(path, file_format)
+    form = make_form(kind)
+    inserter = BatchInserter(kind, batch_size)
+    read = rejected = 0
+    started = time.perf_counter()
+    try:
+        for read, record in enumerate(records, start=1):
+            try:
+                row, genres = validate(kind, form, record)
+            except (ValueError, TypeError) as e:
+                rejected += 1
+                if rejected <= MAX_REPORTED_ERRORS:
+                    print(f'record {read} rejected: {e}', file=sys.stderr)
+                continue
+            inserter.add(row, genres)
+            if read % (batch_size * 10) == 0:
+                elapsed = time.perf_counter() - started
+                print(f'{read} records read, {inserter.inserted} inserted, {read / elapsed:.0f} records/s', file=out)
+        inserter.finish()
+    finally:
+        f.close()
+    # Pages cached by a file backend shared with the running app are now stale
+    fragment_cache.clear()
+
+    elapsed = time.perf_counter() - started
+    print(f'{kind}: {read} read, {inserter.inserted} inserted, {rejected} rejected '
+          f'in {elapsed:.2f}s ({inserter.inserted / elapsed if elapsed else 0:.0f} rows/s)', file=out)
+    return inserter.inserted, rejected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk load Fyyur data from CSV or JSON files.')
+    parser.add_argument('kind', choices=sorted(KINDS))
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=['csv', 'json', 'jsonl'], help='defaults to the file extension')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--database-uri', help='overrides SQLALCHEMY_DATABASE_URI from config.py')
+    parser.add_argument('--create-tables', action='store_true', help='create missing tables first')
+    args = parser.parse_args(argv)
+
+    if args.database_uri:
+        config.use_database(app.config, args.database_uri)
+    with app.app_context():
+        if args.create_tables:
+            db.create_all()
+        load(args.kind, args.path, args.batch_size, args.format)
+
+
+if __name__ == '__main__':
+    main()
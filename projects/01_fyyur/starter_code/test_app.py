@@ -0,0 +1,273 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import config
+from app import (app, db, jobs, Venue, Artist, Show, Genre, venue_genres, artist_genres,
+                 find_show_conflicts, parse_show_time, MAX_SHOW_DURATION)
+from forms import DEFAULT_SHOW_MINUTES, MAX_SHOW_MINUTES
+
+
+class FyyurTestCase(unittest.TestCase):
+    """Runs the app against a fresh SQLite file per test"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        config.use_database(app.config, 'sqlite:///' + os.path.join(cls.directory, 'fyyur.db'))
+        cls.context = app.app_context()
+        cls.context.push()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        db.engine.dispose()
+        cls.context.pop()
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        db.create_all()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def add_venue(self, name='The Musical Hop'):
+        venue = Venue(name=name, city='San Francisco', state='CA', address='1015 Folsom Street')
+        db.session.add(venue)
+        db.session.commit()
+        return venue.id
+
+    def add_artist(self, name='Guns N Petals'):
+        artist = Artist(name=name, city='San Francisco', state='CA')
+        db.session.add(artist)
+        db.session.commit()
+        return artist.id
+
+
+class ShowSchedulingTestCase(FyyurTestCase):
+    def setUp(self):
+        super().setUp()
+        self.venue_id = self.add_venue()
+        self.artist_id = self.add_artist()
+        self.start = datetime(2035, 4, 1, 20, 0)
+
+    def submit_show(self, start_time, duration=None, venue_id=None, artist_id=None):
+        form = {
+            'venue_id': venue_id or self.venue_id,
+            'artist_id': artist_id or self.artist_id,
+            'start_time': start_time if isinstance(start_time, str) else start_time.isoformat(),
+        }
+        if duration is not None:
+            form['duration'] = duration
+        self.assertEqual(self.client.post('/shows/create', data=form).status_code, 200)
+
+    def shows(self):
+        return db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Show.end_time).order_by(Show.id).all()
+
+    def test_duration_is_optional(self):
+        self.submit_show(self.start)
+        self.submit_show(self.start + timedelta(days=1), duration='')
+        self.submit_show(self.start + timedelta(days=2), duration=45)
+
+        self.assertEqual([end - start for _, _, start, end in self.shows()], [
+            timedelta(minutes=DEFAULT_SHOW_MINUTES),
+            timedelta(minutes=DEFAULT_SHOW_MINUTES),
+            timedelta(minutes=45),
+        ])
+
+    def test_duration_is_bounded(self):
+        self.submit_show(self.start, duration=0)
+        self.submit_show(self.start, duration=MAX_SHOW_MINUTES + 1)
+        self.assertEqual(self.shows(), [])
+
+        self.submit_show(self.start, duration=MAX_SHOW_MINUTES)
+        self.assertEqual(self.shows()[0][3] - self.start, MAX_SHOW_DURATION)
+
+    def test_refuses_overlapping_shows(self):
+        other_venue = self.add_venue('Park Square Live Music & Coffee')
+        other_artist = self.add_artist('Matt Quevedo')
+        self.submit_show(self.start, duration=120)
+
+        # Same venue, and same artist elsewhere, both overlapping the last minute
+        self.submit_show(self.start + timedelta(minutes=119), artist_id=other_artist)
+        self.submit_show(self.start - timedelta(minutes=60), duration=61, venue_id=other_venue)
+        self.assertEqual(len(self.shows()), 1)
+
+        # End times are exclusive, and other venues and artists are free
+        self.submit_show(self.start + timedelta(minutes=120), artist_id=other_artist)
+        self.submit_show(self.start - timedelta(minutes=60), duration=60, venue_id=other_venue)
+        self.submit_show(self.start, venue_id=other_venue, artist_id=other_artist)
+        self.assertEqual(len(self.shows()), 4)
+
+    def test_finds_conflicts_up_to_the_longest_duration_back(self):
+        db.session.add(Show(venue_id=self.venue_id, artist_id=self.artist_id,
+                            start_time=self.start, end_time=self.start + MAX_SHOW_DURATION))
+        db.session.commit()
+
+        last_minute = self.start + MAX_SHOW_DURATION - timedelta(minutes=1)
+        self.assertEqual(len(find_show_conflicts(self.venue_id, 0, last_minute, last_minute + timedelta(hours=1))), 1)
+        after = self.start + MAX_SHOW_DURATION
+        self.assertEqual(find_show_conflicts(self.venue_id, 0, after, after + timedelta(hours=1)), [])
+
+    @mock.patch.dict(os.environ, {'TZ': 'America/New_York'})
+    def test_converts_utc_offsets_to_local_time(self):
+        time.tzset()
+        try:
+            self.assertEqual(parse_show_time('2035-04-01T20:00:00'), self.start)
+            self.assertEqual(parse_show_time('2035-04-02T00:00:00Z'), self.start)
+            self.assertEqual(parse_show_time('2035-04-01T21:00:00-03:00'), self.start)
+
+            # A show entered in UTC blocks the same local slot as one entered without offset
+            self.submit_show('2035-04-02T00:00:00+00:00')
+            self.submit_show(self.start + timedelta(minutes=30))
+            self.assertEqual(self.shows()[0][2], self.start)
+            self.assertEqual(len(self.shows()), 1)
+
+            res = self.client.get(f'/venues/{self.venue_id}/availability?from=2035-04-01T23:00:00Z&to=2035-04-02T03:00:00Z')
+            body = res.get_json()
+            self.assertEqual(body['from'], '2035-04-01T19:00:00')
+            self.assertEqual(body['shows'][0]['start_time'], '2035-04-01T20:00:00')
+        finally:
+            os.environ.pop('TZ')
+            time.tzset()
+
+    def test_availability(self):
+        self.submit_show(self.start, duration=60)
+        self.submit_show(self.start + timedelta(hours=2), duration=90)
+
+        res = self.client.get(f'/venues/{self.venue_id}/availability?from=2035-04-01T18:00:00&to=2035-04-02T00:00:00')
+        self.assertEqual(res.status_code, 200)
+        body = res.get_json()
+        self.assertEqual([(show['start_time'], show['end_time']) for show in body['shows']], [
+            ('2035-04-01T20:00:00', '2035-04-01T21:00:00'),
+            ('2035-04-01T22:00:00', '2035-04-01T23:30:00'),
+        ])
+        self.assertEqual([(free['start_time'], free['end_time']) for free in body['free']], [
+            ('2035-04-01T18:00:00', '2035-04-01T20:00:00'),
+            ('2035-04-01T21:00:00', '2035-04-01T22:00:00'),
+            ('2035-04-01T23:30:00', '2035-04-02T00:00:00'),
+        ])
+
+    def test_availability_includes_shows_started_before_the_range(self):
+        self.submit_show(self.start, duration=MAX_SHOW_MINUTES)
+
+        res = self.client.get(f'/venues/{self.venue_id}/availability?from=2035-04-02T12:00:00&to=2035-04-03T00:00:00')
+        body = res.get_json()
+        self.assertEqual(len(body['shows']), 1)
+        self.assertEqual(body['free'], [{'start_time': '2035-04-02T20:00:00', 'end_time': '2035-04-03T00:00:00'}])
+
+    def test_availability_errors(self):
+        url = f'/venues/{self.venue_id}/availability'
+        self.assertEqual(self.client.get(url + '?from=tomorrow-ish').status_code, 400)
+        self.assertEqual(self.client.get(url + '?from=2035-04-02&to=2035-04-01').status_code, 400)
+        self.assertEqual(self.client.get(url + '?from=2035-01-01&to=2036-06-01').status_code, 400)
+        self.assertEqual(self.client.get('/venues/999/availability').status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class GenreIndexTestCase(FyyurTestCase):
+    def setUp(self):
+        super().setUp()
+        Genre.seed()
+
+    def counts(self):
+        # {genre: (venues, artists)} for the genres in use, as cached and as counted
+        cached = {name: (venues, artists) for name, venues, artists in
+                  db.session.query(Genre.name, Genre.venue_count, Genre.artist_count)
+                  if venues or artists}
+        counted = {}
+        for table, index in ((venue_genres, 0), (artist_genres, 1)):
+            for name, count in (db.session.query(Genre.name, db.func.count()).join(table)
+                                .group_by(Genre.name)):
+                counts = counted.setdefault(name, [0, 0])
+                counts[index] = count
+        self.assertEqual(cached, {name: tuple(counts) for name, counts in counted.items()})
+        db.session.remove()
+        return cached
+
+    def venue_form(self, name, *genres):
+        return {'name': name, 'city': 'San Francisco', 'state': 'CA',
+                'address': '1015 Folsom Street', 'genres': list(genres)}
+
+    def artist_form(self, name, *genres):
+        return {'name': name, 'city': 'San Francisco', 'state': 'CA', 'genres': list(genres)}
+
+    def create_venues(self):
+        self.client.post('/venues/create', data=self.venue_form('The Musical Hop', 'Jazz', 'Folk'))
+        self.client.post('/venues/create', data=self.venue_form('The Dueling Pianos Bar', 'Jazz', 'Classical'))
+        self.client.post('/venues/create', data=self.venue_form('Park Square', 'Folk'))
+        return [venue_id for (venue_id,) in db.session.query(Venue.id).order_by(Venue.id)]
+
+    def test_create(self):
+        self.create_venues()
+        self.client.post('/artists/create', data=self.artist_form('Guns N Petals', 'Jazz', 'Rock n Roll'))
+        # Unknown genres are refused without touching the counts
+        self.client.post('/artists/create', data=self.artist_form('Matt Quevedo', 'Jazz', 'Polka'))
+
+        self.assertEqual(self.counts(), {
+            'Classical': (1, 0),
+            'Folk': (2, 0),
+            'Jazz': (2, 1),
+            'Rock n Roll': (0, 1),
+        })
+        self.assertEqual(Artist.query.count(), 1)
+
+    def test_edit_moves_counts_between_genres(self):
+        venue_id = self.create_venues()[0]
+        self.client.post('/artists/create', data=self.artist_form('Guns N Petals', 'Jazz'))
+        artist_id = db.session.query(Artist.id).scalar()
+
+        self.client.post(f'/venues/{venue_id}/edit', data=self.venue_form('The Musical Hop', 'Folk', 'Blues'))
+        self.client.post(f'/artists/{artist_id}/edit', data=self.artist_form('Guns N Petals', 'Blues'))
+        self.assertEqual(self.counts(), {
+            'Blues': (1, 1),
+            'Classical': (1, 0),
+            'Folk': (2, 0),
+            'Jazz': (1, 0),
+        })
+
+        # Saving a venue's genres unchanged leaves its counts alone; clearing an artist's drops them
+        self.client.post(f'/venues/{venue_id}/edit', data=self.venue_form('The Musical Hop', 'Folk', 'Blues'))
+        self.client.post(f'/artists/{artist_id}/edit', data=self.artist_form('Guns N Petals'))
+        self.assertEqual(self.counts(), {
+            'Blues': (1, 0),
+            'Classical': (1, 0),
+            'Folk': (2, 0),
+            'Jazz': (1, 0),
+        })
+
+    def test_bulk_delete(self):
+        venue_ids = self.create_venues()
+
+        res = self.client.delete('/venues', json={'venue_ids': venue_ids[:2]})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.counts(), {'Folk': (1, 0)})
+
+        with mock.patch.object(jobs, 'eager', True):
+            res = self.client.delete('/venues', json={'venue_ids': venue_ids[2:], 'async': True})
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(self.counts(), {})
+        self.assertEqual(Venue.query.count(), 0)
+
+    def test_rebuild_genre_counts(self):
+        self.create_venues()
+        self.client.post('/artists/create', data=self.artist_form('Guns N Petals', 'Jazz'))
+        expected = self.counts()
+        # Out-of-band changes leave the cached counts behind
+        db.session.execute(venue_genres.delete().where(venue_genres.c.venue_id == 1))
+        Genre.query.filter(Genre.name == 'Blues').update({Genre.artist_count: 7})
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=['rebuild-genre-counts'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(self.counts(), dict(expected, Jazz=(1, 1), Folk=(1, 0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
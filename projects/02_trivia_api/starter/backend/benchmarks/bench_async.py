@@ -0,0 +1,93 @@
+'''
+Side-by-side throughput of the sync (create_app) and async (create_async_app)
+trivia apps at 100 and 1000 concurrent clients.
+
+    pip install -r requirements-async.txt
+    python benchmarks/bench_async.py --requests 5000 --workers 8
+    python benchmarks/bench_async.py --database-uri postgresql://localhost:5432/trivia_bench
+
+The sync app is served by a pool of --workers threads, like a threaded WSGI
+worker; the async app runs every request on one event loop. Both are driven
+in-process through their test clients, so the numbers compare the serving
+models rather than the network stack. With local SQLite the queries barely
+wait on I/O, so run it against Postgres to see the effect of blocking.
+'''
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import database_uri, seed_questions, summary
+
+from flaskr import create_app
+from flaskr.asgi import create_async_app
+
+
+def run_sync(app, path, total, concurrency, workers):
+    local = threading.local()
+    in_flight = threading.BoundedSemaphore(concurrency)
+    latencies = []
+
+    def request(submitted):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        try:
+            response = local.client.get(path)
+            assert response.status_code == 200, response.status_code
+            latencies.append(time.perf_counter() - submitted)
+        finally:
+            in_flight.release()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in range(total):
+            in_flight.acquire()
+            executor.submit(request, time.perf_counter())
+    return time.perf_counter() - started, latencies
+
+
+async def run_async(app, path, total, concurrency):
+    latencies = []
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async with app.test_app() as test_app:
+        client = test_app.test_client()
+
+        async def request():
+            async with in_flight:
+                submitted = time.perf_counter()
+                response = await client.get(path)
+                assert response.status_code == 200, response.status_code
+                latencies.append(time.perf_counter() - submitted)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(request() for _ in range(total)))
+        return time.perf_counter() - started, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri')
+    parser.add_argument('--questions', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--workers', type=int, default=8, help='threads serving the sync app')
+    parser.add_argument('--path', default='/questions?page=2')
+    args = parser.parse_args()
+
+    uri = database_uri(args.database_uri)
+    test_config = {'SQLALCHEMY_DATABASE_URI': uri, 'RATELIMIT_ENABLED': False}
+    sync_app = create_app(test_config)
+    seed_questions(sync_app, args.questions)
+    print(f'{args.requests} x GET {args.path} on {uri}')
+
+    for concurrency in (100, 1000):
+        elapsed, latencies = run_sync(sync_app, args.path, args.requests, concurrency, args.workers)
+        print(summary(f'sync {args.workers} threads @{concurrency}', args.requests, elapsed, latencies))
+        async_app = create_async_app(test_config)
+        elapsed, latencies = asyncio.run(run_async(async_app, args.path, args.requests, concurrency))
+        print(summary(f'async @{concurrency}', args.requests, elapsed, latencies))
+
+
+if __name__ == '__main__':
+    main()
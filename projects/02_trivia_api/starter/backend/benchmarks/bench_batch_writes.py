@@ -0,0 +1,65 @@
+'''
+Rows/sec for question inserts and deletes committed one row at a time
+(Question.insert()/delete() on their own) against the same calls grouped in
+a single unit_of_work().
+
+    python benchmarks/bench_batch_writes.py --rows 2000
+    python benchmarks/bench_batch_writes.py --database-uri postgresql://localhost:5432/trivia_bench
+'''
+import argparse
+import time
+
+from common import database_uri, seed_questions
+
+from flaskr import create_app
+from models import unit_of_work, Question
+
+
+def insert_questions(rows, batched):
+    questions = [Question(f'Benchmark question {i}?', 'Answer', 1 + i % 6, 1 + i % 5) for i in range(rows)]
+    started = time.perf_counter()
+    if batched:
+        with unit_of_work():
+            for question in questions:
+                question.insert()
+    else:
+        for question in questions:
+            question.insert()
+    return time.perf_counter() - started, [question.id for question in questions]
+
+
+def delete_questions(ids, batched):
+    questions = Question.query.filter(Question.id.in_(ids)).all()
+    started = time.perf_counter()
+    if batched:
+        with unit_of_work():
+            for question in questions:
+                question.delete()
+    else:
+        for question in questions:
+            question.delete()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri')
+    parser.add_argument('--rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    uri = database_uri(args.database_uri)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri})
+    seed_questions(app, 0)
+    print(f'{args.rows} rows on {uri}')
+
+    with app.app_context():
+        for batched in (False, True):
+            label = 'unit_of_work' if batched else 'commit per row'
+            elapsed, ids = insert_questions(args.rows, batched)
+            print(f'{label:>15} insert: {args.rows / elapsed:10.0f} rows/s')
+            elapsed = delete_questions(ids, batched)
+            print(f'{label:>15} delete: {args.rows / elapsed:10.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
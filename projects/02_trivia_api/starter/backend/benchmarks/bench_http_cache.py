@@ -0,0 +1,56 @@
+'''
+Bytes on the wire and latency of /questions and /categories for a client
+that refetches the same page: uncompressed, gzip, brotli (when installed),
+and revalidation with If-None-Match answered by a 304.
+
+    python benchmarks/bench_http_cache.py --requests 500
+    python benchmarks/bench_http_cache.py --database-uri postgresql://localhost:5432/trivia_bench
+'''
+import argparse
+import time
+
+from common import database_uri, seed_questions, summary
+
+from flaskr import create_app
+from flaskr.compression import PREFERRED_ENCODINGS
+
+
+def run(client, path, headers, total):
+    latencies = []
+    sent = 0
+    started = time.perf_counter()
+    for _ in range(total):
+        submitted = time.perf_counter()
+        response = client.get(path, headers=headers)
+        assert response.status_code in (200, 304), response.status_code
+        latencies.append(time.perf_counter() - submitted)
+        sent += len(response.get_data())
+    return time.perf_counter() - started, latencies, sent / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri')
+    parser.add_argument('--questions', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    uri = database_uri(args.database_uri)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'RATELIMIT_ENABLED': False})
+    seed_questions(app, args.questions)
+    client = app.test_client()
+    print(f'{args.requests} requests per case, {args.questions} questions on {uri}')
+
+    for path in ('/questions?page=2', '/categories'):
+        cases = [('identity', {'Accept-Encoding': 'identity'})]
+        cases += [(encoding, {'Accept-Encoding': encoding}) for encoding in reversed(PREFERRED_ENCODINGS)]
+        etag = client.get(path, headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        cases.append(('304 revalidate', {'Accept-Encoding': 'gzip', 'If-None-Match': etag}))
+
+        for label, headers in cases:
+            elapsed, latencies, size = run(client, path, headers, args.requests)
+            print(f'{summary(f"{path} {label}", args.requests, elapsed, latencies)}   body {size:7.0f} B')
+
+
+if __name__ == '__main__':
+    main()
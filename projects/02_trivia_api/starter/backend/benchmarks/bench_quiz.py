@@ -0,0 +1,75 @@
+'''
+/quizzes throughput as the question bank grows, for the original selection
+(load every candidate row, pick one at random, re-registered here under
+/legacy), random draws from the in-memory decks, and adaptive draws from
+the (category, difficulty) buckets.
+
+    python benchmarks/bench_quiz.py --sizes 1000 10000 50000 --requests 300
+    python benchmarks/bench_quiz.py --database-uri postgresql://localhost:5432/trivia_bench
+'''
+import argparse
+import random
+import time
+
+from flask import jsonify, request
+
+from common import database_uri, seed_questions, summary
+
+from flaskr import create_app
+from models import Question
+
+
+def add_legacy_route(app):
+    @app.route('/legacy/quizzes', methods=['POST'])
+    def legacy_get_next_question():
+        category = request.json['quiz_category']
+        subquery = Question.query.filter(~Question.id.in_(request.json['previous_questions']))
+        if category['id'] != 0:
+            subquery = subquery.filter(Question.category == category['id'])
+        available_questions = subquery.all()
+        next_question = random.choice(available_questions).format() if available_questions else None
+        return jsonify({'success': True, 'question': next_question})
+
+
+def run(client, path, body, total):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(total):
+        submitted = time.perf_counter()
+        response = client.post(path, json=body)
+        assert response.status_code == 200, response.status_code
+        latencies.append(time.perf_counter() - submitted)
+    return time.perf_counter() - started, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    uri = database_uri(args.database_uri)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'RATELIMIT_ENABLED': False})
+    add_legacy_route(app)
+
+    # Mid-game in one category: four questions asked, three answered right
+    quiz = {'quiz_category': {'id': 2}, 'previous_questions': [1, 2, 3, 4]}
+    cases = [
+        ('legacy random', '/legacy/quizzes', quiz),
+        ('deck random', '/quizzes', quiz),
+        ('deck adaptive', '/quizzes', dict(quiz, adaptive=True, correct_answers=3)),
+    ]
+    for size in args.sizes:
+        seed_questions(app, size)
+        # The seed bypasses the ORM, so it doesn't move the data version
+        app.extensions['quiz_decks'].invalidate()
+        client = app.test_client()
+        print(f'{size} questions, {args.requests} requests per case on {uri}')
+        for label, path, body in cases:
+            elapsed, latencies = run(client, path, body, args.requests)
+            print(summary(label, args.requests, elapsed, latencies))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+'''
+Latency and allocations of the trivia list endpoints on the row-tuple path
+(Question.query_rows() + json_response()) against the previous ORM path
+(Question.query.all() + format() + jsonify()), which is re-registered here
+under /legacy for comparison.
+
+    python benchmarks/bench_serialization.py --questions 5000 --requests 300
+    python benchmarks/bench_serialization.py --database-uri postgresql://localhost:5432/trivia_bench
+'''
+import argparse
+import time
+import tracemalloc
+
+from flask import jsonify, request
+
+from common import database_uri, seed_questions, summary
+
+from flaskr import create_app, QUESTIONS_PER_PAGE
+from models import Question, Category
+
+
+def add_legacy_routes(app):
+    @app.route('/legacy/questions', methods=['GET'])
+    def legacy_get_questions():
+        start = (request.args.get('page', 1, int) - 1) * QUESTIONS_PER_PAGE
+        questions = Question.query.order_by(Question.id).all()
+        return jsonify({
+            'success': True,
+            'questions': [question.format() for question in questions[start:start + QUESTIONS_PER_PAGE]],
+            'total_questions': len(questions),
+            'categories': {cat.id: cat.type for cat in Category.query.all()}
+        })
+
+    @app.route('/legacy/questions/search', methods=['POST'])
+    def legacy_search_questions():
+        search_term = request.get_json()['searchTerm']
+        questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
+        return jsonify({
+            'success': True,
+            'questions': [question.format() for question in questions],
+            'total_questions': len(questions)
+        })
+
+
+def run(client, method, path, body, total):
+    latencies = []
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(total):
+        submitted = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        assert response.status_code == 200, response.status_code
+        latencies.append(time.perf_counter() - submitted)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, latencies, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri')
+    parser.add_argument('--questions', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    uri = database_uri(args.database_uri)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'RATELIMIT_ENABLED': False})
+    add_legacy_routes(app)
+    seed_questions(app, args.questions)
+    client = app.test_client()
+    print(f'{args.requests} requests per endpoint, {args.questions} questions on {uri}')
+
+    endpoints = [
+        ('GET', '/questions?page=2', None),
+        ('POST', '/questions/search', {'searchTerm': 'river'}),
+    ]
+    for method, path, body in endpoints:
+        for prefix in ('/legacy', ''):
+            elapsed, latencies, peak = run(client, method, prefix + path, body, args.requests)
+            label = f'{method} {prefix or "/rows"}{path.split("?")[0]}'
+            print(f'{summary(label, args.requests, elapsed, latencies)}   peak {peak / 1024:8.0f} KiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+'''
+Helpers shared by the trivia benchmarks: a seeded throwaway database and
+simple latency statistics.
+'''
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+WORDS = ['capital', 'river', 'painter', 'element', 'planet', 'movie', 'team', 'year', 'author', 'war']
+
+
+def database_uri(args_uri=None):
+    return args_uri or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'trivia_bench.db')
+
+
+def seed_questions(app, questions):
+    '''
+    Replaces the contents of the app's database with the six stock
+    categories and `questions` generated questions.
+    '''
+    from models import db, Question, Category
+    rng = random.Random(42)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Category.__table__.insert(), [{'id': i, 'type': t} for i, t in enumerate(CATEGORIES, 1)])
+        db.session.execute(Question.__table__.insert(), [{
+            'question': f'Which {rng.choice(WORDS)} is number {i}?',
+            'answer': f'Answer {i}',
+            'category': rng.randint(1, len(CATEGORIES)),
+            'difficulty': rng.randint(1, 5),
+        } for i in range(1, questions + 1)])
+        db.session.commit()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summary(label, total, elapsed, latencies):
+    return (f'{label:>24}: {total / elapsed:9.0f} req/s   p50 {percentile(latencies, 50) * 1000:7.1f} ms'
+            f'   p99 {percentile(latencies, 99) * 1000:7.1f} ms')
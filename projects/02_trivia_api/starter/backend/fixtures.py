@@ -0,0 +1,257 @@
+'''
+Hermetic test fixtures for the trivia API.
+
+create_test_app() builds the app once per test run, against an in-memory
+SQLite database (or TRIVIA_TEST_DATABASE_URL) seeded with the rows of
+trivia.psql. The rows are parsed from the dump once and cached in
+trivia_seed.json until the dump changes.
+
+DatabaseTransaction wraps one test: everything it writes, commits included,
+happens inside a SAVEPOINT of an outer transaction that is rolled back when
+the test ends, so each test starts from the same seed.
+
+AsyncAppFixture runs the async app (flaskr/asgi.py) for one test, on its own
+copy of a seeded SQLite file, since the SAVEPOINT trick can't span the two
+engines. Its client is synchronous, so the contract tests run unchanged.
+'''
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from sqlalchemy import create_engine, event, orm
+
+from flaskr import create_app
+from models import db, Question, Category
+
+try:
+    from flaskr.asgi import create_async_app
+except ImportError:  # pragma: no cover - Quart comes from requirements-async.txt
+    create_async_app = None
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SEED_DUMP = os.path.join(BACKEND_DIR, 'trivia.psql')
+SEED_SNAPSHOT = os.path.join(BACKEND_DIR, 'trivia_seed.json')
+TEST_DATABASE_URI = os.environ.get('TRIVIA_TEST_DATABASE_URL', 'sqlite://')
+# 'sqlite' runs the suite against the shared bucket store of the rate limiter
+TEST_RATELIMIT_BACKEND = os.environ.get('TRIVIA_TEST_RATELIMIT_BACKEND', 'memory')
+
+COPY_ESCAPES = {'\\t': '\t', '\\n': '\n', '\\r': '\r', '\\\\': '\\'}
+
+
+def _copy_value(value):
+    if value == '\\N':
+        return None
+    for escaped, char in COPY_ESCAPES.items():
+        value = value.replace(escaped, char)
+    return value
+
+
+'''
+parse_copy_blocks(dump)
+    rows of the COPY ... FROM stdin blocks of a pg_dump, by table name, as
+    lists of {column: text value} dicts
+'''
+def parse_copy_blocks(dump):
+    tables = {}
+    rows = None
+    for line in dump.splitlines():
+        if rows is None:
+            if line.startswith('COPY '):
+                name, columns = line[len('COPY '):].split(' (', 1)
+                columns = columns.split(')', 1)[0].split(', ')
+                rows = tables[name.split('.')[-1]] = []
+        elif line == '\\.':
+            rows = None
+        else:
+            rows.append(dict(zip(columns, map(_copy_value, line.split('\t')))))
+    return tables
+
+
+def load_seed():
+    with open(SEED_DUMP, 'rb') as f:
+        dump = f.read()
+    digest = hashlib.sha1(dump).hexdigest()
+    try:
+        with open(SEED_SNAPSHOT) as f:
+            snapshot = json.load(f)
+        if snapshot['source_sha1'] == digest:
+            return snapshot
+    except (OSError, ValueError, KeyError):
+        pass
+
+    tables = parse_copy_blocks(dump.decode('utf-8'))
+    snapshot = {
+        'source_sha1': digest,
+        'categories': [{'id': int(row['id']), 'type': row['type']} for row in tables['categories']],
+        'questions': [dict(row, id=int(row['id']), difficulty=int(row['difficulty']), category=int(row['category']))
+                      for row in tables['questions']],
+    }
+    with open(SEED_SNAPSHOT, 'w') as f:
+        json.dump(snapshot, f)
+    return snapshot
+
+
+def _enable_sqlite_savepoints(engine):
+    # pysqlite issues its own BEGIN lazily, which breaks SAVEPOINT; let
+    # SQLAlchemy emit the transaction statements instead
+    raw = engine.raw_connection()
+    raw.connection.isolation_level = None
+    raw.close()
+
+    @event.listens_for(engine, 'connect')
+    def disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin(conn):
+        conn.execute('BEGIN')
+
+
+@functools.lru_cache(maxsize=None)
+def create_test_app():
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': TEST_DATABASE_URI,
+        # In-memory SQLite shares one connection between the app and the
+        # test transaction (StaticPool); the tests roll back explicitly
+        'SQLALCHEMY_ENGINE_OPTIONS': {'pool_reset_on_return': None},
+        'RATELIMIT_BACKEND': TEST_RATELIMIT_BACKEND,
+        'RATELIMIT_SQLITE_PATH': os.path.join(tempfile.mkdtemp(), 'rate_limit.db'),
+    })
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            _enable_sqlite_savepoints(db.engine)
+        if not db.session.query(Question.id).first():
+            seed = load_seed()
+            db.session.execute(Category.__table__.insert(), seed['categories'])
+            db.session.execute(Question.__table__.insert(), seed['questions'])
+            db.session.commit()
+    return app
+
+
+class DatabaseTransaction:
+    def __init__(self, app):
+        self.app = app
+
+    def start(self):
+        self.context = self.app.app_context()
+        self.context.push()
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+
+        # The app's commits and rollbacks end the SAVEPOINT; open a new one
+        self.factory = db.create_session({'bind': self.connection, 'binds': {}})
+        event.listen(self.factory, 'after_transaction_end', self.restart_savepoint)
+        self.app_session = db.session
+        db.session = orm.scoped_session(self.factory)
+        self.begin_savepoint(db.session())
+
+        # Per-app state that must not outlive the test
+        self.config = dict(self.app.config)
+        self.app.extensions['quiz_decks'].invalidate()
+        self.app.extensions['rate_limit'].reset()
+
+    def stop(self):
+        db.session.remove()
+        db.session = self.app_session
+        self.transaction.rollback()
+        self.connection.close()
+        self.app.config.clear()
+        self.app.config.update(self.config)
+        self.context.pop()
+
+    @classmethod
+    def restart_savepoint(cls, session, transaction):
+        if transaction.nested and not transaction.parent.nested:
+            session.expire_all()
+            cls.begin_savepoint(session)
+
+    @staticmethod
+    def begin_savepoint(session):
+        # Emit the SAVEPOINT now rather than with the next query, so it
+        # doesn't count against the query budgets of the tests
+        session.begin_nested()
+        session.connection()
+
+
+@functools.lru_cache(maxsize=None)
+def seeded_database_file():
+    path = os.path.join(tempfile.mkdtemp(), 'trivia.db')
+    engine = create_engine('sqlite:///' + path)
+    db.metadata.create_all(engine)
+    seed = load_seed()
+    with engine.begin() as conn:
+        conn.execute(Category.__table__.insert(), seed['categories'])
+        conn.execute(Question.__table__.insert(), seed['questions'])
+    engine.dispose()
+    return path
+
+
+TestResponse = namedtuple('TestResponse', ['status_code', 'headers', 'data'])
+
+
+class SyncTestClient:
+    '''
+    The subset of Flask's test client the contract tests use, driving a Quart
+    test client on the fixture's event loop.
+    '''
+
+    def __init__(self, client, run):
+        self.client = client
+        self.run = run
+
+    def open(self, path, method, headers=None, data=None):
+        async def request():
+            response = await self.client.open('/' + path.lstrip('/'), method=method, headers=headers, data=data)
+            return TestResponse(response.status_code, response.headers, await response.get_data())
+        return self.run(request())
+
+    def get(self, path, **kwargs):
+        return self.open(path, 'GET', **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.open(path, 'POST', **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.open(path, 'DELETE', **kwargs)
+
+
+class AsyncAppFixture:
+    '''
+    One test's async app. A sync app bound to the same database file is
+    pushed too, for the tests' own Question.query checks.
+    '''
+
+    def start(self):
+        self.directory = tempfile.mkdtemp()
+        path = os.path.join(self.directory, 'trivia.db')
+        shutil.copy(seeded_database_file(), path)
+        config = {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path,
+            'RATELIMIT_BACKEND': TEST_RATELIMIT_BACKEND,
+            'RATELIMIT_SQLITE_PATH': os.path.join(self.directory, 'rate_limit.db'),
+        }
+        self.sync_app = create_app(dict(config))
+        self.context = self.sync_app.app_context()
+        self.context.push()
+
+        self.app = create_async_app(dict(config))
+        self.loop = asyncio.new_event_loop()
+        self.test_app = self.app.test_app()
+        self.run(self.test_app.startup())
+        self.client = SyncTestClient(self.test_app.test_client(), self.run)
+
+    def stop(self):
+        self.run(self.test_app.shutdown())
+        self.loop.close()
+        db.session.remove()
+        db.get_engine(self.sync_app).dispose()
+        self.context.pop()
+        shutil.rmtree(self.directory)
+
+    def run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
@@ -1,15 +1,30 @@
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort
 from flask_cors import CORS
-from models import setup_db, Question, Category
-import random
-
-QUESTIONS_PER_PAGE = 10
+from models import setup_db, use_primary, unit_of_work, Question, Category
+from flaskr import contract
+from flaskr.contract import QUESTIONS_PER_PAGE
+from flaskr.json_provider import init_json, json_response
+from flaskr.compression import init_compression
+from flaskr.etags import versioned
+from flaskr.decks import init_decks
+from flaskr.rate_limit import init_rate_limit
+from query_stats import init_query_stats
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    test_config = test_config or {}
+    app.config.update(test_config)
+    if 'SQLALCHEMY_DATABASE_URI' in test_config:
+        setup_db(app, test_config['SQLALCHEMY_DATABASE_URI'], test_config.get('REPLICA_DATABASE_URIS', ()))
+    else:
+        setup_db(app)
+    init_json(app)
+    init_query_stats(app)
+    init_compression(app)
+    init_decks(app)
+    init_rate_limit(app)
     CORS(app, resources={r'/*': {'origins': '*'}})
 
     @app.after_request
@@ -23,57 +38,39 @@ def create_app(test_config=None):
     # ROUTES
     # ----------------------------------------------------
     @app.route('/categories', methods=['GET'])
+    @versioned
     def get_categories():
         try:
-            cats = Category.query.all()
+            cat_dict = Category.get_type_dict()
         except Exception as e:
             app.log_exception(e)
             abort(500, description=f'Failed to query Categories: {e}')
 
-        if cats is None:
-            abort(404, description='No categories found')
-
-        cat_dict = {cat.id: cat.type for cat in cats}
-        return jsonify({
-            'success': True,
-            'categories': cat_dict
-        })
+        return json_response(contract.categories_body(cat_dict))
 
     @app.route('/questions', methods=['GET'])
+    @versioned
     def get_questions():
+        start = contract.page_offset(request.args)
 
-        # Handle pagination by getting page argument from request - default to page 1
-        page_no = request.args.get('page', 1, int)
-        start = (page_no - 1) * QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
-
-        # Get all questions ordered by id
+        # Count all questions, but only fetch the rows of the requested page
         try:
-            questions = Question.query.order_by(Question.id).all()
+            total_questions = Question.get_total_questions()
+            rows = Question.query_rows().order_by(Question.id).offset(start).limit(QUESTIONS_PER_PAGE)
+            page_questions = [Question.format_row(row) for row in rows]
         except Exception as e:
             app.log_exception(e)
             abort(500, description=f'Failed to query Questions: {e}')
 
-        if not questions:
-            abort(404, description='No questions found')
-
-        # Build page for questions
-        page_questions = [question.format() for question in questions[start:end]]
-
         # Get categories as they are also needed for the response
-        categories = Category.query.all()
-        cat_dict = {cat.id: cat.type for cat in categories}
+        cat_dict = Category.get_type_dict()
 
-        return jsonify({
-            'success': True,
-            'questions': page_questions,
-            'total_questions': len(questions),
-            # 'current_category': 1,   # DON'T SEE A NEED FOR THIS??
-            'categories': cat_dict
-        })
+        return json_response(contract.questions_page_body(page_questions, total_questions, cat_dict))
 
     @app.route('/questions/<int:question_id>', methods=['DELETE'])
     def delete_question_by_id(question_id):
+        # Look the question up where it will be deleted, not on a lagging replica
+        use_primary()
         try:
             question = Question.query.get(question_id)
         except Exception as e:
@@ -85,50 +82,54 @@ def create_app(test_config=None):
 
         try:
             question.delete()
-            return jsonify(success=True)
+            return json_response({'success': True})
         except Exception as e:
             app.log_exception(e)
             abort(500, description=f'Failed to delete question: {e}')
 
-    @app.route('/questions', methods=['POST'])
-    def add_question():
-        if not request.json:
-            abort(400, description='Empty request')
+    @app.route('/questions', methods=['DELETE'])
+    def delete_questions_by_ids():
+        # Deletes all given questions in one transaction, or none of them
+        question_ids = contract.parse_question_ids(request.get_json(silent=True))
 
+        use_primary()
         try:
-            question = Question(
-                question=request.json['question'],
-                answer=request.json['answer'],
-                category=request.json['category'],
-                difficulty=request.json['difficulty']
-            )
-        except KeyError as e:
-            # Missing one of required parameters from request JSON
-            abort(422, description=f'Missing question parameter: {e}')
-        except (ValueError, TypeError) as e:
-            # Bad parameter given in JSON
-            abort(400, description=f'Bad parameter given: {e}')
+            questions = Question.query.filter(Question.id.in_(question_ids)).all()
+        except Exception as e:
+            app.log_exception(e)
+            abort(500, description=f'Failed to query questions: {e}')
+
+        contract.check_all_found(question_ids, [question.id for question in questions])
+
+        try:
+            with unit_of_work():
+                for question in questions:
+                    question.delete()
+        except Exception as e:
+            app.log_exception(e)
+            abort(500, description=f'Failed to delete questions: {e}')
+
+        return json_response(contract.deleted_body(question_ids))
+
+    @app.route('/questions', methods=['POST'])
+    def add_question():
+        question = contract.parse_new_question(request.get_json(silent=True))
 
         # Check that category is correct (i.e. exists in Categories)
+        use_primary()
         if not Category.query.get(question.category):
             abort(400, description=f'Invalid category given: <{question.category}>')
 
         try:
             question.insert()
-            return jsonify({
-                'success': True,
-                'new_question': question.format()
-            })
+            return json_response(contract.new_question_body(question))
         except Exception as e:
             app.log_exception(e)
             abort(500)
 
     @app.route('/questions/search', methods=['POST'])
     def get_questions_by_search():
-        if 'searchTerm' not in request.json.keys():
-            abort(422, description='Missing searchTerm')
-
-        search_term = request.json['searchTerm']
+        search_term = contract.parse_search_term(request.get_json(silent=True))
 
         # If searchTerm is blank, show all questions paginated
         if search_term == '':
@@ -136,111 +137,80 @@ def create_app(test_config=None):
 
         # Otherwise, lookup questions having the searchTerm and return ALL results
         try:
-            questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
+            rows = Question.query_rows(contract.search_filter(search_term))
+            formatted_questions = [Question.format_row(row) for row in rows]
         except Exception as e:
             app.log_exception(e)
             abort(500, description=f'Failed to query Questions: {e}')
 
-        formatted_questions = [question.format() for question in questions]
-        return jsonify({
-            'success': True,
-            'questions': formatted_questions,
-            'total_questions': len(questions)
-            # 'current_category': 1   # AGAIN, DON'T SEE A NEED FOR THIS
-        })
+        return json_response(contract.question_list_body(formatted_questions))
 
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
+    @versioned
     def get_questions_for_category(category_id):
         try:
-            questions = Question.query.filter_by(category=category_id).all()
+            rows = Question.query_rows(Question.category == category_id)
+            formatted_questions = [Question.format_row(row) for row in rows]
         except Exception as e:
             app.log_exception(e)
             abort(500, description=f'Failed to query Questions: {e}')
 
-        if not questions:
-            abort(404, description=f'No questions found under Category {category_id}')
+        contract.check_category_questions(formatted_questions, category_id)
 
-        formatted_questions = [question.format() for question in questions]
         try:
             category = Category.query.filter_by(id=category_id).one_or_none()
         except Exception as e:
             app.log_exception(e)
             abort(500, description=f'Failed to query Category: {e}')
 
-        return jsonify({
-            'success': True,
-            'questions': formatted_questions,
-            'total_questions': len(questions),
-            'current_category': category.format()
-        })
+        return json_response(contract.category_questions_body(formatted_questions, category))
 
     @app.route('/quizzes', methods=['POST'])
     def get_next_question():
-        try:
-            category = request.json['quiz_category']
-            prev_questions = request.json['previous_questions']
-        except KeyError as e:
-            abort(422, description=f'Missing required parameter: {e}')
+        quiz = contract.parse_quiz(request.get_json(silent=True))
 
+        # Draw an id from the category's deck (0 is all questions), skipping
+        # previous questions, and load only that row. Return null if none is left.
+        decks = app.extensions['quiz_decks']
+        next_question = None
         try:
-            # Get questions for the given category (if not 0), filtering out previous question ids
-            subquery = Question.query.filter(~Question.id.in_(prev_questions))
-            if category['id'] == 0:
-                available_questions = subquery.all()
-            else:
-                available_questions = subquery.filter(Question.category == category['id']).all()
+            for _ in range(2):
+                question_id = decks.draw(quiz.category_id, quiz.exclude, quiz.difficulties)[0]
+                if question_id is None:
+                    break
+                question = Question.query.get(question_id)
+                if question:
+                    next_question = question.format()
+                    break
+                # Deleted since the deck was built: rebuild and draw again
+                decks.invalidate()
         except Exception as e:
             app.log_exception(e)
             abort(500, description=f'Failed to query Question: {e}')
 
-        # Return random question if any available, else return null
-        questions_left = len(available_questions)
-        next_question = None
-        if questions_left > 0:
-            next_question = available_questions[random.randint(0, questions_left-1)].format()
-
-        return jsonify({
-            'success': True,
-            'question': next_question
-        })
+        return json_response(contract.quiz_body(next_question, quiz))
 
     # ----------------------------------------------------
     # ERROR HANDLERS
     # ----------------------------------------------------
+    def error_response(err, status):
+        app.logger.error(err)
+        return json_response(contract.error_body(err, status), status)
+
     @app.errorhandler(400)
     def bad_request_error(err):
-        app.logger.error(err)
-        return jsonify({
-            'success': False,
-            'error': 400,
-            'message': str(err)
-        }), 400
+        return error_response(err, 400)
 
     @app.errorhandler(404)
     def not_found_error(err):
-        app.logger.error(err)
-        return jsonify({
-            'success': False,
-            'error': 404,
-            'message': str(err)
-        }), 404
+        return error_response(err, 404)
 
     @app.errorhandler(422)
     def unprocessable_error(err):
-        app.logger.error(err)
-        return jsonify({
-            'success': False,
-            'error': 422,
-            'message': str(err)
-        }), 422
+        return error_response(err, 422)
 
     @app.errorhandler(500)
     def internal_error(err):
-        app.logger.error(err)
-        return jsonify({
-            'success': False,
-            'error': 500,
-            'message': str(err)
-        }), 500
+        return error_response(err, 500)
 
     return app
@@ -0,0 +1,307 @@
+'''
+Async (ASGI) serving mode for the trivia API.
+
+Same routes and JSON contract as create_app(), but handlers await the
+database through SQLAlchemy's asyncio extension, so a single worker keeps
+serving other requests while queries are in flight. Run it with an ASGI
+server, e.g.
+
+    pip install -r requirements-async.txt
+    hypercorn 'flaskr.asgi:create_async_app()'
+
+It needs SQLAlchemy 1.4+ and Quart, which do not fit the pins of
+requirements.txt, hence the separate requirements-async.txt.
+
+Request parsing and response bodies come from flaskr/contract.py, and the
+ETags, compression, quiz decks and rate limits use the same helpers as the
+sync app, so only the database access is written twice. test_flaskr.py runs
+its contract tests against both apps.
+'''
+import math
+from functools import wraps
+
+from quart import Quart, request, abort, jsonify, g
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import db, database_path, VersionedSession, DataVersion, Question, Category
+from flaskr import contract
+from flaskr.contract import QUESTIONS_PER_PAGE
+from flaskr.compression import configure_compression, compressible, compress
+from flaskr.decks import QuizDecks, DECK_QUERY
+from flaskr.etags import make_etag, matching_etag, not_modified, tag_response
+from flaskr.rate_limit import configure_rate_limit, check_limit, limited_body, add_limit_headers
+
+ASYNC_DRIVERS = {
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+QUESTION_ROW = select(Question.id, Question.question, Question.answer, Question.category, Question.difficulty)
+
+
+'''
+async_database_uri(uri)
+    maps the sync database URI used by setup_db to its asyncio driver
+    (asyncpg for Postgres, aiosqlite for SQLite)
+'''
+def async_database_uri(uri):
+    scheme, sep, rest = uri.partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+async def current_version(session):
+    return await session.scalar(DataVersion.current_query()) or 0
+
+
+def create_async_app(test_config=None):
+    app = Quart(__name__)
+    test_config = test_config or {}
+    app.config.update(test_config)
+    uri = test_config.get('SQLALCHEMY_DATABASE_URI', database_path)
+    engine = create_async_engine(async_database_uri(uri))
+    # VersionedSession bumps the data version on every write, like the sync
+    # app's sessions, so ETags and quiz decks see changes made here
+    Session = sessionmaker(engine, class_=AsyncSession, sync_session_class=VersionedSession,
+                           expire_on_commit=False)
+    app.config['ASYNC_ENGINE'] = engine
+    configure_compression(app.config)
+    decks = app.extensions['quiz_decks'] = QuizDecks()
+    rate_limit = app.extensions['rate_limit'] = configure_rate_limit(app.config)
+
+    @app.before_serving
+    async def create_tables():
+        # Same schema bootstrap as setup_db's db.create_all()
+        async with engine.begin() as conn:
+            await conn.run_sync(db.metadata.create_all)
+
+    @app.after_serving
+    async def dispose_engine():
+        await engine.dispose()
+
+    @app.before_request
+    async def check_rate_limit():
+        # The buckets are in memory or a local SQLite file: quick enough to
+        # check without leaving the event loop
+        checked = check_limit(rate_limit, app.config, request.method, request.endpoint, request.remote_addr)
+        if checked is None:
+            return None
+        limit, allowed, remaining, reset, retry_after = checked
+        g.rate_limit = (limit, remaining, reset)
+        if allowed:
+            return None
+        response = jsonify(limited_body(retry_after))
+        response.status_code = 429
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response
+
+    @app.after_request
+    async def after_request(response):
+        if 'rate_limit' in g:
+            add_limit_headers(response, *g.rate_limit)
+        if compressible(response):
+            compress(response, await response.get_data(), request.accept_encodings, app.config)
+        # set-up CORS headers
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, POST, PATCH, DELETE, OPTIONS')
+        return response
+
+    def versioned(view):
+        # etags.versioned(), reading the data version through an async session
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return await view(*args, **kwargs)
+
+            async with Session() as session:
+                etag = make_etag(await current_version(session), request.full_path)
+            matched = matching_etag(etag, request.if_none_match)
+            if matched:
+                return not_modified(app.response_class, matched)
+            return tag_response(await app.make_response(await view(*args, **kwargs)), etag)
+
+        return wrapper
+
+    async def get_category_dict(session):
+        result = await session.execute(select(Category.id, Category.type))
+        return {cat_id: cat_type for cat_id, cat_type in result}
+
+    # ----------------------------------------------------
+    # ROUTES
+    # ----------------------------------------------------
+    @app.route('/categories', methods=['GET'])
+    @versioned
+    async def get_categories():
+        try:
+            async with Session() as session:
+                cat_dict = await get_category_dict(session)
+        except Exception as e:
+            app.log_exception(e)
+            abort(500, description=f'Failed to query Categories: {e}')
+
+        return jsonify(contract.categories_body(cat_dict))
+
+    @app.route('/questions', methods=['GET'])
+    @versioned
+    async def get_questions():
+        start = contract.page_offset(request.args)
+
+        try:
+            async with Session() as session:
+                total_questions = await session.scalar(select(func.count(Question.id)))
+                rows = await session.execute(QUESTION_ROW.order_by(Question.id).offset(start).limit(QUESTIONS_PER_PAGE))
+                page_questions = [Question.format_row(row) for row in rows]
+                cat_dict = await get_category_dict(session)
+        except Exception as e:
+            app.log_exception(e)
+            abort(500, description=f'Failed to query Questions: {e}')
+
+        return jsonify(contract.questions_page_body(page_questions, total_questions, cat_dict))
+
+    @app.route('/questions/<int:question_id>', methods=['DELETE'])
+    async def delete_question_by_id(question_id):
+        try:
+            async with Session() as session:
+                question = await session.get(Question, question_id)
+                if question:
+                    await session.delete(question)
+                    await session.commit()
+        except Exception as e:
+            app.log_exception(e)
+            abort(500, description=f'Failed to delete question: {e}')
+
+        if not question:
+            abort(404, description=f'No question found with id {question_id}')
+        return jsonify(success=True)
+
+    @app.route('/questions', methods=['DELETE'])
+    async def delete_questions_by_ids():
+        # Deletes all given questions in one transaction, or none of them
+        question_ids = contract.parse_question_ids(await request.get_json(silent=True))
+
+        async with Session() as session:
+            try:
+                result = await session.execute(select(Question).filter(Question.id.in_(question_ids)))
+                questions = result.scalars().all()
+            except Exception as e:
+                app.log_exception(e)
+                abort(500, description=f'Failed to query questions: {e}')
+
+            contract.check_all_found(question_ids, [question.id for question in questions])
+
+            try:
+                for question in questions:
+                    await session.delete(question)
+                await session.commit()
+            except Exception as e:
+                app.log_exception(e)
+                abort(500, description=f'Failed to delete questions: {e}')
+
+        return jsonify(contract.deleted_body(question_ids))
+
+    @app.route('/questions', methods=['POST'])
+    async def add_question():
+        question = contract.parse_new_question(await request.get_json(silent=True))
+
+        async with Session() as session:
+            if not await session.get(Category, question.category):
+                abort(400, description=f'Invalid category given: <{question.category}>')
+            try:
+                session.add(question)
+                await session.commit()
+            except Exception as e:
+                app.log_exception(e)
+                abort(500)
+
+        return jsonify(contract.new_question_body(question))
+
+    @app.route('/questions/search', methods=['POST'])
+    async def get_questions_by_search():
+        search_term = contract.parse_search_term(await request.get_json(silent=True))
+
+        # If searchTerm is blank, show all questions paginated
+        if search_term == '':
+            return await get_questions()
+
+        try:
+            async with Session() as session:
+                rows = await session.execute(QUESTION_ROW.filter(contract.search_filter(search_term)))
+                formatted_questions = [Question.format_row(row) for row in rows]
+        except Exception as e:
+            app.log_exception(e)
+            abort(500, description=f'Failed to query Questions: {e}')
+
+        return jsonify(contract.question_list_body(formatted_questions))
+
+    @app.route('/categories/<int:category_id>/questions', methods=['GET'])
+    @versioned
+    async def get_questions_for_category(category_id):
+        try:
+            async with Session() as session:
+                rows = await session.execute(QUESTION_ROW.filter(Question.category == category_id))
+                formatted_questions = [Question.format_row(row) for row in rows]
+                contract.check_category_questions(formatted_questions, category_id)
+                category = await session.get(Category, category_id)
+        except Exception as e:
+            if getattr(e, 'code', None) == 404:
+                raise
+            app.log_exception(e)
+            abort(500, description=f'Failed to query Questions: {e}')
+
+        return jsonify(contract.category_questions_body(formatted_questions, category))
+
+    @app.route('/quizzes', methods=['POST'])
+    async def get_next_question():
+        quiz = contract.parse_quiz(await request.get_json(silent=True))
+
+        # Same decks as the sync app; they are rebuilt whenever the data
+        # version moved, as this app doesn't replay its own commits into them
+        next_question = None
+        try:
+            async with Session() as session:
+                version = await current_version(session)
+                for _ in range(2):
+                    if decks.needs_rebuild(version):
+                        decks.rebuild(version, (await session.execute(DECK_QUERY)).all())
+                    question_id = decks.pick(quiz.category_id, quiz.exclude, quiz.difficulties)[0]
+                    if question_id is None:
+                        break
+                    question = await session.get(Question, question_id)
+                    if question:
+                        next_question = question.format()
+                        break
+                    # Deleted since the deck was built: rebuild and draw again
+                    decks.invalidate()
+        except Exception as e:
+            app.log_exception(e)
+            abort(500, description=f'Failed to query Question: {e}')
+
+        return jsonify(contract.quiz_body(next_question, quiz))
+
+    # ----------------------------------------------------
+    # ERROR HANDLERS
+    # ----------------------------------------------------
+    def error_response(err, status):
+        app.logger.error(err)
+        return jsonify(contract.error_body(err, status)), status
+
+    @app.errorhandler(400)
+    async def bad_request_error(err):
+        return error_response(err, 400)
+
+    @app.errorhandler(404)
+    async def not_found_error(err):
+        return error_response(err, 404)
+
+    @app.errorhandler(422)
+    async def unprocessable_error(err):
+        return error_response(err, 422)
+
+    @app.errorhandler(500)
+    async def internal_error(err):
+        return error_response(err, 500)
+
+    return app
@@ -0,0 +1,71 @@
+'''
+Response compression for the trivia API.
+
+JSON responses larger than COMPRESS_MIN_SIZE bytes are compressed with the
+best encoding the client accepts: brotli when the brotli package is
+installed, gzip otherwise. Smaller bodies are sent as is, since the headers
+would eat most of the saving.
+'''
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/plain')
+
+ENCODERS = {'gzip': lambda data, config: gzip.compress(data, config['COMPRESS_GZIP_LEVEL'])}
+if brotli is not None:
+    ENCODERS['br'] = lambda data, config: brotli.compress(data, quality=config['COMPRESS_BR_QUALITY'])
+# Server preference, used when the client rates several encodings the same
+PREFERRED_ENCODINGS = [encoding for encoding in ('br', 'gzip') if encoding in ENCODERS]
+
+
+def compressible(response):
+    return response.mimetype in COMPRESSIBLE_MIMETYPES and not getattr(response, 'direct_passthrough', False)
+
+
+'''
+compress(response, data, accept_encodings, config)
+    replaces the body of a compressible response, whose bytes are `data`,
+    with its encoding in the best format the client accepts, if it is worth it
+'''
+def compress(response, data, accept_encodings, config):
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    if len(data) < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    encoding = accept_encodings.best_match(PREFERRED_ENCODINGS)
+    if encoding is None:
+        return response
+
+    response.set_data(ENCODERS[encoding](data, config))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        # A compressed body is a different representation: give it its own tag
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+def configure_compression(config):
+    config.setdefault('COMPRESS_MIN_SIZE', 500)
+    config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+    config.setdefault('COMPRESS_BR_QUALITY', 4)
+
+
+def init_compression(app):
+    configure_compression(app.config)
+
+    @app.after_request
+    def compress_response(response):
+        if not compressible(response):
+            return response
+        return compress(response, response.get_data(), request.accept_encodings, app.config)
+
+    return app
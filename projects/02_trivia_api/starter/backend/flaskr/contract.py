@@ -0,0 +1,179 @@
+'''
+The JSON contract of the trivia API, shared by create_app() and
+create_async_app().
+
+Both apps parse request bodies and build response bodies with these
+functions and only differ in how they reach the database, so a change to the
+contract is made once and covers both. Parsers abort() with the status the
+API documents for bad input; werkzeug's abort() works under Flask and Quart.
+'''
+from collections import namedtuple
+
+from werkzeug.exceptions import abort
+
+from models import Question
+from flaskr.decks import nearest_difficulties, target_difficulty
+
+QUESTIONS_PER_PAGE = 10
+
+'''
+Quiz(category_id, exclude, target, difficulties)
+    a parsed /quizzes request: target is the difficulty an adaptive quiz aims
+    at (None when not adaptive), difficulties the order decks are tried in
+'''
+Quiz = namedtuple('Quiz', ['category_id', 'exclude', 'target', 'difficulties'])
+
+
+def page_offset(args):
+    # Handle pagination by getting page argument from request - default to page 1
+    page_no = args.get('page', 1, int)
+    return max((page_no - 1) * QUESTIONS_PER_PAGE, 0)
+
+
+def categories_body(cat_dict):
+    if not cat_dict:
+        abort(404, description='No categories found')
+    return {
+        'success': True,
+        'categories': cat_dict
+    }
+
+
+def questions_page_body(page_questions, total_questions, cat_dict):
+    if not total_questions:
+        abort(404, description='No questions found')
+    return {
+        'success': True,
+        'questions': page_questions,
+        'total_questions': total_questions,
+        'categories': cat_dict
+    }
+
+
+def parse_question_ids(body):
+    try:
+        return [int(question_id) for question_id in body['question_ids']]
+    except (KeyError, TypeError) as e:
+        abort(422, description=f'Missing question_ids list: {e}')
+    except ValueError as e:
+        abort(400, description=f'Bad question id given: {e}')
+
+
+'''
+check_all_found(question_ids, found_ids)
+    a bulk delete removes all of the given questions or none of them
+'''
+def check_all_found(question_ids, found_ids):
+    missing = set(question_ids) - set(found_ids)
+    if missing:
+        abort(404, description=f'No questions found with ids {sorted(missing)}')
+
+
+def deleted_body(question_ids):
+    return {
+        'success': True,
+        'deleted': sorted(set(question_ids))
+    }
+
+
+def parse_new_question(body):
+    if not body:
+        abort(400, description='Empty request')
+    try:
+        return Question(
+            question=body['question'],
+            answer=body['answer'],
+            category=body['category'],
+            difficulty=body['difficulty']
+        )
+    except KeyError as e:
+        # Missing one of required parameters from request JSON
+        abort(422, description=f'Missing question parameter: {e}')
+    except (ValueError, TypeError) as e:
+        # Bad parameter given in JSON
+        abort(400, description=f'Bad parameter given: {e}')
+
+
+def new_question_body(question):
+    return {
+        'success': True,
+        'new_question': question.format()
+    }
+
+
+def parse_search_term(body):
+    if not body or 'searchTerm' not in body:
+        abort(422, description='Missing searchTerm')
+    return body['searchTerm']
+
+
+def search_filter(search_term):
+    return Question.question.ilike(f'%{search_term}%')
+
+
+def question_list_body(formatted_questions):
+    return {
+        'success': True,
+        'questions': formatted_questions,
+        'total_questions': len(formatted_questions)
+    }
+
+
+def check_category_questions(formatted_questions, category_id):
+    if not formatted_questions:
+        abort(404, description=f'No questions found under Category {category_id}')
+
+
+def category_questions_body(formatted_questions, category):
+    return {
+        'success': True,
+        'questions': formatted_questions,
+        'total_questions': len(formatted_questions),
+        'current_category': category.format()
+    }
+
+
+def parse_quiz(body):
+    try:
+        category = body['quiz_category']
+        prev_questions = body['previous_questions']
+    except (KeyError, TypeError) as e:
+        abort(422, description=f'Missing required parameter: {e}')
+
+    # The frontend sends category ids as the string keys of /categories
+    try:
+        category_id = int(category['id'])
+        exclude = {int(question_id) for question_id in prev_questions}
+    except (KeyError, TypeError, ValueError) as e:
+        abort(400, description=f'Bad parameter given: {e}')
+
+    # Adaptive mode: aim the difficulty at the player's running score,
+    # falling back to the nearest difficulties that have questions left
+    if not body.get('adaptive', False):
+        return Quiz(category_id, exclude, None, (None,))
+    try:
+        correct_answers = int(body.get('correct_answers', 0))
+    except (TypeError, ValueError) as e:
+        abort(400, description=f'Bad parameter given: {e}')
+    if not 0 <= correct_answers <= len(exclude):
+        abort(400, description='correct_answers must be between 0 and the number of previous questions')
+    target = target_difficulty(len(exclude), correct_answers)
+    return Quiz(category_id, exclude, target, nearest_difficulties(target))
+
+
+def quiz_body(next_question, quiz):
+    response = {
+        'success': True,
+        'question': next_question
+    }
+    if quiz.target is not None:
+        response['target_difficulty'] = quiz.target
+    return response
+
+
+def error_body(err, status):
+    return {
+        'success': False,
+        'error': status,
+        'message': str(err)
+    }
@@ -0,0 +1,232 @@
+'''
+Precomputed quiz decks.
+
+A deck is a compact array of question ids, one per category plus ALL for
+every question, and one per (category, difficulty) bucket for adaptive
+quizzes. /quizzes draws from them in memory and only fetches the chosen
+Question row.
+
+Decks follow the data version (models.DataVersion). Questions inserted or
+deleted through this process are applied to the decks incrementally when
+their transaction commits; a version moved by any other writer (another
+worker, a replica catching up) makes the decks rebuild from one
+(id, category) query on the next draw. The version and the rows come from
+the same pinned replica, and decks never go back to an older version: a
+request served by a replica behind the decks reads from the primary.
+'''
+import random
+import threading
+from array import array
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, select
+
+from models import db, use_primary, RoutingSession, DataVersion, Question
+
+ALL = 0
+DIFFICULTIES = range(1, 6)
+# Random picks tried before falling back to a scan of the remaining ids
+DRAW_ATTEMPTS = 8
+DECK_QUERY = select([Question.id, Question.category, Question.difficulty]).order_by(Question.id)
+
+
+'''
+target_difficulty(answered, correct)
+    difficulty an adaptive quiz should ask next: a staircase starting at the
+    middle difficulty, one step up per correct answer and one step down per
+    wrong one, within 1-5
+'''
+def target_difficulty(answered, correct):
+    wrong = answered - correct
+    return min(max(DIFFICULTIES[len(DIFFICULTIES) // 2] + correct - wrong, DIFFICULTIES[0]), DIFFICULTIES[-1])
+
+
+'''
+nearest_difficulties(target)
+    all difficulties, closest to target first, harder before easier on ties
+'''
+def nearest_difficulties(target):
+    return sorted(DIFFICULTIES, key=lambda difficulty: (abs(difficulty - target), -difficulty))
+
+
+class Deck:
+    '''
+    Question ids of one category. Removal swaps the last id into the freed
+    slot, so insert, delete and random access are all O(1).
+    '''
+
+    def __init__(self, ids=()):
+        self.ids = array('l', ids)
+        self.positions = {question_id: i for i, question_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, question_id):
+        if question_id not in self.positions:
+            self.positions[question_id] = len(self.ids)
+            self.ids.append(question_id)
+
+    def remove(self, question_id):
+        i = self.positions.pop(question_id, None)
+        if i is None:
+            return
+        last = self.ids.pop()
+        if last != question_id:
+            self.ids[i] = last
+            self.positions[last] = i
+
+    '''
+    draw(exclude)
+        a random id not in the `exclude` set, or None if none is left.
+        Expected O(1) while most of the deck is still available; when most
+        of it was excluded, picks from a scan of what is left.
+    '''
+    def draw(self, exclude):
+        if not self.ids:
+            return None
+        if len(exclude) < len(self.ids) // 2:
+            for _ in range(DRAW_ATTEMPTS):
+                question_id = self.ids[random.randrange(len(self.ids))]
+                if question_id not in exclude:
+                    return question_id
+        remaining = [question_id for question_id in self.ids if question_id not in exclude]
+        return random.choice(remaining) if remaining else None
+
+
+class QuizDecks:
+    def __init__(self):
+        self.decks = {}
+        self.version = None
+        # Set when the decks may not match self.version any more
+        self.stale = True
+        self.lock = threading.Lock()
+
+    '''
+    rebuild(version, rows)
+        replaces the decks with ones built from the (id, category,
+        difficulty) rows of DECK_QUERY, read at data version `version`,
+        unless they are current at a newer version already
+    '''
+    def rebuild(self, version, rows):
+        decks = {}
+        for question_id, category, difficulty in rows:
+            add_to_decks(decks, question_id, category, difficulty)
+        with self.lock:
+            if not self.stale and self.version is not None and version < self.version:
+                return
+            self.decks, self.version, self.stale = decks, version, False
+
+    def needs_rebuild(self, version):
+        return self.stale or version != self.version
+
+    '''
+    apply(changes, base, version)
+        replays a committed transaction's ('add', id, category, difficulty)
+        and ('remove', id, None, None) changes, if the decks were current up
+        to the transaction's start
+    '''
+    def apply(self, changes, base, version):
+        with self.lock:
+            if self.stale or self.version != base:
+                self.stale = True
+                return
+            for op, question_id, category, difficulty in changes:
+                if op == 'add':
+                    add_to_decks(self.decks, question_id, category, difficulty)
+                else:
+                    # A deleted row's category may be expired; there are only a few decks
+                    for deck in self.decks.values():
+                        deck.remove(question_id)
+            self.version = version
+
+    def invalidate(self):
+        with self.lock:
+            self.stale = True
+
+    '''
+    draw(category, exclude, difficulties)
+        an id of `category` not in `exclude`, trying each of `difficulties`
+        in turn (None: any difficulty). Returns (id, difficulty), with id
+        None when nothing is left.
+    '''
+    def draw(self, category, exclude, difficulties=(None,)):
+        version = DataVersion.current()
+        if self.version is not None and version < self.version:
+            # This request's replica is behind the decks and may lack rows
+            # they hold: read the version, and the drawn row, from the primary
+            use_primary()
+            version = DataVersion.current()
+        if self.needs_rebuild(version):
+            self.rebuild(version, db.session.execute(DECK_QUERY))
+        return self.pick(category, exclude, difficulties)
+
+    '''
+    pick(category, exclude, difficulties)
+        draw() from the decks as they are, for callers that keep them
+        current themselves (the async app)
+    '''
+    def pick(self, category, exclude, difficulties=(None,)):
+        with self.lock:
+            for difficulty in difficulties:
+                deck = self.decks.get(category if difficulty is None else (category, difficulty))
+                question_id = deck.draw(exclude) if deck else None
+                if question_id is not None:
+                    return question_id, difficulty
+        return None, None
+
+
+def add_to_decks(decks, question_id, category, difficulty):
+    for key in (ALL, category, (ALL, difficulty), (category, difficulty)):
+        deck = decks.get(key)
+        if deck is None:
+            deck = decks[key] = Deck()
+        deck.add(question_id)
+
+
+def init_decks(app):
+    app.extensions['quiz_decks'] = QuizDecks()
+    return app
+
+
+def _app_decks():
+    if has_app_context():
+        return current_app.extensions.get('quiz_decks')
+    return None
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def record_question_changes(session, flush_context):
+    changes = session.info.setdefault('quiz_deck_changes', [])
+    for obj in session.new:
+        if isinstance(obj, Question):
+            changes.append(('add', obj.id, obj.category, obj.difficulty))
+    for obj in session.deleted:
+        if isinstance(obj, Question):
+            # the identity key, as the deleted row can't be refreshed any more
+            changes.append(('remove', inspect(obj).identity[0], None, None))
+    for obj in session.dirty:
+        if isinstance(obj, Question):
+            attrs = inspect(obj).attrs
+            if attrs.category.history.has_changes() or attrs.difficulty.history.has_changes():
+                # Moved to another deck: let the next draw rebuild
+                session.info['quiz_decks_stale'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def apply_question_changes(session):
+    changes = session.info.pop('quiz_deck_changes', None)
+    stale = session.info.pop('quiz_decks_stale', False)
+    decks = _app_decks()
+    if decks is None or not (changes or stale):
+        return
+    if stale or 'data_version' not in session.info:
+        decks.invalidate()
+    else:
+        decks.apply(changes, session.info['data_version_base'], session.info['data_version'])
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def discard_question_changes(session, previous_transaction):
+    session.info.pop('quiz_deck_changes', None)
+    session.info.pop('quiz_decks_stale', None)
@@ -0,0 +1,69 @@
+'''
+Conditional GET for the trivia list endpoints.
+
+versioned() tags a view's responses with a strong ETag made of the data
+version (models.DataVersion) and the request URL. A client presenting a tag
+that still matches gets an empty 304 before the view runs any of its
+queries. compression.py suffixes the tag of compressed bodies with their
+encoding, so those suffixed tags are accepted too.
+
+The async app (flaskr/asgi.py) reads the version through its own session
+and wraps its views with the same helpers.
+'''
+import hashlib
+from functools import wraps
+
+from flask import current_app, request
+
+from models import DataVersion
+from flaskr.compression import ENCODERS
+
+
+def make_etag(version, full_path):
+    key = f'{version}:{full_path}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+'''
+matching_etag(etag, if_none_match)
+    the tag of the client's If-None-Match that is `etag`, plain or with a
+    compression suffix, or None when the client's copy is stale
+'''
+def matching_etag(etag, if_none_match):
+    for candidate in [etag] + [f'{etag}-{encoding}' for encoding in ENCODERS]:
+        if if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def not_modified(response_class, etag):
+    response = response_class(status=304, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+def tag_response(response, etag):
+    if response.status_code == 200:
+        response.set_etag(etag)
+        # Cacheable, but revalidate every time: the version may move at any moment
+        response.cache_control.no_cache = True
+    return response
+
+
+def versioned(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            # e.g. a blank search falling back to the question list
+            return view(*args, **kwargs)
+
+        # db.session reads from one pinned replica (models.RoutingSession), so
+        # the version and the body come from the same point of replication
+        etag = make_etag(DataVersion.current(), request.full_path)
+        matched = matching_etag(etag, request.if_none_match)
+        if matched:
+            return not_modified(current_app.response_class, matched)
+        return tag_response(current_app.make_response(view(*args, **kwargs)), etag)
+
+    return wrapper
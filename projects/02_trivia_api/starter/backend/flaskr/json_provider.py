@@ -0,0 +1,55 @@
+'''
+Fast JSON encoding for the trivia API.
+
+Uses orjson when it is installed and falls back to the stdlib json module
+otherwise. Output matches jsonify's compact, key-sorted form so responses are
+unchanged byte for byte apart from whitespace.
+
+The app's routes, error handlers and rate limit answers all respond through
+json_response(), so the fast path runs on every Flask release, including
+the 1.0 pinned by requirements.txt, which has no provider hook. On Flask
+2.2+ init_json() also installs it as the app's JSON provider, for jsonify()
+calls made by extensions.
+'''
+import json
+
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:  # Flask < 2.2
+    DefaultJSONProvider = None
+
+ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, option=ORJSON_OPTIONS)
+    return json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(obj, status=200):
+    return current_app.response_class(dumps(obj), status=status, mimetype='application/json')
+
+
+if DefaultJSONProvider is not None:
+    class FastJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            return dumps(obj).decode('utf-8')
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+def init_json(app):
+    if DefaultJSONProvider is not None:
+        app.json = FastJSONProvider(app)
@@ -0,0 +1,210 @@
+'''
+Token bucket rate limiting for the trivia API.
+
+Every client IP gets one bucket per route. A bucket holds up to `capacity`
+tokens and refills at capacity / period tokens per second; each request
+takes one token and is answered 429 when none is left. Expensive routes
+(search runs a full-table ILIKE, quizzes hit the database on every draw)
+get smaller buckets than RATELIMIT_DEFAULT, see RATELIMIT_ENDPOINTS.
+
+Responses carry RateLimit-Limit / RateLimit-Remaining / RateLimit-Reset
+headers, and Retry-After when limited.
+
+The async app (flaskr/asgi.py) hooks the same check_limit() into Quart.
+
+Buckets live in a backend: MemoryBackend keeps them in the process, which
+is enough for a single worker. SQLiteBackend keeps them in a file shared by
+all workers on a host, and stands in for a networked store (e.g. Redis)
+behind the same consume() interface.
+'''
+import math
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from flask import g, request
+
+from flaskr.json_provider import json_response
+
+Limit = namedtuple('Limit', ['capacity', 'period'])
+
+
+def refill(tokens, updated, limit, now):
+    return min(limit.capacity, tokens + (now - updated) * limit.capacity / limit.period)
+
+
+'''
+take(tokens, limit)
+    takes a token from a bucket holding `tokens`. Returns
+    (allowed, tokens left, seconds until the bucket is full again,
+    seconds until the next token if denied)
+'''
+def take(tokens, limit):
+    per_token = limit.period / limit.capacity
+    if tokens >= 1:
+        tokens -= 1
+        return True, tokens, (limit.capacity - tokens) * per_token, 0
+    return False, tokens, (limit.capacity - tokens) * per_token, (1 - tokens) * per_token
+
+
+class MemoryBackend:
+    '''
+    Buckets in a dict, guarded by striped locks so that requests from
+    different clients rarely wait on each other.
+    '''
+    STRIPES = 64
+    # Full, idle buckets are dropped once the dict grows past this
+    MAX_KEYS = 100000
+
+    def __init__(self):
+        # {key: (tokens, updated, period)}
+        self.buckets = {}
+        self.locks = [threading.Lock() for _ in range(self.STRIPES)]
+        self.next_prune = 0
+
+    def lock(self, key):
+        return self.locks[hash(key) % self.STRIPES]
+
+    def consume(self, key, limit, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock(key):
+            tokens, updated, _ = self.buckets.get(key, (limit.capacity, now, limit.period))
+            result = take(refill(tokens, updated, limit, now), limit)
+            self.buckets[key] = (result[1], now, limit.period)
+        if len(self.buckets) > self.MAX_KEYS and now >= self.next_prune:
+            self.next_prune = now + limit.period
+            self.prune(now)
+        return result
+
+    def prune(self, now):
+        # A bucket idle for a whole period of its own limit is full again:
+        # forgetting it is free
+        for key, (_, updated, period) in list(self.buckets.items()):
+            if now - updated < period:
+                continue
+            with self.lock(key):
+                # Recheck under the lock: it may have been used meanwhile
+                bucket = self.buckets.get(key)
+                if bucket is not None and now - bucket[1] >= bucket[2]:
+                    del self.buckets[key]
+
+    def reset(self):
+        for lock in self.locks:
+            lock.acquire()
+        try:
+            self.buckets.clear()
+            self.next_prune = 0
+        finally:
+            for lock in self.locks:
+                lock.release()
+
+
+class SQLiteBackend:
+    '''
+    Buckets in a SQLite file, updated in IMMEDIATE transactions so that
+    concurrent workers serialize on each read-modify-write.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self.connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS rate_limit_buckets '
+                         '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        return conn
+
+    def consume(self, key, limit, now=None):
+        # wall clock time: monotonic clocks are not comparable across processes
+        now = time.time() if now is None else now
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (limit.capacity, now)
+            result = take(refill(tokens, updated, limit, now), limit)
+            conn.execute('INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, result[1], now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def reset(self):
+        self.connect().execute('DELETE FROM rate_limit_buckets')
+
+
+def create_backend(config):
+    if config['RATELIMIT_BACKEND'] == 'sqlite':
+        return SQLiteBackend(config['RATELIMIT_SQLITE_PATH'])
+    return MemoryBackend()
+
+
+def configure_rate_limit(config):
+    config.setdefault('RATELIMIT_ENABLED', True)
+    config.setdefault('RATELIMIT_BACKEND', 'memory')
+    config.setdefault('RATELIMIT_SQLITE_PATH', 'rate_limit.db')
+    config.setdefault('RATELIMIT_DEFAULT', Limit(120, 60))
+    config.setdefault('RATELIMIT_ENDPOINTS', {
+        'get_questions_by_search': Limit(20, 60),
+        'get_next_question': Limit(60, 60),
+    })
+    return create_backend(config)
+
+
+'''
+check_limit(backend, config, method, endpoint, remote_addr)
+    takes a token for the request. Returns None when the request is not
+    limited at all, otherwise (limit, allowed, remaining, reset, retry_after)
+'''
+def check_limit(backend, config, method, endpoint, remote_addr):
+    if not config['RATELIMIT_ENABLED'] or method == 'OPTIONS' or endpoint is None:
+        return None
+    limit = config['RATELIMIT_ENDPOINTS'].get(endpoint, config['RATELIMIT_DEFAULT'])
+    return (limit,) + backend.consume(f'{remote_addr}:{endpoint}', limit)
+
+
+def limited_body(retry_after):
+    return {
+        'success': False,
+        'error': 429,
+        'message': f'Too many requests, retry in {math.ceil(retry_after)} seconds'
+    }
+
+
+def add_limit_headers(response, limit, remaining, reset):
+    response.headers['RateLimit-Limit'] = str(limit.capacity)
+    response.headers['RateLimit-Remaining'] = str(int(remaining))
+    response.headers['RateLimit-Reset'] = str(math.ceil(reset))
+    return response
+
+
+def init_rate_limit(app):
+    backend = configure_rate_limit(app.config)
+    app.extensions['rate_limit'] = backend
+
+    @app.before_request
+    def check_rate_limit():
+        checked = check_limit(backend, app.config, request.method, request.endpoint, request.remote_addr)
+        if checked is None:
+            return None
+        limit, allowed, remaining, reset, retry_after = checked
+        g.rate_limit = (limit, remaining, reset)
+        if allowed:
+            return None
+        response = json_response(limited_body(retry_after), 429)
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response
+
+    @app.after_request
+    def add_rate_limit_headers(response):
+        if 'rate_limit' in g:
+            add_limit_headers(response, *g.rate_limit)
+        return response
+
+    return app
@@ -1,31 +1,119 @@
-from sqlalchemy import Column, String, Integer
-from flask_sqlalchemy import SQLAlchemy
+import os
+import random
+from contextlib import contextmanager
+from itertools import chain
+from sqlalchemy import Column, String, Integer, event, orm, select
+from sqlalchemy.sql import Select
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 
 database_name = "trivia"
 database_path = "postgres://{}/{}".format('localhost:5432', database_name)
+# Comma separated URIs of read replicas of database_path, if any
+replica_paths = [path for path in os.environ.get('TRIVIA_REPLICA_URIS', '').split(',') if path]
 
-db = SQLAlchemy()
+
+class RoutingSession(SignallingSession):
+    '''
+    Sends plain SELECTs to a read replica (the REPLICA_BINDS of the app
+    config) and everything else to the primary. The replica is picked at
+    random once per session, so all the reads of a request see the same
+    point of replication. Once a session has written, or use_primary() was
+    called, it reads from the primary too, so a request always sees its own
+    writes despite replication lag.
+    '''
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        replicas = self.app.config.get('REPLICA_BINDS')
+        if not replicas or self.info.get('use_primary'):
+            return super().get_bind(mapper, clause)
+        if self._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None:
+            self.info['use_primary'] = True
+            return super().get_bind(mapper, clause)
+        if self.info.get('replica') not in replicas:
+            self.info['replica'] = random.choice(replicas)
+        return self.db.get_engine(self.app, bind=self.info['replica'])
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
 
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    replica_paths, if given, are read-only copies of database_path that
+    serve the reads (see RoutingSession)
 '''
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, replica_paths=replica_paths):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    binds = {f'replica_{i}': path for i, path in enumerate(replica_paths)}
+    app.config["SQLALCHEMY_BINDS"] = binds
+    app.config["REPLICA_BINDS"] = list(binds)
     db.app = app
     db.init_app(app)
     db.create_all()
 
 
+'''
+use_primary()
+    makes the current session read from the primary for the rest of its
+    life, for reads that must not lag behind a write about to happen
+'''
+def use_primary():
+    db.session.info['use_primary'] = True
+
+
+'''
+unit_of_work()
+    groups the insert(), update() and delete() calls made inside it into a
+    single transaction that is flushed and committed once on exit, or rolled
+    back if the block raises. Nested blocks join the outermost one.
+    EXAMPLE
+        with unit_of_work():
+            for question in questions:
+                question.insert()
+'''
+@contextmanager
+def unit_of_work():
+    session = db.session
+    depth = session.info.get('unit_of_work_depth', 0)
+    session.info['unit_of_work_depth'] = depth + 1
+    try:
+        yield session
+        if depth == 0:
+            session.commit()
+    except Exception:
+        if depth == 0:
+            session.rollback()
+        raise
+    finally:
+        session.info['unit_of_work_depth'] = depth
+
+
+'''
+commit()
+    commits the session unless a unit_of_work() is collecting the changes
+'''
+def commit():
+    if not db.session.info.get('unit_of_work_depth'):
+        db.session.commit()
+
+
 class Question(db.Model):
     __tablename__ = 'questions'
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer)
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -42,14 +130,14 @@ class Question(db.Model):
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        commit()
 
     def update(self):
-        db.session.commit()
+        commit()
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        commit()
 
     def format(self):
         return {
@@ -60,13 +148,32 @@ class Question(db.Model):
             'difficulty': self.difficulty
         }
 
+    '''
+    query_rows(*criteria)
+        read-only query of the columns format() needs as plain row tuples,
+        skipping ORM object hydration and identity-map bookkeeping
+    '''
+    @classmethod
+    def query_rows(cls, *criteria):
+        return db.session.query(cls.id, cls.question, cls.answer, cls.category, cls.difficulty).filter(*criteria)
+
+    @staticmethod
+    def format_row(row):
+        return {
+            'id': row[0],
+            'question': row[1],
+            'answer': row[2],
+            'category': row[3],
+            'difficulty': row[4]
+        }
+
     @classmethod
     def get_max_id(cls):
         return cls.query.order_by(Question.id.desc())[0].id
 
     @classmethod
     def get_total_questions(cls):
-        return len(cls.query.all())
+        return db.session.query(db.func.count(cls.id)).scalar()
 
 
 class Category(db.Model):
@@ -83,3 +190,62 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
         }
+
+    @classmethod
+    def get_type_dict(cls):
+        return dict(db.session.query(cls.id, cls.type))
+
+
+class DataVersion(db.Model):
+    '''
+    Single row counter bumped in the same transaction as every change to
+    questions or categories. Responses built from them are tagged with it, so
+    clients can revalidate a cached page with one cheap query.
+    '''
+    __tablename__ = 'data_version'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+    @classmethod
+    def current(cls):
+        return db.session.execute(cls.current_query()).scalar() or 0
+
+    @classmethod
+    def current_query(cls):
+        return select([cls.version]).where(cls.id == 1)
+
+
+class VersionedSession(orm.Session):
+    '''
+    Plain session that bumps the data version like RoutingSession does, for
+    engines outside Flask-SQLAlchemy such as the one of the async app.
+    '''
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+@event.listens_for(VersionedSession, 'before_flush')
+def bump_data_version(session, flush_context, instances):
+    changed = chain(session.new, session.dirty, session.deleted)
+    if not any(isinstance(obj, (Question, Category)) for obj in changed):
+        return
+    table = DataVersion.__table__
+    result = session.execute(table.update().where(table.c.id == 1).values(version=table.c.version + 1))
+    if result.rowcount:
+        version = session.execute(select([table.c.version]).where(table.c.id == 1)).scalar()
+    else:
+        version = 1
+        session.add(DataVersion(id=1, version=1))
+    # The row stays locked until commit, so the versions of one transaction
+    # are consecutive: in-process caches at data_version_base can catch up
+    # to data_version by replaying the transaction's changes.
+    session.info.setdefault('data_version_base', version - 1)
+    session.info['data_version'] = version
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+@event.listens_for(VersionedSession, 'after_transaction_end')
+def forget_data_version(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('data_version_base', None)
+        session.info.pop('data_version', None)
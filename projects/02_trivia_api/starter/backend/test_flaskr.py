@@ -1,9 +1,18 @@
+import gzip
+import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 import json
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine
 
+from fixtures import create_test_app, create_async_app, AsyncAppFixture, DatabaseTransaction
 from flaskr import create_app
-from models import setup_db, Question
+from flaskr.etags import make_etag
+from flaskr.rate_limit import Limit, MemoryBackend, SQLiteBackend
+from models import db, unit_of_work, DataVersion, Question, Category
+from query_stats import assert_max_queries, assert_no_repeated_queries
 
 
 HEADERS = {'Content-Type': 'application/json'}
@@ -12,24 +21,20 @@ HEADERS = {'Content-Type': 'application/json'}
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
-    def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
-        self.database_name = "trivia_test"
-        self.database_path = "postgres://{}/{}".format('localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+    @classmethod
+    def setUpClass(cls):
+        """Build the app and seed its database once for the whole run"""
+        cls.app = create_test_app()
+        cls.client = cls.app.test_client
 
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
+    def setUp(self):
+        """Run each test in a transaction of its own"""
+        self.transaction = DatabaseTransaction(self.app)
+        self.transaction.start()
 
     def tearDown(self):
-        """Executed after reach test"""
-        pass
+        """Roll back everything the test wrote"""
+        self.transaction.stop()
 
     """
     TODO
@@ -109,6 +114,110 @@ class TriviaTestCase(unittest.TestCase):
         res = self.client().delete('/questions/10000')
         self.assertEqual(res.status_code, 404)
 
+    def test_bulk_delete_questions(self):
+        new_question = {'question': 'Bulk?', 'answer': 'Yes', 'difficulty': 1, 'category': 1}
+        ids = []
+        for _ in range(2):
+            res = self.client().post('/questions', headers=HEADERS, data=json.dumps(new_question))
+            ids.append(json.loads(res.data)['new_question']['id'])
+
+        res = self.client().delete('/questions', headers=HEADERS, data=json.dumps({'question_ids': ids}))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], ids)
+        self.assertEqual(Question.query.filter(Question.id.in_(ids)).count(), 0)
+
+    def test_bulk_delete_with_nonexisting_question(self):
+        max_question_id = Question.get_max_id()
+        res = self.client().delete('/questions', headers=HEADERS,
+                                   data=json.dumps({'question_ids': [max_question_id, 10000]}))
+
+        self.assertEqual(res.status_code, 404)
+        self.assertIsNotNone(Question.query.get(max_question_id))
+
+    def test_bulk_delete_missing_ids(self):
+        res = self.client().delete('/questions', headers=HEADERS, data=json.dumps({}))
+        self.assertEqual(res.status_code, 422)
+
+    def test_unit_of_work_rolls_back(self):
+        total_questions = Question.get_total_questions()
+        with self.assertRaises(RuntimeError):
+            with unit_of_work():
+                Question('Rolled back?', 'Yes', 1, 1).insert()
+                raise RuntimeError('abort the batch')
+        self.assertEqual(Question.get_total_questions(), total_questions)
+
+    def test_questions_query_budget(self):
+        # data version, count, one page of questions and the categories
+        with assert_max_queries(4), assert_no_repeated_queries():
+            res = self.client().get('/questions?page=2')
+        self.assertEqual(res.status_code, 200)
+
+    def test_category_questions_query_budget(self):
+        with assert_max_queries(3):
+            res = self.client().get('/categories/1/questions')
+        self.assertEqual(res.status_code, 200)
+
+    def test_quiz_query_budget(self):
+        quiz = {'quiz_category': {'id': 0}, 'previous_questions': []}
+        self.client().post('/quizzes', headers=HEADERS, data=json.dumps(quiz))
+        # data version and the drawn row, once the decks are built
+        with assert_max_queries(2):
+            res = self.client().post('/quizzes', headers=HEADERS, data=json.dumps(quiz))
+        self.assertEqual(res.status_code, 200)
+
+    def test_unchanged_questions_not_modified(self):
+        res = self.client().get('/questions')
+        etag = res.headers['ETag']
+
+        with assert_max_queries(1):
+            res = self.client().get('/questions', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+        self.assertFalse(res.data)
+
+    def test_etag_changes_after_write(self):
+        etag = self.client().get('/questions').headers['ETag']
+        new_question = {'question': 'Changed?', 'answer': 'Yes', 'difficulty': 1, 'category': 1}
+        self.client().post('/questions', headers=HEADERS, data=json.dumps(new_question))
+
+        res = self.client().get('/questions', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_gzip_compressed_questions(self):
+        res = self.client().get('/questions', headers={'Accept-Encoding': 'gzip'})
+        data = json.loads(gzip.decompress(res.data))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertTrue(res.headers['ETag'].endswith('-gzip"'))
+        self.assertTrue(data['questions'])
+
+    def test_rate_limit_headers(self):
+        res = self.client().get('/categories')
+
+        self.assertEqual(res.headers['RateLimit-Limit'], '120')
+        self.assertEqual(res.headers['RateLimit-Remaining'], '119')
+
+    def test_search_rate_limited(self):
+        self.app.config['RATELIMIT_ENDPOINTS'] = dict(self.app.config['RATELIMIT_ENDPOINTS'],
+                                                      get_questions_by_search=Limit(2, 60))
+        search_term = {'searchTerm': 'a'}
+        for _ in range(2):
+            res = self.client().post('/questions/search', headers=HEADERS, data=json.dumps(search_term))
+            self.assertEqual(res.status_code, 200)
+
+        res = self.client().post('/questions/search', headers=HEADERS, data=json.dumps(search_term))
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 429)
+        self.assertFalse(data['success'])
+        self.assertEqual(res.headers['Retry-After'], '30')
+        # Other routes have their own buckets
+        self.assertEqual(self.client().get('/categories').status_code, 200)
+
     def test_question_search_with_results(self):
         search_term = {'searchTerm': 'a'}
         res = self.client().post('/questions/search', headers=HEADERS, data=json.dumps(search_term))
@@ -148,6 +257,59 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['question'])
 
+    def test_quiz_deck_follows_insert_and_delete(self):
+        other_ids = [q.id for q in Question.query.filter(Question.category == 2)]
+        quiz = {'quiz_category': {'id': 2}, 'previous_questions': other_ids}
+        self.client().post('/quizzes', headers=HEADERS, data=json.dumps(quiz))
+
+        new_question = {'question': 'In the deck?', 'answer': 'Yes', 'difficulty': 1, 'category': 2}
+        res = self.client().post('/questions', headers=HEADERS, data=json.dumps(new_question))
+        new_id = json.loads(res.data)['new_question']['id']
+        res = self.client().post('/quizzes', headers=HEADERS, data=json.dumps(quiz))
+        self.assertEqual(json.loads(res.data)['question']['id'], new_id)
+
+        self.client().delete(f'/questions/{new_id}')
+        res = self.client().post('/quizzes', headers=HEADERS, data=json.dumps(quiz))
+        self.assertIsNone(json.loads(res.data)['question'])
+
+    def test_quiz_with_string_category_id(self):
+        quiz = {'quiz_category': {'id': '1', 'type': 'Science'}, 'previous_questions': []}
+        res = self.client().post('/quizzes', headers=HEADERS, data=json.dumps(quiz))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['category'], 1)
+
+    def test_adaptive_quiz_targets_score(self):
+        quiz = {'quiz_category': {'id': 0}, 'previous_questions': [], 'adaptive': True}
+        res = self.client().post('/quizzes', headers=HEADERS, data=json.dumps(quiz))
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['target_difficulty'], 3)
+        self.assertEqual(data['question']['difficulty'], 3)
+
+        all_ids = [q.id for q in Question.query.all()][:4]
+        quiz.update(previous_questions=all_ids, correct_answers=4)
+        res = self.client().post('/quizzes', headers=HEADERS, data=json.dumps(quiz))
+        data = json.loads(res.data)
+        self.assertEqual(data['target_difficulty'], 5)
+        # The seed has no difficulty 5 questions: 4 is the nearest left
+        self.assertEqual(data['question']['difficulty'], 4)
+        self.assertNotIn(data['question']['id'], all_ids)
+
+        new_question = {'question': 'Hardest?', 'answer': 'Yes', 'difficulty': 5, 'category': 1}
+        res = self.client().post('/questions', headers=HEADERS, data=json.dumps(new_question))
+        new_id = json.loads(res.data)['new_question']['id']
+        res = self.client().post('/quizzes', headers=HEADERS, data=json.dumps(quiz))
+        data = json.loads(res.data)
+        self.assertEqual(data['question']['id'], new_id)
+        self.assertEqual(data['question']['difficulty'], 5)
+
+    def test_adaptive_quiz_bad_score(self):
+        quiz = {'quiz_category': {'id': 0}, 'previous_questions': [], 'adaptive': True, 'correct_answers': 2}
+        res = self.client().post('/quizzes', headers=HEADERS, data=json.dumps(quiz))
+        self.assertEqual(res.status_code, 400)
+
     def test_quiz_with_no_answers_left(self):
         all_question_ids = [q.id for q in Question.query.all()]
         quiz = {'quiz_category': {'id': 0}, 'previous_questions': all_question_ids}
@@ -158,6 +320,178 @@ class TriviaTestCase(unittest.TestCase):
         self.assertFalse(data['question'])
 
 
+@unittest.skipIf(create_async_app is None, 'needs the packages of requirements-async.txt')
+class AsyncTriviaTestCase(TriviaTestCase):
+    """The same contract tests, against the async app of flaskr/asgi.py"""
+
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    def setUp(self):
+        """Serve each test from a fresh copy of the seeded database"""
+        self.fixture = AsyncAppFixture()
+        self.fixture.start()
+        self.app = self.fixture.app
+        self.client = lambda: self.fixture.client
+
+    def tearDown(self):
+        self.fixture.stop()
+
+
+class ReadReplicaTestCase(unittest.TestCase):
+    """Read routing between a primary and a replica, two SQLite files standing in for Postgres"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.primary_path = self.create_database('primary', 'Primary')
+        self.replica_path = self.create_database('replica', 'Replica')
+        self.apps = []
+        self.app = self.create_app([self.replica_path])
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        for app in self.apps:
+            with app.app_context():
+                db.get_engine(app).dispose()
+                for bind in app.config['REPLICA_BINDS']:
+                    db.get_engine(app, bind=bind).dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def create_database(self, name, category_type, questions=0, version=None):
+        # Same schema, different category names, to tell where a read went
+        path = 'sqlite:///' + os.path.join(self.tmpdir, f'{name}.db')
+        engine = create_engine(path)
+        db.metadata.create_all(engine)
+        engine.execute(Category.__table__.insert(), {'id': 1, 'type': category_type})
+        for i in range(questions):
+            engine.execute(Question.__table__.insert(),
+                           {'question': f'{category_type} {i}?', 'answer': 'Yes', 'category': 1, 'difficulty': 1})
+        if version is not None:
+            engine.execute(DataVersion.__table__.insert(), {'id': 1, 'version': version})
+        engine.dispose()
+        return path
+
+    def create_app(self, replica_paths):
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': self.primary_path,
+            'REPLICA_DATABASE_URIS': replica_paths,
+        })
+        self.apps.append(app)
+        return app
+
+    def count_questions(self, path):
+        engine = create_engine(path)
+        try:
+            return engine.execute('SELECT count(*) FROM questions').scalar()
+        finally:
+            engine.dispose()
+
+    def test_reads_go_to_replica(self):
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['categories'], {'1': 'Replica'})
+
+    def test_request_reads_from_one_replica(self):
+        # Replicas at different points of replication: 1 and 3 questions
+        lagging = self.create_database('lagging', 'Lagging', questions=1)
+        current = self.create_database('current', 'Current', questions=3)
+        client = self.create_app([lagging, current]).test_client()
+
+        seen = set()
+        for _ in range(40):
+            data = json.loads(client.get('/questions').data)
+            category_type = data['categories']['1']
+            seen.add(category_type)
+            self.assertEqual(data['total_questions'], len(data['questions']))
+            self.assertTrue(all(q['question'].startswith(category_type) for q in data['questions']))
+        self.assertEqual(seen, {'Lagging', 'Current'})
+
+    def test_etag_matches_the_replica_read(self):
+        versions = {'Lagging': 1, 'Current': 2}
+        lagging = self.create_database('lagging', 'Lagging', questions=1, version=1)
+        current = self.create_database('current', 'Current', questions=3, version=2)
+        client = self.create_app([lagging, current]).test_client()
+
+        for _ in range(40):
+            res = client.get('/questions')
+            category_type = json.loads(res.data)['categories']['1']
+            # A lagging body must never carry the newer version's tag
+            self.assertEqual(res.headers['ETag'], f'"{make_etag(versions[category_type], "/questions?")}"')
+
+    def test_quiz_decks_follow_the_newest_replica(self):
+        # The primary and one replica are at version 2, the other replica lags at 1
+        self.primary_path = self.create_database('newest', 'Current', questions=3, version=2)
+        lagging = self.create_database('lagging', 'Lagging', questions=1, version=1)
+        current = self.create_database('current', 'Current', questions=3, version=2)
+        app = self.create_app([lagging, current])
+        decks = app.extensions['quiz_decks']
+        quiz = {'quiz_category': {'id': 1}, 'previous_questions': []}
+
+        with mock.patch.object(decks, 'rebuild', wraps=decks.rebuild) as rebuild:
+            for _ in range(40):
+                res = app.test_client().post('/quizzes', headers=HEADERS, data=json.dumps(quiz))
+                question = json.loads(res.data)['question']
+                if decks.version == 2:
+                    # Drawn from the newest decks, so read from a replica that has them
+                    self.assertTrue(question['question'].startswith('Current'))
+        self.assertEqual(decks.version, 2)
+        # At most once from the lagging replica and once from a current one
+        self.assertLessEqual(rebuild.call_count, 2)
+
+    def test_session_sticks_to_primary_after_write(self):
+        with self.app.app_context():
+            self.assertEqual(Category.get_type_dict(), {1: 'Replica'})
+            Question('Sticky?', 'Yes', 1, 1).insert()
+            self.assertEqual(Category.get_type_dict(), {1: 'Primary'})
+            self.assertEqual(Question.get_total_questions(), 1)
+
+    def test_writes_go_to_primary(self):
+        new_question = {'question': 'Where?', 'answer': 'Primary', 'difficulty': 1, 'category': 1}
+        res = self.client().post('/questions', headers=HEADERS, data=json.dumps(new_question))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.count_questions(self.primary_path), 1)
+        self.assertEqual(self.count_questions(self.replica_path), 0)
+
+
+class RateLimitBackendTestCase(unittest.TestCase):
+    """The shared SQLite bucket store, as seen by two workers"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'rate_limit.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_workers_share_buckets(self):
+        limit = Limit(2, 60)
+        worker_1, worker_2 = SQLiteBackend(self.path), SQLiteBackend(self.path)
+
+        self.assertTrue(worker_1.consume('127.0.0.1:search', limit, now=1000)[0])
+        self.assertTrue(worker_2.consume('127.0.0.1:search', limit, now=1000)[0])
+        self.assertFalse(worker_1.consume('127.0.0.1:search', limit, now=1000)[0])
+        # One token is back after period / capacity seconds
+        self.assertTrue(worker_2.consume('127.0.0.1:search', limit, now=1030)[0])
+
+    def test_prune_keeps_buckets_of_longer_periods(self):
+        backend = MemoryBackend()
+        backend.MAX_KEYS = 1
+        daily, minutely = Limit(2, 86400), Limit(2, 60)
+        backend.consume('127.0.0.1:quizzes', daily, now=1000)
+        backend.consume('127.0.0.1:quizzes', daily, now=1000)
+        # Pruning on behalf of a one minute limit drops only the idle
+        # buckets of one minute limits
+        backend.consume('127.0.0.1:categories', minutely, now=1000)
+        backend.consume('127.0.0.2:categories', minutely, now=1100)
+
+        self.assertNotIn('127.0.0.1:categories', backend.buckets)
+        self.assertFalse(backend.consume('127.0.0.1:quizzes', daily, now=1100)[0])
+
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
@@ -1,27 +1,155 @@
-import os
-from flask import Flask
-from models import setup_db
+import json
+from flask import Flask, Response, abort, jsonify, request, stream_with_context
+from config import Config
+from metrics import init_metrics
+from models import setup_db, db, ping_db, Person
+
+PEOPLE_PER_PAGE = 20
+MAX_PEOPLE_PER_PAGE = 100
+# Rows fetched per query while streaming an export
+EXPORT_BATCH_SIZE = 1000
+
+'''
+init_extensions(app)
+    imports and registers the optional extensions inside the factory, so
+    that a disabled one costs nothing at boot (ENABLE_CORS=false)
+'''
+def init_extensions(app):
+    if app.config['ENABLE_CORS']:
+        from flask_cors import CORS
+        CORS(app)
+
+'''
+people_query()
+    the Person columns asked for with ?fields=name,catchphrase (all by
+    default), filtered by ?q= on name with ?match=prefix (default) or
+    substring. Plain rows: no Person objects are built
+'''
+def people_query():
+    fields = request.args.get('fields')
+    fields = fields.split(',') if fields else Person.FIELDS
+    if any(field not in Person.FIELDS for field in fields):
+        abort(400)
+    query = db.session.query(*Person.columns(fields))
+    match = request.args.get('match', 'prefix')
+    if match not in ('prefix', 'substring'):
+        abort(400)
+    if request.args.get('q'):
+        query = query.filter(Person.name_filter(request.args['q'], match))
+    return query
+
+'''
+after(cursor)
+    the filter for rows past a cursor. While searching, id + 0 keeps the
+    planner from walking the primary key in order and filtering every row
+    on name; the name index finds the matches, which are then sorted
+'''
+def after(cursor):
+    if request.args.get('q'):
+        return Person.id + 0 > cursor
+    return Person.id > cursor
 
 def create_app(test_config=None):
 
     app = Flask(__name__)
+    app.config.from_object(Config())
+    if test_config:
+        app.config.from_mapping(test_config)
     setup_db(app)
-    CORS(app)
+    init_extensions(app)
+    init_metrics(app)
 
     @app.route('/')
     def get_greeting():
-        excited = os.environ['EXCITED']
         greeting = "Hello" 
-        if excited == 'true': greeting = greeting + "!!!!!"
+        if app.config['EXCITED']: greeting = greeting + "!!!!!"
         return greeting
 
+    '''
+    GET /healthz
+        liveness: answers as long as the process serves requests, without
+        touching the database
+    '''
+    @app.route('/healthz')
+    def healthz():
+        return jsonify({'status': 'ok'})
+
+    '''
+    GET /readyz
+        readiness: 503 until a pooled connection answers SELECT 1 within
+        READY_TIMEOUT seconds
+    '''
+    @app.route('/readyz')
+    def readyz():
+        ready, reason = ping_db(app, app.config['READY_TIMEOUT'])
+        if not ready:
+            return jsonify({'status': 'unavailable', 'database': reason}), 503
+        return jsonify({'status': 'ok', 'database': 'ok'})
+
     @app.route('/coolkids')
     def be_cool():
         return "Be cool, man, be coooool! You're almost a FSND grad!"
 
+    '''
+    GET /people
+        a page of people ordered by id, after the id given as ?cursor=
+        (?limit= up to 100). next_cursor is the cursor of the following
+        page, or null on the last one
+    '''
+    @app.route('/people')
+    def get_people():
+        limit = request.args.get('limit', PEOPLE_PER_PAGE, type=int)
+        if not 1 <= limit <= MAX_PEOPLE_PER_PAGE:
+            abort(400)
+        cursor = request.args.get('cursor', 0, type=int)
+        rows = people_query().filter(after(cursor)).order_by(Person.id).limit(limit + 1).all()
+        return jsonify({
+            'success': True,
+            'people': [row._asdict() for row in rows[:limit]],
+            'next_cursor': rows[limit - 1].id if len(rows) > limit else None
+        })
+
+    '''
+    GET /people/export
+        every matching person as newline-delimited JSON, streamed in
+        batches fetched by id so no long-running query holds the database
+    '''
+    @app.route('/people/export')
+    def export_people():
+        query = people_query()
+
+        def generate():
+            cursor = 0
+            while True:
+                rows = query.filter(after(cursor)).order_by(Person.id).limit(EXPORT_BATCH_SIZE).all()
+                if rows:
+                    yield ''.join(json.dumps(row._asdict(), ensure_ascii=False) + '\n' for row in rows)
+                if len(rows) < EXPORT_BATCH_SIZE:
+                    return
+                cursor = rows[-1].id
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    @app.errorhandler(400)
+    def bad_request(error):
+        return jsonify({
+            'success': False,
+            'error': 400,
+            'message': 'Bad request'
+        }), 400
+
     return app
 
-app = create_app()
+'''
+app
+    built on first access rather than at import time, so `gunicorn app:app`
+    and `flask run` still find it while `import app` stays cheap
+'''
+def __getattr__(name):
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    create_app().run()
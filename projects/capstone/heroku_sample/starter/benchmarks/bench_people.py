@@ -0,0 +1,106 @@
+'''
+Seeded benchmark of the People API:
+
+    pages     a deep page by ?cursor= against the same page by OFFSET with
+              full Person objects (the usual Person.query.offset() path)
+    search    ?q= prefix search with and without ix_people_name_pattern
+              (PostgreSQL only; SQLite scans either way), and substring search
+    fields    ?fields=name against whole rows
+    export    /people/export throughput
+
+    python benchmarks/bench_people.py --people 100000 --requests 200
+    python benchmarks/bench_people.py --database-uri postgresql://localhost:5432/capstone_bench
+'''
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify, request
+
+from app import create_app
+from models import db, migrate_db, Person
+
+SYLLABLES = ['al', 'be', 'ca', 'do', 'el', 'fi', 'ga', 'ho', 'is', 'ju', 'ka', 'lo', 'ma', 'ni', 'or', 'pe']
+
+
+def seed(app, total):
+    rng = random.Random(0)
+    with app.app_context():
+        db.drop_all()
+        migrate_db()
+        rows = [{'name': ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title(),
+                 'catchphrase': 'Be cool, man, be coooool! ' * 4} for _ in range(total)]
+        for start in range(0, total, 10000):
+            db.session.execute(Person.__table__.insert(), rows[start:start + 10000])
+        db.session.commit()
+
+
+def add_offset_route(app):
+    @app.route('/offset/people')
+    def offset_people():
+        page = request.args.get('page', 1, type=int)
+        people = Person.query.order_by(Person.id).offset((page - 1) * 20).limit(20).all()
+        return jsonify({'success': True, 'people': [person.format() for person in people]})
+
+
+def run(client, path, total):
+    latencies = []
+    for _ in range(total):
+        started = time.perf_counter()
+        response = client.get(path)
+        assert response.status_code == 200, response.status_code
+        response.get_data()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f'{label:34} median {statistics.median(latencies) * 1000:8.2f} ms   p95 {p95 * 1000:8.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri')
+    parser.add_argument('--people', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    uri = args.database_uri or 'sqlite:///' + os.path.join(tmp.name, 'people.db')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri})
+    add_offset_route(app)
+    seed(app, args.people)
+    client = app.test_client()
+    print(f'{args.people} people on {uri}, {args.requests} requests per case')
+
+    last_page = args.people // 20
+    report('deep page, OFFSET + ORM', run(client, f'/offset/people?page={last_page}', args.requests))
+    report('deep page, cursor + rows', run(client, f'/people?cursor={(last_page - 1) * 20}', args.requests))
+    report('first page, all fields', run(client, '/people', args.requests))
+    report('first page, ?fields=name', run(client, '/people?fields=name', args.requests))
+
+    report('prefix search, indexed', run(client, '/people?q=kalomani', args.requests))
+    with app.app_context():
+        db.session.execute('DROP INDEX IF EXISTS ix_people_name_pattern')
+        db.session.commit()
+    report('prefix search, no index', run(client, '/people?q=kalomani', args.requests))
+    report('substring search', run(client, '/people?q=kalomani&match=substring', args.requests))
+
+    for label, path in (('export, all fields', '/people/export'), ('export, ?fields=name', '/people/export?fields=name')):
+        started = time.perf_counter()
+        lines = client.get(path).get_data().count(b'\n')
+        elapsed = time.perf_counter() - started
+        print(f'{label:34} {lines / elapsed:10.0f} rows/s  ({lines} rows in {elapsed:.2f} s)')
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+'''
+Cold start of the capstone app, each step in a fresh interpreter:
+
+    import    `import app` under `python -X importtime`, with the slowest
+              modules by cumulative import time
+    app       import and build the app (what `gunicorn app:app` does)
+    request   import, build, and serve a first request
+
+Results can be saved and compared later, so a slow new import shows up as
+a failing run rather than as slower dyno boots:
+
+    python benchmarks/bench_startup.py --runs 10 --save startup.json
+    python benchmarks/bench_startup.py --compare startup.json --tolerance 0.25
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+STARTER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STEPS = {
+    'import': 'import app',
+    'app': 'import app; app.app',
+    'request': 'import app; app.app.test_client().get("/coolkids")',
+}
+
+
+def run(code, env, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=STARTER_DIR, env=env, stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode:
+        sys.exit(result.stderr)
+    return elapsed, result.stderr
+
+
+'''
+parse_importtime(stderr)
+    {module: cumulative microseconds} for every import reported by
+    -X importtime; nested imports keep their indentation
+'''
+def parse_importtime(stderr):
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name[1:].rstrip()] = int(cumulative)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--save')
+    parser.add_argument('--compare')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tmp.name, 'startup.db'))
+
+    results = {}
+    for step, code in STEPS.items():
+        run(code, env)  # warm the filesystem cache
+        results[step] = statistics.median(run(code, env)[0] for _ in range(args.runs)) * 1000
+        print(f'{step:8} {results[step]:8.1f} ms  (median of {args.runs})')
+
+    modules = parse_importtime(run(STEPS['import'], env, importtime=True)[1])
+    top_level = {name: us for name, us in modules.items() if not name.startswith(' ')}
+    print(f'\nimport app: {top_level.get("app", 0) / 1000:.1f} ms cumulative; slowest imports:')
+    for name, us in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'  {us / 1000:8.1f} ms  {name}')
+    results['modules'] = sorted(name.strip() for name in modules)
+    tmp.cleanup()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        new_modules = sorted(set(results['modules']) - set(baseline['modules']))
+        if new_modules:
+            print(f'\nnewly imported at boot: {", ".join(new_modules)}')
+        slower = [step for step in STEPS if results[step] > baseline[step] * (1 + args.tolerance)]
+        for step in slower:
+            print(f'{step} regressed: {baseline[step]:.1f} ms -> {results[step]:.1f} ms')
+        sys.exit(1 if slower else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+import os
+
+'''
+Config
+    the settings of the app, read from the environment once when the app is
+    created rather than on every request. create_app() loads it into
+    app.config, where test_config can override any of it
+'''
+class Config:
+    def __init__(self, environ=os.environ):
+        self.SQLALCHEMY_DATABASE_URI = environ.get('DATABASE_URL')
+        self.EXCITED = environ.get('EXCITED') == 'true'
+        self.ENABLE_CORS = environ.get('ENABLE_CORS', 'true') == 'true'
+        # Create tables before the first request instead of with `flask migrate`
+        self.AUTO_MIGRATE = environ.get('AUTO_MIGRATE') == 'true'
+        # Seconds /readyz waits for the database before answering 503
+        self.READY_TIMEOUT = float(environ.get('READY_TIMEOUT', '2'))
+        # Upper bounds, in seconds, of the /metrics latency histogram buckets
+        self.METRICS_BUCKETS = tuple(float(bound) for bound in environ.get(
+            'METRICS_BUCKETS', '0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10').split(','))
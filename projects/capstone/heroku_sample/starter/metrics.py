@@ -0,0 +1,105 @@
+'''
+Request and connection pool metrics, served at /metrics in the Prometheus
+text format:
+
+    http_request_duration_seconds  histogram by method, endpoint and status
+    http_requests_in_flight        requests being handled right now
+    db_pool_*                      connections in the SQLAlchemy pool
+
+Durations run from before_request to after_request, so a streamed body
+(/people/export) counts only until its first byte.
+'''
+import threading
+import time
+
+from flask import Response, g, request
+
+from models import db
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        # {labels: [count per bucket..., count, sum]}
+        self.series = {}
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def samples(self, name, label_names):
+        with self.lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        for labels, values in sorted(series.items()):
+            label_text = ','.join(f'{key}="{value}"' for key, value in zip(label_names, labels))
+            for bound, count in zip(self.buckets, values):
+                yield f'{name}_bucket{{{label_text},le="{bound}"}} {count}'
+            yield f'{name}_bucket{{{label_text},le="+Inf"}} {values[-2]}'
+            yield f'{name}_count{{{label_text}}} {values[-2]}'
+            yield f'{name}_sum{{{label_text}}} {values[-1]:.6f}'
+
+
+'''
+pool_samples(pool)
+    gauges for a QueuePool; other pools (e.g. SQLite's NullPool) don't keep
+    connections and report nothing
+'''
+def pool_samples(pool):
+    if not hasattr(pool, 'checkedout'):
+        return
+    size = pool.size()
+    checked_out = pool.checkedout()
+    yield '# TYPE db_pool_size gauge'
+    yield f'db_pool_size {size}'
+    yield '# TYPE db_pool_checked_out gauge'
+    yield f'db_pool_checked_out {checked_out}'
+    yield '# TYPE db_pool_overflow gauge'
+    yield f'db_pool_overflow {max(pool.overflow(), 0)}'
+    yield '# TYPE db_pool_utilization gauge'
+    yield f'db_pool_utilization {checked_out / size if size else 0:.4f}'
+
+
+def init_metrics(app):
+    latency = Histogram(app.config['METRICS_BUCKETS'])
+    in_flight = [0]
+    in_flight_lock = threading.Lock()
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        with in_flight_lock:
+            in_flight[0] += 1
+
+    @app.after_request
+    def record_latency(response):
+        if 'metrics_started' in g:
+            labels = (request.method, request.endpoint or 'unmatched', str(response.status_code))
+            latency.observe(labels, time.perf_counter() - g.metrics_started)
+        return response
+
+    @app.teardown_request
+    def stop_timer(error=None):
+        if g.pop('metrics_started', None) is not None:
+            with in_flight_lock:
+                in_flight[0] -= 1
+
+    @app.route('/metrics')
+    def metrics():
+        lines = [
+            '# HELP http_request_duration_seconds Time spent handling requests',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        lines += latency.samples('http_request_duration_seconds', ('method', 'endpoint', 'status'))
+        lines += ['# TYPE http_requests_in_flight gauge', f'http_requests_in_flight {in_flight[0]}']
+        lines += pool_samples(db.get_engine(app).pool)
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+    return app
@@ -1,21 +1,87 @@
-from sqlalchemy import Column, String, create_engine
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from sqlalchemy import Column, String, Integer, func
 from flask_sqlalchemy import SQLAlchemy
-import json
-
-database_path = os.environ['DATABASE_URL']
 
 db = SQLAlchemy()
 
 '''
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service. Nothing connects to
+    the database here: the engine is created on first use, and the schema
+    is created by `flask migrate` (or before the first request when
+    AUTO_MIGRATE is set), not on every boot
 '''
-def setup_db(app, database_path=database_path):
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+def setup_db(app, database_path=None):
+    app.config["SQLALCHEMY_DATABASE_URI"] = (database_path or app.config.get("SQLALCHEMY_DATABASE_URI")
+                                             or os.environ['DATABASE_URL'])
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
+
+    @app.cli.command('migrate')
+    def migrate():
+        '''Create any missing tables and indexes.'''
+        migrate_db()
+
+    if app.config.get('AUTO_MIGRATE'):
+        app.before_first_request(migrate_db)
+
+
+'''
+migrate_db()
+    creates missing tables, then the search indexes, which create_all would
+    skip on a table that already exists. text_pattern_ops compares
+    characters rather than by the database collation, which is what lets
+    PostgreSQL answer LIKE 'term%' from the index under e.g. en_US.UTF-8.
+    SQLite can't use an expression index for LIKE, so it gets none
+'''
+def migrate_db():
     db.create_all()
+    with db.engine.begin() as conn:
+        # Superseded by ix_people_name_pattern, which LIKE can use
+        conn.execute('DROP INDEX IF EXISTS ix_people_name_lower')
+        if conn.dialect.name == 'postgresql':
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_people_name_pattern '
+                         'ON "People" (lower(name) text_pattern_ops)')
+            conn.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_people_name_trgm '
+                         'ON "People" USING gin (lower(name) gin_trgm_ops)')
+
+
+'''
+DatabasePing
+    checks that a pooled connection answers SELECT 1 within a timeout. The
+    ping runs on its own thread so a hung database can't hold the caller
+    past the timeout; concurrent callers share the ping in flight instead
+    of piling up more of them
+'''
+class DatabasePing:
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lock = threading.Lock()
+        self.pending = None
+
+    def __call__(self, app, timeout):
+        with self.lock:
+            if self.pending is None or self.pending.done():
+                self.pending = self.executor.submit(self.ping, app)
+            pending = self.pending
+        try:
+            pending.result(timeout)
+        except TimeoutError:
+            return False, f'no answer within {timeout} s'
+        except Exception as error:
+            return False, type(error).__name__
+        return True, None
+
+    @staticmethod
+    def ping(app):
+        with db.get_engine(app).connect() as conn:
+            conn.execute('SELECT 1')
+
+ping_db = DatabasePing()
 
 
 '''
@@ -37,4 +103,29 @@ class Person(db.Model):
     return {
       'id': self.id,
       'name': self.name,
-      'catchphrase': self.catchphrase}
\ No newline at end of file
+      'catchphrase': self.catchphrase}
+
+  FIELDS = ('id', 'name', 'catchphrase')
+
+  '''
+  columns(fields)
+      the columns to select for a sparse fieldset; id is always included
+      since it is the pagination cursor
+  '''
+  @classmethod
+  def columns(cls, fields=FIELDS):
+    return [getattr(cls, field) for field in cls.FIELDS if field == 'id' or field in fields]
+
+  '''
+  name_filter(term, match)
+      case-insensitive search on name. Both sides are folded by the
+      database's lower(), so they agree wherever it folds (only ASCII on
+      SQLite). On PostgreSQL 'prefix' scans ix_people_name_pattern and
+      'substring' the trigram index; SQLite scans the table for both
+  '''
+  @classmethod
+  def name_filter(cls, term, match='prefix'):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    pattern = f'{escaped}%' if match == 'prefix' else f'%{escaped}%'
+    return func.lower(cls.name).like(func.lower(pattern), escape='\\')
+
@@ -0,0 +1,12 @@
+from job_queue.backends import MemoryBackend, SQLiteBackend, create_backend
+from job_queue.extension import init_job_queue
+from job_queue.queue import JobQueue, QueueFull
+
+__all__ = [
+    'MemoryBackend',
+    'SQLiteBackend',
+    'create_backend',
+    'init_job_queue',
+    'JobQueue',
+    'QueueFull',
+]
@@ -0,0 +1,185 @@
+'''
+Job storage for the queue.
+
+A job is a dict with the keys of FIELDS. Its arguments are stored as JSON
+text, so both backends accept exactly the same jobs. Backends hand out
+copies: changing a returned job changes nothing in the store.
+
+MemoryBackend  jobs of this process, in a dict and a heap of ready times.
+SQLiteBackend  jobs in a SQLite file, claimed in IMMEDIATE transactions, so
+               the workers of every process on a host share one queue. It
+               stands in for a networked store (e.g. Redis or Postgres)
+               behind the same interface.
+
+A claimed job is leased to its worker for LEASE_SECONDS. A SQLite job
+whose worker died mid-run is claimed again once its lease runs out.
+'''
+import heapq
+import itertools
+import json
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+FIELDS = ('id', 'name', 'payload', 'status', 'attempts', 'max_attempts', 'enqueued_at', 'run_after',
+          'started_at', 'finished_at', 'lease_until', 'error', 'result')
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+
+LEASE_SECONDS = 300
+
+
+def new_job(name, payload, max_attempts, now):
+    return dict(dict.fromkeys(FIELDS), id=uuid.uuid4().hex, name=name, payload=payload, status=QUEUED,
+                attempts=0, max_attempts=max_attempts, enqueued_at=now, run_after=now)
+
+
+class MemoryBackend:
+    # Finished jobs kept for the status endpoint, oldest dropped first
+    KEEP_FINISHED = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.finished = OrderedDict()
+        self.ready = []
+        self.sequence = itertools.count()
+
+    def put(self, job):
+        with self.lock:
+            self.jobs[job['id']] = dict(job)
+            heapq.heappush(self.ready, (job['run_after'], next(self.sequence), job['id']))
+        return job['id']
+
+    def claim(self, now):
+        with self.lock:
+            if not self.ready or self.ready[0][0] > now:
+                return None
+            _, _, job_id = heapq.heappop(self.ready)
+            return self._start(job_id, now)
+
+    def start(self, job_id, now):
+        with self.lock:
+            self.ready = [entry for entry in self.ready if entry[2] != job_id]
+            heapq.heapify(self.ready)
+            return self._start(job_id, now)
+
+    def _start(self, job_id, now):
+        job = self.jobs[job_id]
+        job.update(status=RUNNING, attempts=job['attempts'] + 1, started_at=now, lease_until=now + LEASE_SECONDS)
+        return dict(job)
+
+    def requeue(self, job_id, run_after, error):
+        with self.lock:
+            self.jobs[job_id].update(status=QUEUED, run_after=run_after, error=error, lease_until=None)
+            heapq.heappush(self.ready, (run_after, next(self.sequence), job_id))
+
+    def finish(self, job_id, status, now, result=None, error=None):
+        with self.lock:
+            job = self.jobs[job_id]
+            job.update(status=status, finished_at=now, result=result, error=error, lease_until=None)
+            self.finished[job_id] = True
+            while len(self.finished) > self.KEEP_FINISHED:
+                self.jobs.pop(self.finished.popitem(last=False)[0], None)
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def depth(self):
+        with self.lock:
+            return len(self.ready)
+
+    def next_due(self):
+        with self.lock:
+            return self.ready[0][0] if self.ready else None
+
+
+class SQLiteBackend:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self.transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                         'id TEXT PRIMARY KEY, name TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, '
+                         'attempts INTEGER NOT NULL, max_attempts INTEGER NOT NULL, enqueued_at REAL NOT NULL, '
+                         'run_after REAL NOT NULL, started_at REAL, finished_at REAL, lease_until REAL, '
+                         'error TEXT, result TEXT)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_jobs_ready ON jobs (status, run_after)')
+
+    def connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def put(self, job):
+        with self.transaction() as conn:
+            conn.execute(f'INSERT INTO jobs ({", ".join(FIELDS)}) VALUES ({", ".join("?" * len(FIELDS))})',
+                         [job[field] for field in FIELDS])
+        return job['id']
+
+    def claim(self, now):
+        with self.transaction() as conn:
+            row = (conn.execute('SELECT id FROM jobs WHERE status = ? AND run_after <= ? ORDER BY run_after LIMIT 1',
+                                (QUEUED, now)).fetchone()
+                   or conn.execute('SELECT id FROM jobs WHERE status = ? AND lease_until < ? LIMIT 1',
+                                   (RUNNING, now)).fetchone())
+            return self._start(conn, row['id'], now) if row else None
+
+    def start(self, job_id, now):
+        with self.transaction() as conn:
+            return self._start(conn, job_id, now)
+
+    def _start(self, conn, job_id, now):
+        conn.execute('UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, lease_until = ? '
+                     'WHERE id = ?', (RUNNING, now, now + LEASE_SECONDS, job_id))
+        return self._decode(conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+    def requeue(self, job_id, run_after, error):
+        with self.transaction() as conn:
+            conn.execute('UPDATE jobs SET status = ?, run_after = ?, error = ?, lease_until = NULL WHERE id = ?',
+                         (QUEUED, run_after, error, job_id))
+
+    def finish(self, job_id, status, now, result=None, error=None):
+        with self.transaction() as conn:
+            conn.execute('UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?, lease_until = NULL '
+                         'WHERE id = ?', (status, now, json.dumps(result), error, job_id))
+
+    def get(self, job_id):
+        return self._decode(self.connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+    def depth(self):
+        return self.connect().execute('SELECT count(*) FROM jobs WHERE status = ?', (QUEUED,)).fetchone()[0]
+
+    def next_due(self):
+        return self.connect().execute('SELECT min(run_after) FROM jobs WHERE status = ?', (QUEUED,)).fetchone()[0]
+
+    @staticmethod
+    def _decode(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        return job
+
+
+def create_backend(config):
+    if config['JOB_QUEUE_BACKEND'] == 'sqlite':
+        return SQLiteBackend(config['JOB_QUEUE_SQLITE_PATH'])
+    return MemoryBackend()
@@ -0,0 +1,82 @@
+'''
+Background jobs for a Flask app.
+
+    from job_queue import init_job_queue
+    jobs = init_job_queue(app)
+
+    @jobs.task('audit')
+    def audit(entity_id):
+        ...
+
+    jobs.enqueue('audit', 42)
+
+Jobs run on worker threads inside an app context, so tasks can use the
+app's logger and Flask-SQLAlchemy session as usual. With JOB_QUEUE_ROUTES
+set, GET /jobs/<id> reports a job's status and result, GET /jobs/stats the
+queue depth, job counts and wait/run latency percentiles. The endpoints are
+not authenticated: leave them off in apps whose data needs a login.
+
+Config keys (defaults in DEFAULTS):
+    JOB_QUEUE_BACKEND              'memory' or 'sqlite'
+    JOB_QUEUE_SQLITE_PATH          the SQLite file shared by all workers
+    JOB_QUEUE_WORKERS              worker threads per process
+    JOB_QUEUE_MAX_DEPTH            waiting jobs before enqueue raises QueueFull
+    JOB_QUEUE_MAX_ATTEMPTS         runs of a failing job before it is failed
+    JOB_QUEUE_RETRY_DELAY          seconds before the first retry, doubling after
+    JOB_QUEUE_EAGER                run jobs inline in enqueue(), for tests
+    JOB_QUEUE_ROUTES               mount the status endpoints
+    JOB_QUEUE_URL_PREFIX           where the status endpoints are mounted
+'''
+from flask import abort, jsonify
+
+from job_queue.backends import create_backend
+from job_queue.queue import JobQueue
+
+DEFAULTS = {
+    'JOB_QUEUE_BACKEND': 'memory',
+    'JOB_QUEUE_SQLITE_PATH': 'jobs.db',
+    'JOB_QUEUE_WORKERS': 2,
+    'JOB_QUEUE_MAX_DEPTH': 1000,
+    'JOB_QUEUE_MAX_ATTEMPTS': 3,
+    'JOB_QUEUE_RETRY_DELAY': 1.0,
+    'JOB_QUEUE_EAGER': False,
+    'JOB_QUEUE_ROUTES': False,
+    'JOB_QUEUE_URL_PREFIX': '/jobs',
+}
+
+# Job fields the status endpoint shows
+PUBLIC_FIELDS = ('id', 'name', 'status', 'attempts', 'max_attempts', 'enqueued_at', 'started_at',
+                 'finished_at', 'error', 'result')
+
+
+def init_job_queue(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+    jobs = JobQueue(
+        create_backend(app.config),
+        workers=app.config['JOB_QUEUE_WORKERS'],
+        max_depth=app.config['JOB_QUEUE_MAX_DEPTH'],
+        max_attempts=app.config['JOB_QUEUE_MAX_ATTEMPTS'],
+        retry_delay=app.config['JOB_QUEUE_RETRY_DELAY'],
+        eager=app.config['JOB_QUEUE_EAGER'],
+        context=app.app_context,
+        logger=app.logger,
+    )
+    app.extensions['job_queue'] = jobs
+    if not app.config['JOB_QUEUE_ROUTES']:
+        return jobs
+    prefix = app.config['JOB_QUEUE_URL_PREFIX']
+
+    @app.route(f'{prefix}/stats', endpoint='job_queue_stats')
+    def job_queue_stats():
+        return jsonify(jobs.stats())
+
+    @app.route(f'{prefix}/<job_id>', endpoint='job_status')
+    def job_status(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            abort(404)
+        return jsonify({field: job[field] for field in PUBLIC_FIELDS})
+
+    return jobs
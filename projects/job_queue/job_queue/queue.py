@@ -0,0 +1,248 @@
+'''
+Thread-pool job queue.
+
+    jobs = JobQueue(MemoryBackend(), workers=2)
+
+    @jobs.task('send_receipt')
+    def send_receipt(order_id):
+        ...
+
+    job_id = jobs.enqueue('send_receipt', 42)
+
+Tasks are registered by name and their arguments must be JSON-serializable,
+so a job can be stored and run by any process that registered the same
+tasks. enqueue() returns as soon as the job is stored, or raises QueueFull
+once max_depth jobs are waiting. A task that raises is retried after
+retry_delay, doubling each time, until it has run max_attempts times.
+
+Workers are started by the first enqueue() of each process, not when the
+queue is built, so no threads exist before a pre-forking server forks. A
+worker that hits a backend error logs it and backs off instead of dying;
+enqueue() also replaces any worker thread that is no longer alive.
+'''
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from job_queue.backends import new_job, SUCCEEDED, FAILED
+
+# Longest an idle worker sleeps before looking for jobs again, e.g. ones
+# another process added to a shared backend
+POLL_INTERVAL = 0.5
+# Latency samples kept for the percentiles in stats()
+SAMPLES = 1000
+# Pause of a worker after a backend error, doubling while errors repeat
+ERROR_BACKOFF = 0.5
+MAX_ERROR_BACKOFF = 30.0
+
+
+class QueueFull(Exception):
+    pass
+
+
+@contextmanager
+def _no_context():
+    yield
+
+
+def percentiles(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 2),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+class JobQueue:
+    def __init__(self, backend, workers=2, max_depth=1000, max_attempts=3, retry_delay=1.0,
+                 eager=False, context=None, logger=None):
+        self.backend = backend
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        # Run jobs inline in enqueue(), e.g. in tests and CLI commands
+        self.eager = eager
+        # Context manager each job runs in, e.g. an app context
+        self.context = context or _no_context
+        self.logger = logger or logging.getLogger(__name__)
+        self.tasks = {}
+
+        self.counts = Counter()
+        self.wait_times = deque(maxlen=SAMPLES)
+        self.run_times = deque(maxlen=SAMPLES)
+        self.running = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition()
+        # Enqueues not yet seen by a worker, so a wakeup between a worker's
+        # empty claim() and its wait() isn't lost
+        self.signals = 0
+        self.threads = []
+        self.thread_ids = itertools.count()
+        self.pid = None
+        self.stopping = threading.Event()
+
+    def task(self, name, max_attempts=None):
+        def register(function):
+            self.tasks[name] = (function, max_attempts or self.max_attempts)
+            return function
+        return register
+
+    def enqueue(self, name, *args, **kwargs):
+        if name not in self.tasks:
+            raise KeyError(f'no task named {name!r}')
+        payload = json.dumps({'args': args, 'kwargs': kwargs})
+        if not self.eager and self.backend.depth() >= self.max_depth:
+            self._count('rejected')
+            raise QueueFull(f'{self.max_depth} jobs already waiting')
+
+        job = new_job(name, payload, self.tasks[name][1], time.time())
+        self.backend.put(job)
+        self._count('enqueued')
+        if self.eager:
+            while self._run(self.backend.start(job['id'], time.time())):
+                pass
+            return job['id']
+
+        self._start_workers()
+        with self.wakeup:
+            self.signals += 1
+            self.wakeup.notify()
+        return job['id']
+
+    '''
+    try_enqueue(name, *args, **kwargs)
+        enqueue() for work that may be dropped: when the queue is full it
+        logs a warning and returns None instead of raising
+    '''
+    def try_enqueue(self, name, *args, **kwargs):
+        try:
+            return self.enqueue(name, *args, **kwargs)
+        except QueueFull as error:
+            self.logger.warning(f'dropped job {name}: {error}')
+            return None
+
+    def get(self, job_id):
+        return self.backend.get(job_id)
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+            wait_times, run_times = list(self.wait_times), list(self.run_times)
+            running = self.running
+            threads = list(self.threads)
+        return {
+            'depth': self.backend.depth(),
+            'running': running,
+            'workers': sum(thread.is_alive() for thread in threads),
+            'jobs': {key: counts.get(key, 0) for key in ('enqueued', 'succeeded', 'failed', 'retried', 'rejected')},
+            'backend_errors': counts.get('backend_errors', 0),
+            'wait': percentiles(wait_times),
+            'run': percentiles(run_times),
+        }
+
+    def shutdown(self, timeout=None):
+        self.stopping.set()
+        with self.wakeup:
+            self.wakeup.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _start_workers(self):
+        if self.stopping.is_set() or (self.pid == os.getpid() and all(t.is_alive() for t in self.threads)):
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                # Threads don't survive a fork: a forked child starts its own
+                self.threads = []
+                self.pid = os.getpid()
+            threads = [thread for thread in self.threads if thread.is_alive()]
+            while len(threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'job-worker-{next(self.thread_ids)}', daemon=True)
+                thread.start()
+                threads.append(thread)
+            self.threads = threads
+
+    def _work(self):
+        backoff = 0
+        while not self.stopping.is_set():
+            try:
+                self._work_once()
+            except Exception:
+                # e.g. a locked SQLite file. A job claimed from the SQLite
+                # backend keeps its lease and is claimed again once it expires
+                backoff = min(backoff * 2 or ERROR_BACKOFF, MAX_ERROR_BACKOFF)
+                self.logger.exception(f'job queue backend error, worker retrying in {backoff:.1f} s')
+                self._count('backend_errors')
+                self.stopping.wait(backoff)
+            else:
+                backoff = 0
+
+    def _work_once(self):
+        job = self.backend.claim(time.time())
+        if job is not None:
+            self._run(job)
+            return
+        due = self.backend.next_due()
+        timeout = POLL_INTERVAL if due is None else min(POLL_INTERVAL, max(due - time.time(), 0))
+        with self.wakeup:
+            if self.signals:
+                self.signals -= 1
+            else:
+                self.wakeup.wait(timeout)
+
+    '''
+    _run(job)
+        runs a claimed job and records the outcome. Returns True when the job
+        failed and was queued again for another attempt
+    '''
+    def _run(self, job):
+        started = time.time()
+        with self.lock:
+            self.running += 1
+            if job['attempts'] == 1:
+                self.wait_times.append(started - job['enqueued_at'])
+        try:
+            function = self.tasks[job['name']][0]
+            payload = json.loads(job['payload'])
+            with self.context():
+                result = function(*payload['args'], **payload['kwargs'])
+            # Results go through JSON like the arguments, whatever the backend
+            result = json.loads(json.dumps(result, default=str))
+        except Exception as error:
+            return self._failed(job, error)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.run_times.append(time.time() - started)
+        self.backend.finish(job['id'], SUCCEEDED, time.time(), result=result)
+        self._count('succeeded')
+        return False
+
+    def _failed(self, job, error):
+        message = f'{type(error).__name__}: {error}'
+        if job['attempts'] < job['max_attempts']:
+            delay = self.retry_delay * 2 ** (job['attempts'] - 1)
+            self.logger.warning(f'job {job["name"]} {job["id"]} failed (attempt {job["attempts"]}), '
+                                f'retrying in {delay:.1f} s: {message}')
+            self.backend.requeue(job['id'], time.time() + (0 if self.eager else delay), message)
+            self._count('retried')
+            return True
+        self.logger.error(f'job {job["name"]} {job["id"]} failed after {job["attempts"]} attempts: {message}',
+                          exc_info=error)
+        self.backend.finish(job['id'], FAILED, time.time(), error=message)
+        self._count('failed')
+        return False
+
+    def _count(self, key):
+        with self.lock:
+            self.counts[key] += 1
@@ -0,0 +1,9 @@
+from setuptools import setup
+
+setup(
+    name='job_queue',
+    version='0.1.0',
+    description='In-process background job queue with memory and SQLite backends for the FSND Flask apps',
+    packages=['job_queue'],
+    install_requires=['Flask'],
+)
@@ -0,0 +1,247 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from job_queue import init_job_queue, JobQueue, MemoryBackend, SQLiteBackend, QueueFull
+from job_queue.backends import new_job, LEASE_SECONDS, QUEUED, RUNNING, SUCCEEDED, FAILED
+
+
+def wait_for(jobs, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = jobs.get(job_id)
+        if job['status'] in (SUCCEEDED, FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} still {job["status"]} after {timeout} s')
+
+
+class FlakyBackend:
+    """Wraps a backend, raising from the named methods while `failures` lasts"""
+
+    def __init__(self, backend, methods, failures):
+        self.backend = backend
+        self.methods = methods
+        self.failures = failures
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+        if name not in self.methods:
+            return method
+
+        def flaky(*args, **kwargs):
+            with self.lock:
+                if self.failures > 0:
+                    self.failures -= 1
+                    raise OSError('database is locked')
+            return method(*args, **kwargs)
+        return flaky
+
+
+class BackendTests:
+    """Contract shared by both backends; subclasses set up self.backend"""
+
+    def test_claims_jobs_once_they_are_due(self):
+        job = new_job('task', '{}', 3, 100.0)
+        self.backend.put(job)
+
+        self.assertIsNone(self.backend.claim(99.0))
+        claimed = self.backend.claim(100.0)
+        self.assertEqual(claimed['id'], job['id'])
+        self.assertEqual(claimed['status'], RUNNING)
+        self.assertEqual(claimed['attempts'], 1)
+        self.assertIsNone(self.backend.claim(100.0))
+
+    def test_requeue_delays_the_next_attempt(self):
+        job = new_job('task', '{}', 3, 100.0)
+        self.backend.put(job)
+        self.backend.claim(100.0)
+        self.backend.requeue(job['id'], 110.0, 'ValueError: boom')
+
+        self.assertEqual(self.backend.depth(), 1)
+        self.assertEqual(self.backend.next_due(), 110.0)
+        self.assertIsNone(self.backend.claim(105.0))
+        self.assertEqual(self.backend.claim(110.0)['attempts'], 2)
+
+    def test_finish_stores_the_result(self):
+        job = new_job('task', '{}', 3, 100.0)
+        self.backend.put(job)
+        self.backend.claim(100.0)
+        self.backend.finish(job['id'], SUCCEEDED, 101.0, result={'total': 3})
+
+        stored = self.backend.get(job['id'])
+        self.assertEqual(stored['status'], SUCCEEDED)
+        self.assertEqual(stored['result'], {'total': 3})
+        self.assertIsNone(stored['lease_until'])
+        self.assertEqual(self.backend.depth(), 0)
+
+    def test_returns_copies(self):
+        job = new_job('task', '{}', 3, 100.0)
+        self.backend.put(job)
+        self.backend.get(job['id'])['status'] = FAILED
+        self.assertEqual(self.backend.get(job['id'])['status'], QUEUED)
+
+
+class MemoryBackendTestCase(BackendTests, unittest.TestCase):
+    def setUp(self):
+        self.backend = MemoryBackend()
+
+
+class SQLiteBackendTestCase(BackendTests, unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backend = SQLiteBackend(os.path.join(self.directory, 'jobs.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_expired_lease_is_claimed_again(self):
+        job = new_job('task', '{}', 3, 100.0)
+        self.backend.put(job)
+        self.backend.claim(100.0)
+
+        # The worker holding the lease died mid-run
+        self.assertIsNone(self.backend.claim(100.0 + LEASE_SECONDS - 1))
+        claimed = self.backend.claim(100.0 + LEASE_SECONDS + 1)
+        self.assertEqual(claimed['id'], job['id'])
+        self.assertEqual(claimed['attempts'], 2)
+
+    def test_processes_share_the_queue(self):
+        other = SQLiteBackend(self.backend.path)
+        job = new_job('task', '{}', 3, 100.0)
+        self.backend.put(job)
+
+        self.assertEqual(other.claim(100.0)['id'], job['id'])
+        self.assertIsNone(self.backend.claim(100.0))
+
+
+class JobQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.jobs = JobQueue(MemoryBackend(), retry_delay=0.01)
+        self.calls = []
+
+        @self.jobs.task('add')
+        def add(a, b):
+            self.calls.append((a, b))
+            return a + b
+
+        @self.jobs.task('flaky')
+        def flaky(failures):
+            self.calls.append(failures)
+            if len(self.calls) <= failures:
+                raise ValueError(f'attempt {len(self.calls)}')
+            return 'done'
+
+    def tearDown(self):
+        self.jobs.shutdown(timeout=5)
+
+    def test_runs_jobs_on_workers(self):
+        job = wait_for(self.jobs, self.jobs.enqueue('add', 1, b=2))
+
+        self.assertEqual(job['status'], SUCCEEDED)
+        self.assertEqual(job['result'], 3)
+        self.assertEqual(self.calls, [(1, 2)])
+
+    def test_retries_failed_jobs(self):
+        job = wait_for(self.jobs, self.jobs.enqueue('flaky', 2))
+
+        self.assertEqual(job['status'], SUCCEEDED)
+        self.assertEqual(job['attempts'], 3)
+        self.assertEqual(self.jobs.stats()['jobs']['retried'], 2)
+
+    def test_fails_after_max_attempts(self):
+        with self.assertLogs(self.jobs.logger, 'ERROR'):
+            job = wait_for(self.jobs, self.jobs.enqueue('flaky', 5))
+
+        self.assertEqual(job['status'], FAILED)
+        self.assertEqual(job['attempts'], 3)
+        self.assertEqual(job['error'], 'ValueError: attempt 3')
+        self.assertEqual(self.jobs.stats()['jobs']['failed'], 1)
+
+    def test_eager_runs_retries_inline(self):
+        self.jobs.eager = True
+        job = self.jobs.get(self.jobs.enqueue('flaky', 1))
+
+        self.assertEqual(job['status'], SUCCEEDED)
+        self.assertEqual(job['attempts'], 2)
+        self.assertEqual(self.jobs.threads, [])
+
+    def test_full_queue_rejects_jobs(self):
+        # No workers yet: enqueue() stores the job before starting them
+        self.jobs.max_depth = 0
+        with self.assertRaises(QueueFull):
+            self.jobs.enqueue('add', 1, 2)
+        with self.assertLogs(self.jobs.logger, 'WARNING'):
+            self.assertIsNone(self.jobs.try_enqueue('add', 1, 2))
+        self.assertEqual(self.jobs.stats()['jobs']['rejected'], 2)
+
+    def test_unknown_task(self):
+        with self.assertRaises(KeyError):
+            self.jobs.enqueue('missing')
+
+    @mock.patch('job_queue.queue.ERROR_BACKOFF', 0.01)
+    def test_workers_survive_backend_errors(self):
+        self.jobs.backend = FlakyBackend(self.jobs.backend, {'claim', 'finish'}, failures=4)
+        with self.assertLogs(self.jobs.logger, 'ERROR'):
+            job_id = self.jobs.enqueue('add', 1, 2)
+            deadline = time.time() + 5
+            while self.jobs.stats()['backend_errors'] < 4 and time.time() < deadline:
+                time.sleep(0.01)
+
+        stats = self.jobs.stats()
+        self.assertEqual(stats['workers'], 2)
+        self.assertEqual(stats['backend_errors'], 4)
+        # A failed finish() leaves the job running, but later jobs still run
+        self.assertEqual(wait_for(self.jobs, self.jobs.enqueue('add', 2, 3))['result'], 5)
+        self.assertIn(self.jobs.get(job_id)['status'], (RUNNING, SUCCEEDED))
+
+    def test_dead_workers_are_replaced(self):
+        self.jobs.enqueue('add', 1, 2)
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+        self.jobs.threads[0] = dead
+        self.assertEqual(self.jobs.stats()['workers'], 1)
+
+        wait_for(self.jobs, self.jobs.enqueue('add', 2, 3))
+        self.assertEqual(self.jobs.stats()['workers'], 2)
+
+
+
+class ExtensionTestCase(unittest.TestCase):
+    def create_app(self, **config):
+        app = Flask(__name__)
+        app.config.update(JOB_QUEUE_EAGER=True, **config)
+        jobs = init_job_queue(app)
+
+        @jobs.task('add')
+        def add(a, b):
+            return a + b
+        return app, jobs
+
+    def test_status_routes_are_opt_in(self):
+        app, jobs = self.create_app()
+        job_id = jobs.enqueue('add', 1, 2)
+
+        self.assertEqual(app.test_client().get(f'/jobs/{job_id}').status_code, 404)
+        self.assertEqual(app.test_client().get('/jobs/stats').status_code, 404)
+
+    def test_status_routes(self):
+        app, jobs = self.create_app(JOB_QUEUE_ROUTES=True)
+        job_id = jobs.enqueue('add', 1, 2)
+
+        res = app.test_client().get(f'/jobs/{job_id}')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['result'], 3)
+        self.assertEqual(app.test_client().get('/jobs/stats').get_json()['jobs']['succeeded'], 1)
+        self.assertEqual(app.test_client().get('/jobs/missing').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,12 @@
+from query_stats.collector import QueryCollector, Statement, redact
+from query_stats.extension import init_query_stats
+from query_stats.testing import assert_max_queries, assert_no_repeated_queries
+
+__all__ = [
+    'QueryCollector',
+    'Statement',
+    'redact',
+    'init_query_stats',
+    'assert_max_queries',
+    'assert_no_repeated_queries',
+]
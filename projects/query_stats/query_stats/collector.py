@@ -0,0 +1,130 @@
+'''
+Statement collection through SQLAlchemy engine events.
+
+The listeners are attached once to the Engine class, so they see every
+engine, including the ones Flask-SQLAlchemy creates lazily. Statements are
+only recorded while at least one QueryCollector is active on the current
+thread, which is what the per-request hooks and the test helpers do.
+'''
+import threading
+import time
+from collections import Counter, namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+Statement = namedtuple('Statement', ['sql', 'parameters', 'duration'])
+
+_active = threading.local()
+_listening = False
+_lock = threading.Lock()
+
+
+'''
+redact(parameters)
+    replaces every bound value with a placeholder naming its type, so slow
+    query logs keep the shape of the parameters without their contents
+'''
+def redact(parameters):
+    if isinstance(parameters, dict):
+        return {key: _placeholder(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: the rows share one shape, so show the first only
+            return f'{len(parameters)} rows of {redact(parameters[0])}'
+        return tuple(_placeholder(value) for value in parameters)
+    return _placeholder(parameters)
+
+
+def _placeholder(value):
+    if value is None:
+        return None
+    return f'<{type(value).__name__}>'
+
+
+class QueryCollector:
+    '''
+    Records the statements executed on this thread while it is active.
+    Use it as a context manager, or call start()/stop().
+    '''
+
+    def __init__(self):
+        self.statements = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        install_listeners()
+        collectors = getattr(_active, 'collectors', None)
+        if collectors is None:
+            collectors = _active.collectors = []
+        collectors.append(self)
+        return self
+
+    def stop(self):
+        collectors = getattr(_active, 'collectors', [])
+        if self in collectors:
+            collectors.remove(self)
+        return self
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def duration(self):
+        return sum(statement.duration for statement in self.statements)
+
+    '''
+    repeated(threshold)
+        statements executed more than `threshold` times, most frequent first,
+        as (sql, times) pairs: the usual signature of an N+1 query pattern
+    '''
+    def repeated(self, threshold):
+        counts = Counter(statement.sql for statement in self.statements)
+        return [(sql, times) for sql, times in counts.most_common() if times > threshold]
+
+    def slow(self, seconds):
+        return [statement for statement in self.statements if statement.duration >= seconds]
+
+    def report(self):
+        lines = [f'{self.count} statements in {self.duration * 1000:.1f} ms']
+        lines += [f'  {statement.duration * 1000:7.2f} ms  {statement.sql}' for statement in self.statements]
+        return '\n'.join(lines)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_active, 'collectors', None):
+        conn.info.setdefault('query_stats_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    collectors = getattr(_active, 'collectors', None)
+    started = conn.info.get('query_stats_started')
+    if not collectors or not started:
+        return
+    recorded = Statement(statement, parameters, time.perf_counter() - started.pop())
+    for collector in collectors:
+        collector.statements.append(recorded)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute; drop its timer
+    conn = exception_context.connection
+    started = conn.info.get('query_stats_started') if conn is not None else None
+    if started:
+        started.pop()
+
+
+def install_listeners():
+    global _listening
+    with _lock:
+        if not _listening:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+            _listening = True
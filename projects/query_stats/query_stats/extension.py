@@ -0,0 +1,83 @@
+'''
+Per-request SQL statistics for a Flask app.
+
+    from query_stats import init_query_stats
+    init_query_stats(app)
+
+Every request gets a QueryCollector. When the response goes out its
+statement count and database time are logged at DEBUG, or as a warning when
+the request ran more than QUERY_STATS_MAX_QUERIES statements or spent more
+than QUERY_STATS_SLOW_REQUEST_MS in the database, and added as
+X-Query-Count / Server-Timing headers if QUERY_STATS_HEADERS is set. Slow
+statements and statements repeated within one request (likely N+1 queries)
+are logged as warnings, with their bound parameters redacted.
+
+Config keys (defaults in DEFAULTS):
+    QUERY_STATS_ENABLED            record statements at all
+    QUERY_STATS_SLOW_MS            log statements slower than this
+    QUERY_STATS_SLOW_REQUEST_MS    warn about requests with more database time
+    QUERY_STATS_MAX_QUERIES        warn about requests running more statements
+    QUERY_STATS_N_PLUS_ONE         log statements repeated more often than this
+    QUERY_STATS_HEADERS            add the response headers
+'''
+from flask import g, request
+
+from query_stats.collector import QueryCollector, redact
+
+DEFAULTS = {
+    'QUERY_STATS_ENABLED': True,
+    'QUERY_STATS_SLOW_MS': 100,
+    'QUERY_STATS_SLOW_REQUEST_MS': 500,
+    'QUERY_STATS_MAX_QUERIES': 50,
+    'QUERY_STATS_N_PLUS_ONE': 5,
+    'QUERY_STATS_HEADERS': False,
+}
+
+
+def init_query_stats(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+    @app.before_request
+    def start_query_stats():
+        if app.config['QUERY_STATS_ENABLED']:
+            g.query_stats = QueryCollector().start()
+
+    @app.after_request
+    def report_query_stats(response):
+        collector = g.pop('query_stats', None)
+        if collector is None:
+            return response
+        collector.stop()
+        log_query_stats(app, collector)
+        if app.config['QUERY_STATS_HEADERS']:
+            response.headers['X-Query-Count'] = str(collector.count)
+            response.headers.add('Server-Timing', f'db;dur={collector.duration * 1000:.2f}')
+        return response
+
+    @app.teardown_request
+    def stop_query_stats(exc):
+        # after_request is skipped when a handler raises; don't leak the collector
+        collector = g.pop('query_stats', None)
+        if collector is not None:
+            collector.stop()
+
+    return app
+
+
+def log_query_stats(app, collector):
+    endpoint = f'{request.method} {request.path}'
+    summary = f'{endpoint}: {collector.count} queries in {collector.duration * 1000:.1f} ms'
+    if collector.count > app.config['QUERY_STATS_MAX_QUERIES']:
+        app.logger.warning(f'{summary}, over the budget of {app.config["QUERY_STATS_MAX_QUERIES"]}')
+    elif collector.duration * 1000 > app.config['QUERY_STATS_SLOW_REQUEST_MS']:
+        app.logger.warning(f'{summary}, over {app.config["QUERY_STATS_SLOW_REQUEST_MS"]} ms')
+    else:
+        app.logger.debug(summary)
+
+    for statement in collector.slow(app.config['QUERY_STATS_SLOW_MS'] / 1000):
+        app.logger.warning(f'{endpoint}: slow query ({statement.duration * 1000:.1f} ms): '
+                           f'{statement.sql} -- parameters: {redact(statement.parameters)}')
+
+    for sql, times in collector.repeated(app.config['QUERY_STATS_N_PLUS_ONE']):
+        app.logger.warning(f'{endpoint}: possible N+1, same query run {times} times: {sql}')
@@ -0,0 +1,33 @@
+'''
+Query budget assertions for tests.
+
+    with assert_max_queries(3):
+        client.get('/questions')
+
+    with assert_no_repeated_queries(threshold=2):
+        client.get('/venues')
+
+Both work with any test client that runs requests on the calling thread,
+such as Flask's, and fail with the full list of statements that ran.
+'''
+from contextlib import contextmanager
+
+from query_stats.collector import QueryCollector
+
+
+@contextmanager
+def assert_max_queries(budget):
+    with QueryCollector() as collector:
+        yield collector
+    if collector.count > budget:
+        raise AssertionError(f'Expected at most {budget} queries, got {collector.report()}')
+
+
+@contextmanager
+def assert_no_repeated_queries(threshold=1):
+    with QueryCollector() as collector:
+        yield collector
+    repeated = collector.repeated(threshold)
+    if repeated:
+        details = '\n'.join(f'  {times} x {sql}' for sql, times in repeated)
+        raise AssertionError(f'Queries repeated more than {threshold} times:\n{details}')
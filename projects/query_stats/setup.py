@@ -0,0 +1,9 @@
+from setuptools import setup
+
+setup(
+    name='query_stats',
+    version='0.1.0',
+    description='Per-request SQL statement counts, slow query and N+1 logging for the FSND Flask apps',
+    packages=['query_stats'],
+    install_requires=['Flask', 'SQLAlchemy'],
+)
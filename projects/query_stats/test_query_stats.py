@@ -0,0 +1,165 @@
+import threading
+import unittest
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from query_stats import (QueryCollector, redact, init_query_stats,
+                         assert_max_queries, assert_no_repeated_queries)
+
+SELECT_ONE = text('SELECT :value')
+
+
+class CollectorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def select(self, value=1, times=1):
+        with self.engine.connect() as conn:
+            for _ in range(times):
+                conn.execute(SELECT_ONE, {'value': value})
+
+    def test_records_only_while_active(self):
+        self.select()
+        with QueryCollector() as collector:
+            self.select(times=2)
+        self.select()
+
+        self.assertEqual(collector.count, 2)
+        self.assertEqual(collector.statements[0].sql, 'SELECT ?')
+        self.assertEqual(collector.statements[0].parameters, (1,))
+        self.assertGreaterEqual(collector.duration, 0)
+
+    def test_nested_collectors_both_record(self):
+        with QueryCollector() as outer:
+            self.select()
+            with QueryCollector() as inner:
+                self.select()
+
+        self.assertEqual(outer.count, 2)
+        self.assertEqual(inner.count, 1)
+
+    def test_threads_are_isolated(self):
+        started = threading.Barrier(2)
+        counts = {}
+
+        def run(name, times):
+            with QueryCollector() as collector:
+                started.wait()
+                self.select(times=times)
+            counts[name] = collector.count
+
+        threads = [threading.Thread(target=run, args=('a', 3)), threading.Thread(target=run, args=('b', 5))]
+        with QueryCollector() as here:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(counts, {'a': 3, 'b': 5})
+        self.assertEqual(here.count, 0)
+
+    def test_failed_statement_is_not_recorded(self):
+        with QueryCollector() as collector:
+            with self.assertRaises(Exception):
+                with self.engine.connect() as conn:
+                    conn.execute(text('SELECT * FROM missing'))
+            self.select()
+
+        self.assertEqual([statement.sql for statement in collector.statements], ['SELECT ?'])
+
+    def test_repeated(self):
+        with QueryCollector() as collector:
+            self.select(times=4)
+            with self.engine.connect() as conn:
+                conn.execute(text('SELECT 2'))
+                conn.execute(text('SELECT 2'))
+
+        self.assertEqual(collector.repeated(1), [('SELECT ?', 4), ('SELECT 2', 2)])
+        self.assertEqual(collector.repeated(2), [('SELECT ?', 4)])
+        self.assertEqual(collector.repeated(4), [])
+
+
+class RedactTestCase(unittest.TestCase):
+    def test_positional(self):
+        self.assertEqual(redact((1, 'secret', None, 2.5)), ('<int>', '<str>', None, '<float>'))
+
+    def test_named(self):
+        self.assertEqual(redact({'email': 'a@b.c', 'id': 3}), {'email': '<str>', 'id': '<int>'})
+
+    def test_executemany_shows_one_row(self):
+        self.assertEqual(redact([('a', 1), ('b', 2), ('c', 3)]), "3 rows of ('<str>', '<int>')")
+        self.assertEqual(redact([{'name': 'a'}, {'name': 'b'}]), "2 rows of {'name': '<str>'}")
+
+    def test_scalar_and_empty(self):
+        self.assertEqual(redact('secret'), '<str>')
+        self.assertEqual(redact(()), ())
+
+
+class AssertionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def select(self, *values):
+        with self.engine.connect() as conn:
+            for value in values:
+                conn.execute(SELECT_ONE, {'value': value})
+
+    def test_max_queries(self):
+        with assert_max_queries(2) as collector:
+            self.select(1, 2)
+        self.assertEqual(collector.count, 2)
+
+        with self.assertRaisesRegex(AssertionError, 'at most 2 queries, got 3 statements'):
+            with assert_max_queries(2):
+                self.select(1, 2, 3)
+
+    def test_no_repeated_queries(self):
+        with assert_no_repeated_queries(threshold=2):
+            self.select(1, 2)
+
+        with self.assertRaisesRegex(AssertionError, r'3 x SELECT \?'):
+            with assert_no_repeated_queries(threshold=2):
+                self.select(1, 2, 3)
+
+
+class ExtensionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.app = Flask(__name__)
+        self.app.config['QUERY_STATS_HEADERS'] = True
+        init_query_stats(self.app)
+
+        @self.app.route('/items/<int:count>')
+        def items(count):
+            with self.engine.connect() as conn:
+                for value in range(count):
+                    conn.execute(SELECT_ONE, {'value': value})
+            return 'ok'
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_headers(self):
+        res = self.app.test_client().get('/items/3')
+        self.assertEqual(res.headers['X-Query-Count'], '3')
+        self.assertTrue(res.headers['Server-Timing'].startswith('db;dur='))
+
+    def test_logs_n_plus_one_and_budget(self):
+        self.app.config['QUERY_STATS_MAX_QUERIES'] = 5
+        with self.assertLogs(self.app.logger, 'WARNING') as logs:
+            self.app.test_client().get('/items/6')
+
+        self.assertIn('GET /items/6: 6 queries', logs.output[0])
+        self.assertIn('over the budget of 5', logs.output[0])
+        self.assertIn('possible N+1, same query run 6 times: SELECT ?', logs.output[1])
+
+
+if __name__ == '__main__':
+    unittest.main()